@@ -1,30 +1,50 @@
 # app.py
+import asyncio
 import os, json, re
-from datetime import datetime, timezone, timedelta
+import threading
+from datetime import datetime, timezone
 from flask import Flask, request, render_template, Response, jsonify
-from pymongo import MongoClient
 from dotenv import load_dotenv
-from rapidfuzz import fuzz  # fuzzy
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+from rapidfuzz import fuzz, process  # fuzzy
 
 from utils_learn_modern import extract_modern_terms
+from utils_price import parse_price as _parse_price  # robusto per 99.999 / 99.999,00 ecc.
+from utils_mongo import (
+    get_collection, get_async_collection, run_async,
+    warmup as mongo_warmup, health as mongo_health,
+)
+from utils_cache import search_cache, bump_data_version, ResultCache, MemoryCacheBackend
+from utils_dates import iso_utc
+from utils_log import log_event
+from utils_trigram import TrigramIndex, TRIGRAM_DESC_CHARS, TRIGRAM_ENABLED
+from utils_ratelimit import RateLimiter
+from utils_clicks import ClickBuffer
+from utils_cursor import encode_cursor, decode_cursor, seek_match, sort_values, reverse_spec
+from utils_search_query import (
+    SEARCH_PER_PAGE, SORT_SPECS, FUZZY_SPEC, visible_match,
+)
+from utils_search_text import (
+    build_regex_match, build_text_match, text_search_enabled,
+    is_text_index_missing, disable_text_search, SEARCH_TEXT_REGEX_FALLBACK,
+)
 
 # === Load ENV ===
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
 SITE_URL = os.getenv("SITE_URL", "http://localhost:5000")
 
 # === Flask ===
 app = Flask(__name__)
 
-DB_NAME = "database_vintage"
 COLLECTION_NAME = "annunci"
 
-# ============================================================
-# CONFIG UI / LOGICA
-# - Mercatinousato: se needs_check=True -> NASCONDI (soft-hide)
-# - Expired: NASCONDI solo se expired_reason=deadlink / noimage (prove)
-# ============================================================
-SOFT_HIDE_SOURCES = {"mercatinousato"}  # chiave normalizzata nel DB
+# warm-up pool Mongo al boot (per worker: dopo fork il client viene ricreato)
+if os.getenv("MONGO_WARMUP", "1") != "0":
+    mongo_warmup()
 
 # ============================================================
 # CONFIG NOIMAGE (solo Mercatinousato)
@@ -35,8 +55,63 @@ NOIMAGE_HITS_REQUIRED = int(os.getenv("NOIMAGE_HITS_REQUIRED", "2"))
 NOIMAGE_COOLDOWN_MINUTES = int(os.getenv("NOIMAGE_COOLDOWN_MINUTES", "60"))
 NOIMAGE_MAX_BODY = 4096
 
-# semplice rate limit in-memory (ok per singola istanza)
-_NOIMAGE_RL = {}  # key=(ip,hash) -> last_dt_utc
+# ============================================================
+# FORMA RISULTATI (solo i campi usati da results.html + chiavi cursore)
+# ============================================================
+RESULT_FIELDS = [
+    "hash", "title", "titolo", "url", "link", "image", "immagine",
+    "source", "price_display", "price_value", "price_num",
+]
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "160"))
+# decodifica lazy (RawBSONDocument) dei risultati della query principale
+SEARCH_RAW_BSON = os.getenv("SEARCH_RAW_BSON", "0") == "1"
+RAW_BSON_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def _truncated_expr(field, n):
+    """Prefisso di n caratteri lato server ("" se il campo non è una stringa)."""
+    return {"$cond": [
+        {"$eq": [{"$type": f"${field}"}, "string"]},
+        {"$substrCP": [f"${field}", 0, n]},
+        "",
+    ]}
+
+
+def _result_projection(sort_mode):
+    proj = {f: 1 for f in RESULT_FIELDS}
+    for field, _ in SORT_SPECS[sort_mode]:
+        proj[field] = 1
+    proj["snippet"] = _truncated_expr("description", SEARCH_SNIPPET_CHARS)
+    return {"$project": proj}
+
+
+def _compact_result(doc, extra=()):
+    """Stessa forma del $project finale, per i risultati del fuzzy (già in Python)."""
+    out = {k: doc[k] for k in ("_id", *RESULT_FIELDS, *extra) if k in doc}
+    desc = doc.get("description")
+    out["snippet"] = desc[:SEARCH_SNIPPET_CHARS] if isinstance(desc, str) else ""
+    return out
+
+# ============================================================
+# INDICE TRIGRAMMI (candidati fuzzy fallback)
+# ============================================================
+# stesso match del fuzzy (_fuzzy_prelim_match): l'indice contiene solo annunci che il fuzzy può mostrare
+TRIGRAM_LIVE_MATCH = visible_match()
+
+trigram_index = TrigramIndex(
+    lambda: get_collection(COLLECTION_NAME), TRIGRAM_LIVE_MATCH,
+    desc_projection=_truncated_expr("description", TRIGRAM_DESC_CHARS) if TRIGRAM_DESC_CHARS > 0 else None,
+)
+
+# cooldown per (ip, hash) condiviso tra i worker (SQLite locale, TTL + tetto)
+noimage_limiter = RateLimiter(
+    "noimage",
+    cooldown_seconds=NOIMAGE_COOLDOWN_MINUTES * 60,
+    max_entries=int(os.getenv("NOIMAGE_RL_MAX_ENTRIES", "100000")),
+)
+
+# click dei risultati -> auto_synonyms (accodati, scritti a batch in background)
+click_buffer = ClickBuffer(lambda: get_collection("auto_synonyms"))
 
 
 # ============================================================
@@ -141,10 +216,34 @@ def build_bidirectional_synonyms(syn):
 SINONIMI = build_bidirectional_synonyms(SINONIMI)
 
 
+# ============================================================
+# 🔹 Indice n-gram -> espansioni (compilato UNA volta al load)
+# ============================================================
+def build_synonym_index(bio):
+    """
+    ngram normalizzato -> [(rank, termini), ...]
+    rank = posizione della chiave in SINONIMI (x2, +1 se trigger su un valore):
+    riordinando per rank l'output è identico alla vecchia scansione lineare.
+    """
+    index = {}
+    for pos, (key, lst) in enumerate(bio.items()):
+        index.setdefault(key, []).append((2 * pos, tuple(lst)))
+
+        full = (key,) + tuple(lst)
+        for v in dict.fromkeys(lst):
+            index.setdefault(v, []).append((2 * pos + 1, full))
+    return index
+
+
+SINONIMI_INDEX = build_synonym_index(SINONIMI)
+
+
 # ============================================================
 # 🔹 Espansione sinonimi
 # ============================================================
-def _espandi_sinonimi(query: str):
+def _espandi_sinonimi(query: str, index=None):
+    index = SINONIMI_INDEX if index is None else index
+
     q_norm = _norm_text(query)
     if not q_norm:
         return []
@@ -154,24 +253,21 @@ def _espandi_sinonimi(query: str):
         return []
 
     ngrams = _generate_ngrams(tokens, max_len=4)
-    candidates = []
 
-    for key, lst in SINONIMI.items():
-        if key in ngrams:
-            candidates.extend(lst)
-        for s in lst:
-            if s in ngrams:
-                candidates.append(key)
-                candidates.extend(lst)
-                break
+    # O(n-gram della query): lookup diretto, niente scan del dizionario
+    hits = []
+    for ng in ngrams:
+        hits.extend(index.get(ng, ()))
+    hits.sort(key=lambda h: h[0])
 
     seen = set()
     result = []
-    for s in candidates:
-        s_norm = _norm_text(s)
-        if s_norm and s_norm not in seen:
-            seen.add(s_norm)
-            result.append(s_norm)
+    for _, terms in hits:
+        for s in terms:
+            s_norm = _norm_text(s)
+            if s_norm and s_norm not in seen:
+                seen.add(s_norm)
+                result.append(s_norm)
 
     return result
 
@@ -179,66 +275,30 @@ def _espandi_sinonimi(query: str):
 # ============================================================
 # 🔹 Fuzzy helper
 # ============================================================
-def fuzzy_match(query, text, threshold=65):
+FUZZY_THRESHOLD = 65
+FUZZY_MAX_TEXT = int(os.getenv("FUZZY_MAX_TEXT", "2000"))  # taglio testo: partial_ratio è O(len(q) * len(testo))
+FUZZY_TOP_K = int(os.getenv("FUZZY_TOP_K", "0"))           # 0 = tutti i match sopra soglia
+
+
+def fuzzy_match(query, text, threshold=FUZZY_THRESHOLD):
     if not query or not text:
         return False
     return fuzz.partial_ratio(query.lower(), text.lower()) >= threshold
 
 
-# ============================================================
-# 🔹 Parse sicuro prezzi (robusto per 99.999 / 99.999,00 ecc.)
-# ============================================================
-_THOUSANDS_DOT_RE = re.compile(r"^\d{1,3}(\.\d{3})+(\,\d+)?$")
-_THOUSANDS_COMMA_RE = re.compile(r"^\d{1,3}(,\d{3})+(\.\d+)?$")
-
-def _parse_price(x):
+def fuzzy_scores(query, choices, threshold=FUZZY_THRESHOLD, top_k=None):
     """
-    Converte stringhe/num in float.
-    Supporta:
-      - 99.999      -> 99999
-      - 99.999,00   -> 99999.00
-      - 120,50      -> 120.50
-      - 120.50      -> 120.50
-      - 250         -> 250.0
+    partial_ratio di query contro TUTTE le choices in una chiamata rapidfuzz.
+    choices devono essere già lowercase (preparate una volta).
+    Ritorna [(indice, score)] sopra soglia, score decrescente, i migliori top_k se richiesto.
     """
-    if x is None:
-        return None
-
-    # già numero
-    if isinstance(x, (int, float)) and not isinstance(x, bool):
-        try:
-            return float(x)
-        except Exception:
-            return None
-
-    s = str(x).strip()
-    if not s:
-        return None
+    q = (query or "").lower()
+    if not q or not choices:
+        return []
 
-    # tieni solo cifre e separatori
-    s = re.sub(r"[^\d\.,]", "", s)
-    if not s:
-        return None
-
-    # caso EU con punti migliaia (Subito): 99.999 o 99.999,00
-    if _THOUSANDS_DOT_RE.match(s):
-        s = s.replace(".", "")
-        s = s.replace(",", ".")
-    # caso US raro: 1,234.56
-    elif _THOUSANDS_COMMA_RE.match(s):
-        s = s.replace(",", "")
-    else:
-        # caso semplice: 120,50 -> 120.50
-        if "," in s and "." not in s:
-            s = s.replace(",", ".")
-        # se ci sono entrambi, assume "." migliaia e "," decimali
-        elif "," in s and "." in s:
-            s = s.replace(".", "").replace(",", ".")
-
-    try:
-        return float(s)
-    except Exception:
-        return None
+    res = process.extract(q, choices, scorer=fuzz.partial_ratio, processor=None,
+                          score_cutoff=threshold, limit=top_k or None)
+    return [(idx, score) for _, score, idx in res]
 
 
 def _format_price_it(n):
@@ -316,6 +376,49 @@ def index():
 ###############################################################################
 # REPORT NOIMAGE (client-side proof) — SOLO mercatinousato
 ###############################################################################
+# source del documento come la vede _norm_text (lower + strip), alias inclusi
+NOIMAGE_SOURCE_VALUES = sorted(NOIMAGE_SOURCES | {"mercatino"})
+
+
+def _noimage_filter(item_hash):
+    return {
+        "hash": item_hash,
+        "$expr": {"$in": [
+            {"$trim": {"input": {"$toLower": {"$ifNull": ["$source", ""]}}}},
+            NOIMAGE_SOURCE_VALUES,
+        ]},
+        # già scaduto per link morto -> niente da fare
+        "$nor": [{"status": "expired", "expired_reason": "deadlink"}],
+    }
+
+
+def _noimage_update(now_iso, ip, img, page_url):
+    """Update pipeline: $inc + timbro, poi scadenza se si raggiunge la soglia."""
+    stamp = {
+        "noimage_hits": {"$add": [{"$ifNull": ["$noimage_hits", 0]}, 1]},
+        # $literal: valori dal client, mai interpretati come "$campo"
+        "noimage_last_at": {"$literal": now_iso},
+        "noimage_last_ip": {"$literal": ip},
+    }
+    if img:
+        stamp["noimage_last_image"] = {"$literal": img[:500]}
+    if page_url:
+        stamp["noimage_last_page"] = {"$literal": page_url[:500]}
+
+    expire = {"$and": [
+        {"$gte": ["$noimage_hits", NOIMAGE_HITS_REQUIRED]},
+        {"$ne": [{"$ifNull": ["$status", None]}, "expired"]},
+    ]}
+    return [
+        {"$set": stamp},
+        {"$set": {
+            "status": {"$cond": [expire, "expired", "$status"]},
+            "expired_at": {"$cond": [expire, {"$literal": now_iso}, "$expired_at"]},
+            "expired_reason": {"$cond": [expire, "noimage", "$expired_reason"]},
+        }},
+    ]
+
+
 @app.route("/report_noimage", methods=["POST"])
 def report_noimage():
     if not NOIMAGE_ENABLED:
@@ -340,91 +443,80 @@ def report_noimage():
         return jsonify({"status": "ignored", "msg": "source not supported"}), 200
 
     ip = _client_ip()
-    key = (ip, item_hash)
     now = _now_utc()
 
-    last = _NOIMAGE_RL.get(key)
-    if last and (now - last) < timedelta(minutes=NOIMAGE_COOLDOWN_MINUTES):
+    if not noimage_limiter.allow(f"{ip}|{item_hash}"):
         return jsonify({"status": "throttled"}), 200
-    _NOIMAGE_RL[key] = now
 
-    client = MongoClient(MONGO_URI)
-    col = client[DB_NAME][COLLECTION_NAME]
+    col = get_collection(COLLECTION_NAME)
     try:
-        doc = col.find_one({"hash": item_hash}, {"_id": 1, "source": 1, "status": 1, "expired_reason": 1})
+        # Un solo round trip atomico: incremento + timbro + scadenza condizionale.
+        # Nessuna finestra tra $inc e controllo soglia (richieste concorrenti).
+        # Pre-immagine: è lo stato esatto su cui ha lavorato QUESTO update
+        doc = col.find_one_and_update(
+            _noimage_filter(item_hash),
+            _noimage_update(iso_utc(now), ip, img, page_url),
+            projection={"noimage_hits": 1, "status": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+
         if not doc:
-            return jsonify({"status": "error", "msg": "not found"}), 404
-
-        doc_src = _norm_text(doc.get("source") or "")
-        if doc_src == "mercatino":
-            doc_src = "mercatinousato"
-
-        if doc_src not in NOIMAGE_SOURCES:
-            return jsonify({"status": "ignored", "msg": "doc source not supported"}), 200
-
-        if doc.get("status") == "expired" and doc.get("expired_reason") == "deadlink":
-            return jsonify({"status": "ok", "msg": "already deadlink-expired"}), 200
-
-        update = {
-            "$inc": {"noimage_hits": 1},
-            "$set": {
-                "noimage_last_at": now.isoformat(),
-                "noimage_last_ip": ip,
-            },
-        }
-
-        sample = {}
-        if img:
-            sample["noimage_last_image"] = img[:500]
-        if page_url:
-            sample["noimage_last_page"] = page_url[:500]
-        if sample:
-            update["$set"].update(sample)
-
-        res = col.update_one({"_id": doc["_id"]}, update)
-        if res.matched_count == 0:
+            # nessun update: capire perché (percorso raro, lettura extra ok)
+            doc = col.find_one({"hash": item_hash}, {"_id": 0, "source": 1, "status": 1, "expired_reason": 1})
+            if not doc:
+                return jsonify({"status": "error", "msg": "not found"}), 404
+
+            doc_src = _norm_text(doc.get("source") or "")
+            if doc_src == "mercatino":
+                doc_src = "mercatinousato"
+
+            if doc_src not in NOIMAGE_SOURCES:
+                return jsonify({"status": "ignored", "msg": "doc source not supported"}), 200
+
+            if doc.get("status") == "expired" and doc.get("expired_reason") == "deadlink":
+                return jsonify({"status": "ok", "msg": "already deadlink-expired"}), 200
+
             return jsonify({"status": "error", "msg": "update failed"}), 500
 
-        doc2 = col.find_one({"_id": doc["_id"]}, {"noimage_hits": 1}) or {}
-        hits = int(doc2.get("noimage_hits") or 0)
-
-        expired_now = False
-        if hits >= NOIMAGE_HITS_REQUIRED:
-            col.update_one(
-                {"_id": doc["_id"], "status": {"$ne": "expired"}},
-                {"$set": {
-                    "status": "expired",
-                    "expired_at": now.isoformat(),
-                    "expired_reason": "noimage",
-                }}
-            )
-            expired_now = True
+        hits = int(doc.get("noimage_hits") or 0) + 1
+        expired_now = hits >= NOIMAGE_HITS_REQUIRED
+
+        # scaduto da QUESTA richiesta (stessa condizione di _noimage_update
+        # sulla pre-immagine) -> invalida la cache /search. Vale anche per un
+        # annuncio ripristinato a mano con hits già oltre soglia
+        if expired_now and doc.get("status") != "expired":
+            bump_data_version("noimage")
 
         return jsonify({"status": "ok", "hits": hits, "expired": expired_now}), 200
 
-    finally:
-        client.close()
+    except Exception as e:
+        print("[NOIMAGE ERROR]", e)
+        return jsonify({"status": "error", "msg": str(e)}), 500
 
 
 ###############################################################################
 # SEARCH
 ###############################################################################
-@app.route("/search")
-def search():
-    q = (request.args.get("q") or "").strip()
+def _search_plan(args):
+    """Parametri validati + pipeline / match della ricerca (condivisi da /search e /search_async)."""
+    q = (args.get("q") or "").strip()
 
     # ✅ Filtri scelti (barra minimal)
-    era = (request.args.get("era") or "").strip()
-    category = (request.args.get("category") or "").strip()
-    source = (request.args.get("source") or "").strip().lower()
+    era = (args.get("era") or "").strip()
+    category = (args.get("category") or "").strip()
+    source = (args.get("source") or "").strip().lower()
+
+    sort = (args.get("sort") or "score").strip()
+    scope = (args.get("scope") or "").strip().lower()
 
-    sort = (request.args.get("sort") or "score").strip()
-    scope = (request.args.get("scope") or "").strip().lower()
+    price_min_raw = args.get("price_min")
+    price_max_raw = args.get("price_max")
+    page = max(int(args.get("page", 1) or 1), 1)
+    per_page = SEARCH_PER_PAGE
 
-    price_min_raw = request.args.get("price_min")
-    price_max_raw = request.args.get("price_max")
-    page = max(int(request.args.get("page", 1) or 1), 1)
-    per_page = 50
+    # ✅ cursore keyset (prev/next): ha la precedenza su page
+    after_token = (args.get("after") or "").strip()
+    before_token = (args.get("before") or "").strip()
 
     # -------------------------
     # ✅ WHITELIST
@@ -463,6 +555,22 @@ def search():
     if source == "mercatino":
         source = "mercatinousato"
 
+    sort_mode = "tutti" if scope == "tutti" else sort
+
+    cursor = decode_cursor(after_token or before_token, specs={**SORT_SPECS, "fuzzy": FUZZY_SPEC})
+    if cursor and cursor["m"] not in (sort_mode, "fuzzy"):
+        cursor = None
+    # il seek fuzzy confronta tuple in Python: (numero, ObjectId) o niente
+    if cursor and cursor["m"] == "fuzzy" and not (
+            isinstance(cursor["k"][0], (int, float)) and not isinstance(cursor["k"][0], bool)
+            and isinstance(cursor["k"][1], ObjectId)):
+        cursor = None
+    backward = bool(cursor) and not after_token
+    if cursor:
+        page = cursor["p"]
+    main_cursor = cursor if cursor and cursor["m"] != "fuzzy" else None
+    fuzzy_cursor = cursor if cursor and cursor["m"] == "fuzzy" else None
+
     # -------------------------
     # ✅ Parse prezzi (Python)
     # -------------------------
@@ -477,241 +585,158 @@ def search():
     if price_max is not None:
         price_filter["$lte"] = price_max
 
-    client = MongoClient(MONGO_URI)
-    col = client[DB_NAME][COLLECTION_NAME]
-
     # -------------------------
-    # ✅ Match base
+    # ✅ Cache pagina risultati (chiave = parametri normalizzati + data version)
     # -------------------------
-    hide_dead = {
-        "is_removed": {"$ne": True},
-        "$nor": [
-            {"status": "expired", "expired_reason": "deadlink"},
-            {"status": "expired", "expired_reason": "noimage"},
-        ],
-    }
-
-    soft_hide = {
-        "$nor": [
-            {"source": {"$in": list(SOFT_HIDE_SOURCES)}, "needs_check": True},
-        ]
-    }
-
     if scope == "tutti":
-        match = {**hide_dead, **soft_hide}
+        cache_params = ("tutti", page, after_token, before_token)
     else:
-        match = {
-            **hide_dead,
-            **soft_hide,
-            "vintage_class": {"$ne": "non_vintage"},
-        }
-
-    fallback_used = False
-    fuzzy_used = False
-
-    def build_query(query_terms):
-        norm_terms = []
-        regex_parts = []
-
-        for t in query_terms:
-            nt = _norm_text(t)
-            if not nt:
-                continue
-            if len(nt) < 2 and " " not in nt:
-                continue
-
-            norm_terms.append(nt)
-            pattern = re.escape(nt).replace(r"\ ", r"\s+")
-            regex_parts.append(pattern)
+        cache_params = (_norm_text(q), era, category_norm, source, sort, price_min, price_max,
+                        page, after_token, before_token)
 
-        if not regex_parts:
-            return {}
-
-        regex = "|".join(regex_parts)
-
-        return {
-            "$or": [
-                {"title": {"$regex": regex, "$options": "i"}},
-                {"description": {"$regex": regex, "$options": "i"}},
-                {"keywords": {"$in": norm_terms}},
-            ]
-        }
+    # -------------------------
+    # ✅ Match base (utils_search_query: stesso match della verifica piani)
+    # -------------------------
+    match = visible_match(scope)
 
     # ------------ Query principale ----------------
+    # text_block: candidati da indice testo; regex_block: rifinitura (o fallback completo)
+    text_block = {}
+    regex_block = {}
     if scope != "tutti" and q:
         sinonimi = _espandi_sinonimi(q)
         q_norm = _norm_text(q)
         tokens = _tokenize(q)
         search_terms = [q_norm] + tokens + sinonimi
 
-        query_block = build_query(search_terms)
-        if query_block:
-            match.update(query_block)
+        regex_block = build_regex_match(search_terms, _norm_text)
+        if text_search_enabled():
+            text_block = build_text_match(q_norm.split() + sinonimi, _norm_text)
 
     # ------------ Filtri (solo se non "tutti") ------------
+    # base_match = insieme candidato della query (su cui si contano i facet)
+    base_match = dict(match)
+    filters = {}
     if scope != "tutti":
         if era:
-            match["era"] = era
+            filters["era"] = era
         if category_norm:
-            match["category"] = category_norm
+            filters["category"] = category_norm
         if source:
-            match["source"] = source
+            filters["source"] = source
+        if price_filter:
+            filters["price_num"] = price_filter
+        match.update(filters)
 
     # ------------ Pipeline ------------
-    pipeline = [
-        {"$match": match},
-
-        # ✅ price_value può essere: number OR string con migliaia (99.999) / decimali (120,50)
-        {"$addFields": {
-            "price_str_raw": {
-                "$convert": {
-                    "input": {"$ifNull": ["$price_value", ""]},
-                    "to": "string",
-                    "onError": "",
-                    "onNull": ""
-                }
-            }
-        }},
+    # ✅ keyset: seek sull'ultima chiave vista (niente $skip); page numerata solo senza cursore
+    spec = SORT_SPECS[sort_mode]
+    if backward:
+        spec = reverse_spec(spec)
+    sort_stage = {"$sort": dict(spec)}
+
+    if main_cursor:
+        seek_stages = [{"$match": seek_match(spec, main_cursor["k"])}]
+        page_stages = [{"$limit": per_page}]
+    else:
+        seek_stages = []
+        page_stages = [
+            {"$skip": (page - 1) * per_page},
+            {"$limit": per_page},
+        ]
 
-        # ✅ Estrai solo 0-9 . , (SEMPRE stringa, evita crash su $replaceAll)
-        {"$addFields": {
-            "price_str": {
-                "$ifNull": [
-                    {"$getField": {"field": "match", "input": {
-                        "$regexFind": {
-                            "input": "$price_str_raw",
-                            "regex": r"[0-9\.,]+"
-                        }
-                    }}},
-                    ""
-                ]
-            }
-        }},
+    # ✅ sort solo su campi persistiti (indici in utils_indexes.py): seek + sort + $limit
+    #    serviti dall'indice, niente sort in memoria
+    #    (null < numeri: in price_desc gli annunci senza prezzo finiscono in fondo)
+    tail = seek_stages + [sort_stage] + page_stages
+    # ✅ solo i campi della card (niente description intera / keywords / intermedi)
+    tail.append(_result_projection(sort_mode))
+
+    return {
+        "q": q, "era": era, "category": category, "category_norm": category_norm, "source": source,
+        "sort": sort, "scope": scope, "sort_mode": sort_mode,
+        "price_min_raw": price_min_raw, "price_max_raw": price_max_raw,
+        "price_min": price_min, "price_max": price_max,
+        "page": page, "per_page": per_page, "backward": backward,
+        "main_cursor": main_cursor, "fuzzy_cursor": fuzzy_cursor,
+        # modalità $text / solo regex, fissata da _aggregate_main (o dalla cache)
+        "regex_only": False,
+        "cache_key": search_cache.key_for(cache_params),
+        "match": match,
+        "base_match": base_match, "filters": filters,
+        "text_block": text_block, "regex_block": regex_block, "tail": tail,
+    }
 
-        # normalizzazione EU:
-        # - se contiene sia "." che "," => "." migliaia, "," decimali
-        # - se contiene solo "." e matcha pattern migliaia (xx.xxx o x.xxx.xxx) => rimuovi "."
-        # - se contiene solo "," => "," decimali => replace con "."
-        {"$addFields": {
-            "price_norm": {
-                "$let": {
-                    # ✅ cintura di sicurezza: $$s sempre stringa
-                    "vars": {"s": {"$toString": {"$ifNull": ["$price_str", ""]}}},
-                    "in": {
-                        "$switch": {
-                            "branches": [
-                                {
-                                    "case": {"$and": [
-                                        {"$ne": [{"$indexOfBytes": ["$$s", "."]}, -1]},
-                                        {"$ne": [{"$indexOfBytes": ["$$s", ","]}, -1]},
-                                    ]},
-                                    "then": {
-                                        "$replaceAll": {
-                                            "input": {
-                                                "$replaceAll": {"input": "$$s", "find": ".", "replacement": ""}
-                                            },
-                                            "find": ",",
-                                            "replacement": "."
-                                        }
-                                    }
-                                },
-                                {
-                                    "case": {
-                                        "$and": [
-                                            {"$ne": [{"$indexOfBytes": ["$$s", "."]}, -1]},
-                                            {"$eq": [{"$indexOfBytes": ["$$s", ","]}, -1]},
-                                            {"$regexMatch": {"input": "$$s", "regex": r"^\d{1,3}(\.\d{3})+$"}}
-                                        ]
-                                    },
-                                    "then": {"$replaceAll": {"input": "$$s", "find": ".", "replacement": ""}}
-                                },
-                                {
-                                    "case": {
-                                        "$and": [
-                                            {"$eq": [{"$indexOfBytes": ["$$s", "."]}, -1]},
-                                            {"$ne": [{"$indexOfBytes": ["$$s", ","]}, -1]},
-                                        ]
-                                    },
-                                    "then": {"$replaceAll": {"input": "$$s", "find": ",", "replacement": "."}}
-                                },
-                            ],
-                            "default": "$$s"
-                        }
-                    }
-                }
-            }
-        }},
 
-        {"$addFields": {
-            "price_num": {
-                "$convert": {
-                    "input": "$price_norm",
-                    "to": "double",
-                    "onError": None,
-                    "onNull": None
-                }
-            },
-            "updated_dt": {
-                "$convert": {"input": "$updated_at", "to": "date", "onError": None, "onNull": None}
-            },
-            "created_dt": {
-                "$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}
-            },
-            "base_dt": {"$ifNull": ["$updated_dt", {"$ifNull": ["$created_dt", datetime(1970, 1, 1)]}]},
-            "era_weight": {"$cond": [{"$ne": ["$era", "vintage_generico"]}, 1, 0]},
-        }},
+def _match_stages(plan, match, use_text=True):
+    text_block, regex_block = plan["text_block"], plan["regex_block"]
+    if use_text and text_block:
+        # $text deve stare nel PRIMO $match; il regex gira solo sui candidati
+        stages = [{"$match": {**match, **text_block}}]
+        if regex_block:
+            stages.append({"$match": regex_block})
+        return stages
+    return [{"$match": {**match, **regex_block}}]
 
-        {"$addFields": {
-            "age_days": {
-                "$divide": [
-                    {"$subtract": ["$$NOW", "$base_dt"]},
-                    86400000
-                ]
-            },
-            "recency_bonus": {
-                "$switch": {
-                    "branches": [
-                        {"case": {"$lte": ["$age_days", 1]},  "then": 0.7},
-                        {"case": {"$lte": ["$age_days", 3]},  "then": 0.4},
-                        {"case": {"$lte": ["$age_days", 7]},  "then": 0.2},
-                        {"case": {"$lte": ["$age_days", 14]}, "then": 0.1},
-                    ],
-                    "default": 0
-                }
-            },
-            "score_final": {"$add": [{"$ifNull": ["$vintage_score", 0]}, "$recency_bonus"]},
-        }},
-    ]
 
-    if scope != "tutti" and price_filter:
-        pipeline.append({"$match": {"price_num": price_filter}})
+def _main_pipeline(plan, use_text=True):
+    return _match_stages(plan, plan["match"], use_text) + plan["tail"]
 
-    pipeline.append({"$addFields": {"price_sort": {"$ifNull": ["$price_num", 999999999]}}})
 
-    if scope == "tutti":
-        pipeline.append({"$sort": {"created_dt": -1, "updated_dt": -1, "_id": -1}})
-    else:
-        if sort == "price_asc":
-            pipeline.append({"$sort": {"price_sort": 1, "updated_dt": -1, "_id": -1}})
-        elif sort == "price_desc":
-            pipeline.append({"$addFields": {"price_sort_desc": {"$ifNull": ["$price_num", -1]}}})
-            pipeline.append({"$sort": {"price_sort_desc": -1, "updated_dt": -1, "_id": -1}})
-        elif sort == "date":
-            pipeline.append({"$sort": {"updated_dt": -1, "_id": -1}})
-        else:
-            pipeline.append({"$sort": {
-                "score_final": -1,
-                "era_weight": -1,
-                "updated_dt": -1,
-                "_id": -1,
-            }})
-
-    pipeline += [
-        {"$skip": (page - 1) * per_page},
-        {"$limit": per_page},
-    ]
+def _pinned_regex_only(plan):
+    """
+    Modalità di retrieval della query, la stessa su tutte le pagine:
+    $text, o solo regex (superset: recupera i match dentro parola, es.
+    "commodore64") se a pagina 1 $text rende meno di una pagina.
+    True / False se già decisa (cursore: scelta di pagina 1 nel token),
+    None se va decisa ora: pagina 1 dai risultati, pagina numerata > 1
+    senza cursore con la stessa regola (_text_probe_pipeline). Mai una
+    pagina con $text e la successiva col regex: seek / $skip su insiemi
+    diversi salterebbero o ripeterebbero annunci.
+    """
+    if not (SEARCH_TEXT_REGEX_FALLBACK and plan["text_block"]):
+        return False
+    if plan["main_cursor"]:
+        return plan["main_cursor"]["r"]
+    return None
+
+
+def _text_probe_pipeline(plan):
+    """Prima pagina $text (solo _id): meno di per_page -> la query è in modalità regex."""
+    return _match_stages(plan, plan["match"], True) + [{"$limit": plan["per_page"]}, {"$project": {"_id": 1}}]
+
+
+def _text_recall_short(plan, results):
+    return len(results) < plan["per_page"]
+
 
-    results = list(col.aggregate(pipeline))
+def _aggregate_main(col, plan):
+    col = _main_collection(col)
+    regex_only = _pinned_regex_only(plan)
+    results = None
+    try:
+        if regex_only is None and plan["page"] > 1:
+            regex_only = _text_recall_short(plan, list(col.aggregate(_text_probe_pipeline(plan))))
+        if not regex_only:
+            results = list(col.aggregate(_main_pipeline(plan, True)))
+    except OperationFailure as e:
+        if not (plan["text_block"] and is_text_index_missing(e)):
+            raise
+        disable_text_search(str(e))
+    if regex_only is None and results is not None and _text_recall_short(plan, results):
+        regex_only, results = True, None
+    plan["regex_only"] = bool(regex_only)
+    if results is None:
+        results = list(col.aggregate(_main_pipeline(plan, False)))
+    return results
+
+
+def _finish_main(plan, results):
+    if SEARCH_RAW_BSON:
+        # RawBSONDocument è read-only: dict prima di aggiungere price_display
+        results[:] = [dict(d) for d in results]
+    if plan["backward"]:
+        results.reverse()
 
     # ✅ Ricostruisci SEMPRE un display coerente dal numero (risolve subito casi tipo 99.999)
     for it in results:
@@ -719,86 +744,492 @@ def search():
         if pn is None:
             pn = _parse_price(it.get("price_value"))
         it["price_display"] = _format_price_it(pn) if pn is not None else (it.get("price_display") or "")
+    return results
 
-    # =====================================================================
-    # 🔥 Fuzzy fallback
-    # =====================================================================
-    if scope != "tutti" and q and len(results) < 5:
+
+def _main_collection(col):
+    return col.with_options(codec_options=RAW_BSON_OPTIONS) if SEARCH_RAW_BSON else col
+
+
+def _needs_fuzzy(plan, results):
+    return bool(plan["fuzzy_cursor"]) or (
+        plan["scope"] != "tutti" and bool(plan["q"]) and len(results) < 5 and not plan["main_cursor"]
+    )
+
+
+FUZZY_PRELIM_LIMIT = 2000
+FUZZY_PRELIM_PROJECTION = {
+    # il fuzzy guarda al massimo FUZZY_MAX_TEXT caratteri: il resto non viaggia
+    "title": 1, "description": _truncated_expr("description", FUZZY_MAX_TEXT), "url": 1,
+    "image": 1, "price_display": 1, "price_value": 1, "price_num": 1,
+    "source": 1, "hash": 1, "vintage_score": 1,
+    "updated_at": 1, "created_at": 1, "era": 1, "category": 1,
+}
+
+
+def _fuzzy_prelim_match(plan):
+    """Match dei candidati fuzzy (indice trigrammi, o vecchio prefisso regex)."""
+    q, era, category_norm, source = plan["q"], plan["era"], plan["category_norm"], plan["source"]
+
+    # ✅ candidati dall'indice trigrammi (None = indice non pronto -> vecchio prefisso regex)
+    cand_ids = None
+    if TRIGRAM_ENABLED:
+        cand_ids = trigram_index.candidates(q, era=era, category=category_norm, source=source)
+
+    if cand_ids is not None:
+        loose_match = {"_id": {"$in": cand_ids}}
+    else:
         q_clean = q.strip()
         q_prefix = q_clean[:5] if len(q_clean) >= 5 else q_clean
         q_prefix = re.escape(q_prefix)
 
-        loose_regex = {"$or": [
+        loose_match = {"$or": [
             {"title": {"$regex": q_prefix, "$options": "i"}},
             {"description": {"$regex": q_prefix, "$options": "i"}},
         ]}
 
-        prelim_match = {
-            "vintage_class": {"$ne": "non_vintage"},
-            **hide_dead,
-            **soft_hide,
-            **loose_regex
-        }
+    prelim_match = {**visible_match(), **loose_match}
 
-        if era:
-            prelim_match["era"] = era
-        if category_norm:
-            prelim_match["category"] = category_norm
-        if source:
-            prelim_match["source"] = source
-
-        prelim = list(col.find(
-            prelim_match,
-            {"title": 1, "description": 1, "url": 1,
-             "image": 1, "price_display": 1, "price_value": 1,
-             "source": 1, "hash": 1, "vintage_score": 1,
-             "updated_at": 1, "created_at": 1, "era": 1, "category": 1}
-        ).limit(2000))
-
-        fuzzy_matches = []
-        for item in prelim:
-            pv = _parse_price(item.get("price_value"))
-            if price_min is not None and (pv is None or pv < price_min):
-                continue
-            if price_max is not None and (pv is None or pv > price_max):
-                continue
+    if era:
+        prelim_match["era"] = era
+    if category_norm:
+        prelim_match["category"] = category_norm
+    if source:
+        prelim_match["source"] = source
+    return prelim_match
 
-            text = (item.get("title", "") + " " + item.get("description", ""))
-            if fuzzy_match(q, text):
-                # aggiorna display anche qui
-                item["price_display"] = _format_price_it(pv) if pv is not None else (item.get("price_display") or "")
-                fuzzy_matches.append(item)
 
-        if len(fuzzy_matches) > len(results):
-            fuzzy_used = True
-            fuzzy_matches.sort(
-                key=lambda it: float(it.get("vintage_score") or 0)
-                               + _recency_bonus_from_dt(it.get("updated_at") or it.get("created_at")),
-                reverse=True
-            )
+def _apply_fuzzy(plan, prelim, results):
+    """Scoring fuzzy dei candidati. Ritorna (risultati, fuzzy_used)."""
+    q, price_min, price_max = plan["q"], plan["price_min"], plan["price_max"]
+    fuzzy_cursor, backward = plan["fuzzy_cursor"], plan["backward"]
+    page, per_page = plan["page"], plan["per_page"]
 
-            start = (page - 1) * per_page
-            end = page * per_page
-            results = fuzzy_matches[start:end]
+    candidates = []
+    for item in prelim:
+        pv = item.get("price_num")
+        if pv is None:
+            pv = _parse_price(item.get("price_value"))
+        if price_min is not None and (pv is None or pv < price_min):
+            continue
+        if price_max is not None and (pv is None or pv > price_max):
+            continue
+        candidates.append((item, pv))
+
+    # ✅ scoring in batch: testi lowercase preparati una volta, una sola chiamata rapidfuzz
+    choices = [
+        ((item.get("title") or "") + " " + (item.get("description") or ""))[:FUZZY_MAX_TEXT].lower()
+        for item, _ in candidates
+    ]
 
-    client.close()
+    fuzzy_matches = []
+    for idx, _score in fuzzy_scores(q, choices, top_k=FUZZY_TOP_K or None):
+        item, pv = candidates[idx]
+        # aggiorna display anche qui
+        item["price_display"] = _format_price_it(pv) if pv is not None else (item.get("price_display") or "")
+        fuzzy_matches.append(item)
+
+    if not (fuzzy_cursor or len(fuzzy_matches) > len(results)):
+        return results, False
+
+    for it in fuzzy_matches:
+        it["fuzzy_rank"] = float(it.get("vintage_score") or 0) \
+            + _recency_bonus_from_dt(it.get("updated_at") or it.get("created_at"))
+    fuzzy_matches.sort(key=lambda it: (it["fuzzy_rank"], it["_id"]), reverse=True)
+
+    if fuzzy_cursor:
+        bound = tuple(fuzzy_cursor["k"])
+        if backward:
+            page_items = [it for it in fuzzy_matches if (it["fuzzy_rank"], it["_id"]) > bound][-per_page:]
+        else:
+            page_items = [it for it in fuzzy_matches if (it["fuzzy_rank"], it["_id"]) < bound][:per_page]
+    else:
+        start = (page - 1) * per_page
+        end = page * per_page
+        page_items = fuzzy_matches[start:end]
+    return [_compact_result(it, ("fuzzy_rank",)) for it in page_items], True
+
+
+def _render_search(plan, results, fallback_used, fuzzy_used, facets=None):
+    # cursori prev/next dalla chiave di sort del primo/ultimo annuncio
+    page, per_page = plan["page"], plan["per_page"]
+    mode = "fuzzy" if fuzzy_used else plan["sort_mode"]
+    spec = FUZZY_SPEC if fuzzy_used else SORT_SPECS[plan["sort_mode"]]
+    regex_only = plan["regex_only"] and not fuzzy_used
+    next_cursor = prev_cursor = ""
+    if len(results) == per_page:
+        next_cursor = encode_cursor(mode, sort_values(results[-1], spec), page + 1, regex_only)
+    if page > 2 and results:
+        prev_cursor = encode_cursor(mode, sort_values(results[0], spec), page - 1, regex_only)
 
     return render_template(
         "results.html",
-        query=q,
+        query=plan["q"],
         risultati=results,
-        era=era,
-        category=category_norm or category,
-        source=source,
-        price_min=price_min_raw,
-        price_max=price_max_raw,
-        sort=sort,
+        era=plan["era"],
+        category=plan["category_norm"] or plan["category"],
+        source=plan["source"],
+        price_min=plan["price_min_raw"],
+        price_max=plan["price_max_raw"],
+        sort=plan["sort"],
         page=page,
-        scope=scope,
+        scope=plan["scope"],
         fallback_used=fallback_used,
         fuzzy_used=fuzzy_used,
-        original_query=q,
+        original_query=plan["q"],
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        facets=facets,
+    )
+
+
+def _cache_and_render(plan, results, fuzzy_used, facets=None):
+    fallback_used = False
+    search_cache.set(plan["cache_key"], {
+        "results": results,
+        "fallback_used": fallback_used,
+        "fuzzy_used": fuzzy_used,
+        "regex_only": plan["regex_only"],
+    })
+    return _render_search(plan, results, fallback_used, fuzzy_used, facets)
+
+
+###############################################################################
+# FACET (conteggi filtri + totale approssimato, un solo $facet)
+###############################################################################
+SEARCH_FACETS_ENABLED = os.getenv("SEARCH_FACETS_ENABLED", "1") != "0"
+# tetto documenti contati: oltre, i conteggi sono per difetto ("capped")
+SEARCH_FACET_MAX_DOCS = int(os.getenv("SEARCH_FACET_MAX_DOCS", "20000"))
+SEARCH_FACET_MAX_TIME_MS = int(os.getenv("SEARCH_FACET_MAX_TIME_MS", "1500"))
+SEARCH_FACET_TTL = int(os.getenv("SEARCH_FACET_TTL", "900"))
+PRICE_FACET_BOUNDARIES = [0, 20, 50, 100, 250, 500, 1000, 10 ** 9]
+
+# cache separata dalle pagine: niente data version (ogni ingest la bumpa),
+# i conteggi sono approssimati e scadono solo per TTL
+facet_cache = ResultCache(
+    backend=MemoryCacheBackend(int(os.getenv("SEARCH_FACET_MAX_ENTRIES", "1000"))),
+    ttl=SEARCH_FACET_TTL,
+    enabled=SEARCH_FACETS_ENABLED,
+    version_fn=lambda: 0,
+)
+
+
+def _facet_wanted(plan):
+    return SEARCH_FACETS_ENABLED and plan["scope"] != "tutti"
+
+
+def _facet_cache_key(plan):
+    # conteggi indipendenti da pagina / cursore / ordinamento
+    return facet_cache.key_for((_norm_text(plan["q"]), tuple(sorted(
+        (k, repr(v)) for k, v in plan["filters"].items()
+    ))))
+
+
+def _facet_pipeline(plan, use_text=True):
+    """
+    Candidati della query (senza filtri) -> $limit (tetto) -> $facet.
+    Ogni facet applica gli ALTRI filtri attivi: il conteggio di un'opzione
+    è quanti risultati si avrebbero selezionandola.
+    """
+    filters = plan["filters"]
+
+    def others(name):
+        rest = {k: v for k, v in filters.items() if k != name}
+        return [{"$match": rest}] if rest else []
+
+    facet = {
+        "era": others("era") + [{"$group": {"_id": "$era", "count": {"$sum": 1}}}],
+        "category": others("category") + [{"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+        "source": others("source") + [{"$group": {"_id": "$source", "count": {"$sum": 1}}}],
+        "price": others("price_num") + [{"$bucket": {
+            "groupBy": {"$ifNull": ["$price_num", -1]},  # senza prezzo -> "n/d"
+            "boundaries": PRICE_FACET_BOUNDARIES,
+            "default": "n/d",
+            "output": {"count": {"$sum": 1}},
+        }}],
+        "total": ([{"$match": filters}] if filters else []) + [{"$count": "n"}],
+        "scanned": [{"$count": "n"}],
+    }
+    return _match_stages(plan, plan["base_match"], use_text) + [
+        {"$limit": SEARCH_FACET_MAX_DOCS},
+        {"$facet": facet},
+    ]
+
+
+def _parse_facets(raw):
+    raw = raw[0] if raw else {}
+
+    def counts(name):
+        return {d["_id"]: d["count"] for d in raw.get(name, ()) if d.get("_id")}
+
+    bounds = PRICE_FACET_BOUNDARIES
+    price = []
+    for d in raw.get("price", ()):
+        if d["_id"] == "n/d":
+            continue
+        i = bounds.index(d["_id"])
+        last = i + 2 >= len(bounds)
+        # $bucket è [min, max): il link filtra con $lte, quindi max al centesimo prima
+        price.append({"min": bounds[i], "max": None if last else bounds[i + 1],
+                      "max_incl": None if last else round(bounds[i + 1] - 0.01, 2),
+                      "count": d["count"]})
+
+    total = (raw.get("total") or [{}])[0].get("n", 0)
+    scanned = (raw.get("scanned") or [{}])[0].get("n", 0)
+    return {
+        "era": counts("era"),
+        "category": counts("category"),
+        "source": counts("source"),
+        "price": price,
+        "total": total,
+        "capped": scanned >= SEARCH_FACET_MAX_DOCS,
+    }
+
+
+SEARCH_FACET_RETRY_SECONDS = 60
+
+
+def _facets_failed(plan, e):
+    # i conteggi non devono mai rompere la pagina risultati; query troppo
+    # pesante -> niente nuovo tentativo per un minuto (marker False in cache)
+    log_event("search", f"⚠️ Facet non calcolati: {e}", "WARNING")
+    facet_cache.set(_facet_cache_key(plan), False, ttl=SEARCH_FACET_RETRY_SECONDS)
+    return None
+
+
+def _store_facets(plan, raw):
+    facets = _parse_facets(raw)
+    facet_cache.set(_facet_cache_key(plan), facets)
+    return facets
+
+
+def _facets(plan):
+    """Conteggi per la pagina risultati (cache facet -> un $facet su Mongo). None se non disponibili."""
+    if not _facet_wanted(plan):
+        return None
+    cached = facet_cache.get(_facet_cache_key(plan))
+    if cached is not None:
+        return cached or None
+
+    col = get_collection(COLLECTION_NAME)
+    try:
+        try:
+            raw = list(col.aggregate(_facet_pipeline(plan, True), maxTimeMS=SEARCH_FACET_MAX_TIME_MS))
+        except OperationFailure as e:
+            if not (plan["text_block"] and is_text_index_missing(e)):
+                raise
+            raw = list(col.aggregate(_facet_pipeline(plan, False), maxTimeMS=SEARCH_FACET_MAX_TIME_MS))
+    except Exception as e:
+        return _facets_failed(plan, e)
+    return _store_facets(plan, raw)
+
+
+@app.route("/search")
+def search():
+    plan = _search_plan(request.args)
+
+    cached = search_cache.get(plan["cache_key"])
+    if cached is not None:
+        plan["regex_only"] = cached.get("regex_only", False)
+        fuzzy_used = cached["fuzzy_used"]
+        return _render_search(plan, cached["results"], cached["fallback_used"], fuzzy_used,
+                              None if fuzzy_used else _facets(plan))
+
+    col = get_collection(COLLECTION_NAME)
+
+    results = []
+    if not plan["fuzzy_cursor"]:
+        results = _aggregate_main(col, plan)
+        _finish_main(plan, results)
+
+    # =====================================================================
+    # 🔥 Fuzzy fallback
+    # =====================================================================
+    fuzzy_used = False
+    if _needs_fuzzy(plan, results):
+        prelim = list(col.find(_fuzzy_prelim_match(plan), FUZZY_PRELIM_PROJECTION).limit(FUZZY_PRELIM_LIMIT))
+        results, fuzzy_used = _apply_fuzzy(plan, prelim, results)
+
+    # i facet contano i match esatti: non descrivono i risultati fuzzy
+    return _cache_and_render(plan, results, fuzzy_used, None if fuzzy_used else _facets(plan))
+
+
+###############################################################################
+# SEARCH ASYNC (query principale + candidati fuzzy in parallelo)
+###############################################################################
+# query "a basso recall" -> i candidati fuzzy partono subito, insieme alla
+# query principale, invece di aspettarne l'esito (2 round trip in serie)
+FUZZY_SPECULATIVE = os.getenv("FUZZY_SPECULATIVE", "1") != "0"
+FUZZY_SPEC_SHORT_CHARS = int(os.getenv("FUZZY_SPEC_SHORT_CHARS", "4"))  # query corte
+FUZZY_SPEC_RARE_DF = int(os.getenv("FUZZY_SPEC_RARE_DF", "20"))         # token in <= N titoli
+SEARCH_ASYNC_TIMEOUT = float(os.getenv("SEARCH_ASYNC_TIMEOUT", "30"))
+
+fuzzy_spec_stats = {"started": 0, "used": 0, "cancelled": 0, "missed": 0}
+_fuzzy_spec_lock = threading.Lock()  # richieste su più thread (server threaded)
+
+
+def _count_spec(name):
+    with _fuzzy_spec_lock:
+        fuzzy_spec_stats[name] += 1
+
+
+def _looks_low_recall(plan):
+    """Query corta o con token rari (stima dall'indice trigrammi)."""
+    q_norm = _norm_text(plan["q"])
+    if len(q_norm) <= FUZZY_SPEC_SHORT_CHARS:
+        return True
+    if TRIGRAM_ENABLED:
+        for tok in q_norm.split():
+            df = trigram_index.token_df(tok)
+            if df is not None and df <= FUZZY_SPEC_RARE_DF:
+                return True
+    return False
+
+
+async def _aggregate_main_async(col, plan):
+    col = _main_collection(col)
+    regex_only = _pinned_regex_only(plan)
+    results = None
+    try:
+        if regex_only is None and plan["page"] > 1:
+            probe = await (await col.aggregate(_text_probe_pipeline(plan))).to_list(None)
+            regex_only = _text_recall_short(plan, probe)
+        if not regex_only:
+            results = await (await col.aggregate(_main_pipeline(plan, True))).to_list(None)
+    except OperationFailure as e:
+        if not (plan["text_block"] and is_text_index_missing(e)):
+            raise
+        disable_text_search(str(e))
+    if regex_only is None and results is not None and _text_recall_short(plan, results):
+        regex_only, results = True, None
+    plan["regex_only"] = bool(regex_only)
+    if results is None:
+        results = await (await col.aggregate(_main_pipeline(plan, False))).to_list(None)
+    return results
+
+
+async def _find_prelim_async(prelim_match):
+    col = get_async_collection(COLLECTION_NAME)
+    return await col.find(prelim_match, FUZZY_PRELIM_PROJECTION).limit(FUZZY_PRELIM_LIMIT).to_list(None)
+
+
+async def _facet_raw_async(plan):
+    """Output grezzo del $facet, None se fallisce (la pagina esce senza conteggi)."""
+    col = get_async_collection(COLLECTION_NAME)
+    try:
+        try:
+            cursor = await col.aggregate(_facet_pipeline(plan, True), maxTimeMS=SEARCH_FACET_MAX_TIME_MS)
+        except OperationFailure as e:
+            if not (plan["text_block"] and is_text_index_missing(e)):
+                raise
+            cursor = await col.aggregate(_facet_pipeline(plan, False), maxTimeMS=SEARCH_FACET_MAX_TIME_MS)
+        return await cursor.to_list(None)
+    except Exception as e:
+        return _facets_failed(plan, e)
+
+
+async def _search_fetch_async(plan, spec_match=None, with_facets=False):
+    """
+    (risultati principali grezzi, candidati fuzzy | None, facet grezzi | None).
+    spec_match: match fuzzy da lanciare subito, in parallelo; il task
+    viene cancellato se la query principale basta da sola.
+    with_facets: $facet in parallelo alla query principale.
+    """
+    col = get_async_collection(COLLECTION_NAME)
+
+    spec_task = facet_task = None
+    if spec_match is not None:
+        spec_task = asyncio.create_task(_find_prelim_async(spec_match))
+    if with_facets:
+        facet_task = asyncio.create_task(_facet_raw_async(plan))
+
+    results = []
+    try:
+        if not plan["fuzzy_cursor"]:
+            results = await _aggregate_main_async(col, plan)
+    except BaseException:
+        for task in (spec_task, facet_task):
+            if task:
+                task.cancel()
+        raise
+
+    prelim = None
+    if spec_task is not None:
+        if plan["fuzzy_cursor"] or len(results) < 5:
+            prelim = await spec_task
+        else:
+            spec_task.cancel()
+
+    facets_raw = await facet_task if facet_task is not None else None
+    return results, prelim, facets_raw
+
+
+@app.route("/search_async")
+def search_async():
+    plan = _search_plan(request.args)
+
+    # None = da calcolare, False = fallito di recente (niente conteggi)
+    facets = facet_cache.get(_facet_cache_key(plan)) if _facet_wanted(plan) else False
+
+    cached = search_cache.get(plan["cache_key"])
+    if cached is not None:
+        plan["regex_only"] = cached.get("regex_only", False)
+        if cached["fuzzy_used"]:
+            facets = False
+        elif facets is None:
+            raw = run_async(_facet_raw_async(plan), SEARCH_ASYNC_TIMEOUT)
+            facets = _store_facets(plan, raw) if raw is not None else None
+        return _render_search(plan, cached["results"], cached["fallback_used"], cached["fuzzy_used"],
+                              facets or None)
+
+    # match fuzzy preparato qui (indice trigrammi = CPU): il loop async fa solo I/O
+    spec_match = None
+    if plan["fuzzy_cursor"] or (
+        FUZZY_SPECULATIVE and _needs_fuzzy(plan, []) and _looks_low_recall(plan)
+    ):
+        spec_match = _fuzzy_prelim_match(plan)
+        if not plan["fuzzy_cursor"]:
+            _count_spec("started")
+
+    # pagine fuzzy successive: niente facet (vedi sotto)
+    with_facets = facets is None and not plan["fuzzy_cursor"]
+    results, prelim, facets_raw = run_async(
+        _search_fetch_async(plan, spec_match, with_facets), SEARCH_ASYNC_TIMEOUT
     )
+    _finish_main(plan, results)
+    if facets_raw is not None:
+        facets = _store_facets(plan, facets_raw)
+
+    fuzzy_used = False
+    if _needs_fuzzy(plan, results):
+        if prelim is None:
+            # speculazione non partita: secondo round trip come /search
+            _count_spec("missed")
+            prelim = run_async(_find_prelim_async(_fuzzy_prelim_match(plan)), SEARCH_ASYNC_TIMEOUT)
+        elif not plan["fuzzy_cursor"]:
+            _count_spec("used")
+        results, fuzzy_used = _apply_fuzzy(plan, prelim, results)
+    elif spec_match is not None:
+        _count_spec("cancelled")
+
+    # i facet contano i match esatti: non descrivono i risultati fuzzy
+    return _cache_and_render(plan, results, fuzzy_used, None if fuzzy_used else facets or None)
+
+
+###############################################################################
+# Health (probe Mongo)
+###############################################################################
+@app.route("/health")
+def health():
+    h = mongo_health()
+    h["search_cache"] = search_cache.stats()
+    h["facet_cache"] = facet_cache.stats()
+    h["trigram_index"] = trigram_index.stats()
+    h["noimage_rate_limit"] = noimage_limiter.stats()
+    h["click_buffer"] = click_buffer.stats()
+    with _fuzzy_spec_lock:
+        h["fuzzy_speculation"] = dict(fuzzy_spec_stats)
+    return jsonify(h), (200 if h.get("ok") else 503)
 
 
 ###############################################################################
@@ -844,18 +1275,17 @@ def remove_item():
         return jsonify({"status": "error", "msg": "missing hash"}), 400
 
     try:
-        client = MongoClient(MONGO_URI)
-        col = client[DB_NAME][COLLECTION_NAME]
+        col = get_collection(COLLECTION_NAME)
 
         res = col.delete_one({"hash": item_hash})
+        if res.deleted_count > 0:
+            bump_data_version("remove_item")
 
         try:
-            extract_modern_terms(raw_title)
+            extract_modern_terms(raw_title, item_hash=item_hash)
         except Exception as e:
             print("[WARN] modern auto-learn failed:", e)
 
-        client.close()
-
         if res.deleted_count > 0:
             return jsonify({"status": "ok"})
         else:
@@ -879,17 +1309,14 @@ def track_click():
         if not raw_query or not raw_title:
             return jsonify({"status": "error", "msg": "missing data"}), 400
 
-        client = MongoClient(MONGO_URI)
-        col = client[DB_NAME]["auto_synonyms"]
-
-        col.insert_one({
+        queued = click_buffer.submit({
             "query": raw_query,
             "title": raw_title,
             "created_at": datetime.now(timezone.utc)
         })
 
-        client.close()
-        return jsonify({"status": "ok"})
+        # coda piena: il click si perde, la pagina non deve accorgersene
+        return jsonify({"status": "ok" if queued else "dropped"})
 
     except Exception as e:
         print("[TRACK_CLICK ERROR]", e)
@@ -0,0 +1,114 @@
+# backfill_dates.py
+# ============================================================
+# Backfill updated_at / created_at sugli annunci già in DB
+#   • I sort di /search (SORT_SPECS) usano i campi grezzi: una BSON
+#     Date o una stringa in un altro formato finirebbe fuori ordine.
+#     Qui diventano ISO UTC a larghezza fissa (utils_dates.iso_utc)
+#   • Valori non interpretabili: spostati in <campo>_legacy e tolti
+#     dal campo (come il vecchio $convert con onError: None)
+#   • Batch ordinati per _id, riprendibile: watermark in "job_state"
+#
+# Uso:
+#   python backfill_dates.py              # riprende dal watermark
+#   python backfill_dates.py --restart    # riparte da zero
+#   python backfill_dates.py --batch 2000
+# ============================================================
+
+import argparse
+
+from pymongo import ASCENDING, UpdateOne
+
+from utils_dates import iso_utc
+from utils_log import log_event
+from utils_mongo import get_collection
+
+COLLECTION_NAME = "annunci"
+JOB_STATE_COLLECTION = "job_state"
+JOB_ID = "backfill_dates"
+
+DATE_FIELDS = ("updated_at", "created_at")
+
+
+def date_update(doc):
+    """Update Mongo che normalizza le date di doc, None se sono già a posto."""
+    set_fields, unset_fields = {}, {}
+    for field in DATE_FIELDS:
+        if field not in doc or doc[field] is None:
+            continue
+        value = doc[field]
+        norm = iso_utc(value)
+        if norm is None:
+            set_fields[f"{field}_legacy"] = value
+            unset_fields[field] = ""
+        elif norm != value:
+            set_fields[field] = norm
+
+    update = {}
+    if set_fields:
+        update["$set"] = set_fields
+    if unset_fields:
+        update["$unset"] = unset_fields
+    return update or None
+
+
+def backfill_dates(batch_size=1000, restart=False):
+    """
+    Porta updated_at / created_at al formato di utils_dates.
+    Ritorna il numero di documenti aggiornati.
+    """
+    col = get_collection(COLLECTION_NAME)
+    state_col = get_collection(JOB_STATE_COLLECTION)
+
+    if restart:
+        state_col.delete_one({"_id": JOB_ID})
+
+    state = state_col.find_one({"_id": JOB_ID}) or {}
+    last_id = state.get("last_id")
+    updated = int(state.get("updated") or 0)
+
+    if last_id is not None:
+        log_event("backfill", f"▶️ Ripresa backfill date da _id > {last_id}")
+    else:
+        log_event("backfill", "🚀 Avvio backfill date")
+
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(
+            col.find(q, {field: 1 for field in DATE_FIELDS})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            update = date_update(doc)
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"]}, update))
+
+        if ops:
+            res = col.bulk_write(ops, ordered=False)
+            updated += res.modified_count
+
+        last_id = batch[-1]["_id"]
+        state_col.update_one(
+            {"_id": JOB_ID},
+            {"$set": {"last_id": last_id, "updated": updated}},
+            upsert=True
+        )
+        log_event("backfill", f"📦 batch fino a _id {last_id} — aggiornati finora: {updated}")
+
+    state_col.update_one({"_id": JOB_ID}, {"$set": {"done": True}}, upsert=True)
+    log_event("backfill", f"✅ Backfill date concluso — aggiornati: {updated}")
+
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill updated_at / created_at su annunci")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+
+    backfill_dates(batch_size=args.batch, restart=args.restart)
@@ -0,0 +1,101 @@
+# backfill_price.py
+# ============================================================
+# Backfill price_num / price_sort sugli annunci già in DB
+#   • Batch ordinati per _id (range indicizzato, niente scan ripetuti)
+#   • Riprendibile: watermark _id salvato in "job_state"
+#   • Crea gli indici prezzo usati da /search
+#
+# Uso:
+#   python backfill_price.py              # riprende dal watermark
+#   python backfill_price.py --restart    # riparte da zero
+#   python backfill_price.py --batch 2000
+# ============================================================
+
+import argparse
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from utils_log import log_event
+from utils_mongo import get_collection
+from utils_price import price_fields
+
+COLLECTION_NAME = "annunci"
+JOB_STATE_COLLECTION = "job_state"
+JOB_ID = "backfill_price_num"
+
+PRICE_INDEXES = [
+    ([("price_sort", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], "price_sort_updated"),
+    ([("price_num", DESCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], "price_num_updated"),
+]
+
+
+def ensure_price_indexes(col=None):
+    col = col if col is not None else get_collection(COLLECTION_NAME)
+    for keys, name in PRICE_INDEXES:
+        col.create_index(keys, name=name)
+
+
+def backfill_prices(batch_size=1000, restart=False):
+    """
+    Calcola price_num / price_sort da price_value per ogni annuncio.
+    Ritorna il numero di documenti aggiornati.
+    """
+    col = get_collection(COLLECTION_NAME)
+    state_col = get_collection(JOB_STATE_COLLECTION)
+
+    if restart:
+        state_col.delete_one({"_id": JOB_ID})
+
+    state = state_col.find_one({"_id": JOB_ID}) or {}
+    last_id = state.get("last_id")
+    updated = int(state.get("updated") or 0)
+
+    if last_id is not None:
+        log_event("backfill", f"▶️ Ripresa backfill prezzi da _id > {last_id}")
+    else:
+        log_event("backfill", "🚀 Avvio backfill prezzi")
+
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(
+            col.find(q, {"price_value": 1, "price_num": 1, "price_sort": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            fields = price_fields(doc.get("price_value"))
+            if "price_num" in doc and doc["price_num"] == fields["price_num"] \
+                    and doc.get("price_sort") == fields["price_sort"]:
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+
+        if ops:
+            res = col.bulk_write(ops, ordered=False)
+            updated += res.modified_count
+
+        last_id = batch[-1]["_id"]
+        state_col.update_one(
+            {"_id": JOB_ID},
+            {"$set": {"last_id": last_id, "updated": updated}},
+            upsert=True
+        )
+        log_event("backfill", f"📦 batch fino a _id {last_id} — aggiornati finora: {updated}")
+
+    ensure_price_indexes(col)
+    state_col.update_one({"_id": JOB_ID}, {"$set": {"done": True}}, upsert=True)
+    log_event("backfill", f"✅ Backfill prezzi concluso — aggiornati: {updated}")
+
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill price_num / price_sort su annunci")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+
+    backfill_prices(batch_size=args.batch, restart=args.restart)
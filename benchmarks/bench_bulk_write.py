@@ -0,0 +1,89 @@
+# benchmarks/bench_bulk_write.py
+# ============================================================
+# Throughput salvataggio annunci:
+#   update_one per annuncio (vecchio salva_annunci_mongo)
+#   vs bulk_write(ordered=False) a chunk (utils_db)
+#
+# Uso (dalla root del repo, serve un mongod di test, NON produzione):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_bulk_write
+#   python -m benchmarks.bench_bulk_write --items 5000 --bulk 100,500,1000
+# ============================================================
+
+import argparse
+import os
+import time
+from datetime import datetime, UTC
+
+from pymongo import MongoClient
+
+from utils_db import _prepara_upsert, _scrivi_chunk
+
+BENCH_MONGO_URI = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+BENCH_DB = "retrofuture_bench"
+
+
+def _items(n, tag):
+    return [{
+        "hash": f"{tag}-{i}",
+        "source": "bench",
+        "title": f"Lampada anni 70 n.{i}",
+        "description": "lampada vintage originale funzionante",
+        "price_value": f"{(i % 500) + 0.5:.2f}",
+        "category": "arredamento",
+        "updated_at": datetime.now(UTC).isoformat(),
+    } for i in range(n)]
+
+
+def _loop(col, items):
+    now_iso = datetime.now(UTC).isoformat()
+    for doc in items:
+        op = _prepara_upsert(doc, now_iso)
+        col.update_one(op._filter, op._doc, upsert=True)
+
+
+def _bulk(col, items, bulk_size):
+    now_iso = datetime.now(UTC).isoformat()
+    stats = {"inserted": 0, "updated": 0, "skipped": 0, "errors": 0}
+    for i in range(0, len(items), bulk_size):
+        chunk = items[i:i + bulk_size]
+        _scrivi_chunk(col, [_prepara_upsert(d, now_iso) for d in chunk], chunk, "bench", stats)
+    return stats
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def run(n, bulk_sizes):
+    client = MongoClient(BENCH_MONGO_URI)
+    col = client[BENCH_DB]["annunci"]
+    col.drop()
+    col.create_index("hash", unique=True)
+
+    print(f"items={n} uri={BENCH_MONGO_URI}")
+
+    t = _timed(lambda: _loop(col, _items(n, "loop")))
+    print(f"  update_one loop (insert) : {n / t:10.0f} doc/s  ({t:.2f}s)")
+    t = _timed(lambda: _loop(col, _items(n, "loop")))
+    print(f"  update_one loop (update) : {n / t:10.0f} doc/s  ({t:.2f}s)")
+
+    for bs in bulk_sizes:
+        tag = f"bulk{bs}"
+        t = _timed(lambda: _bulk(col, _items(n, tag), bs))
+        print(f"  bulk {bs:>5} (insert)      : {n / t:10.0f} doc/s  ({t:.2f}s)")
+        t = _timed(lambda: _bulk(col, _items(n, tag), bs))
+        print(f"  bulk {bs:>5} (update)      : {n / t:10.0f} doc/s  ({t:.2f}s)")
+
+    client.drop_database(BENCH_DB)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk upsert annunci")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--bulk", default="100,500,1000")
+    args = parser.parse_args()
+
+    run(args.items, [int(x) for x in args.bulk.split(",")])
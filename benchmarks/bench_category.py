@@ -0,0 +1,115 @@
+# benchmarks/bench_category.py
+# ============================================================
+# Benchmark normalize_category:
+#   scansione alias + any() sul blob (vecchio) vs automa alias
+#   + memo sulla categoria grezza + tag del testo condivisi con
+#   il classifier. Verifica risultati identici.
+#
+# Uso (dalla root del repo):
+#   python -m benchmarks.bench_category
+#   python -m benchmarks.bench_category --items 20000 --distinct 300
+# ============================================================
+
+import argparse
+import random
+import re
+import time
+
+import utils_normalize as un
+
+TEXT_WORDS = [
+    "lampada", "anni", "70", "radio", "valvole", "sedia", "thonet", "giradischi",
+    "orologio", "seiko", "originale", "moka", "bialetti", "fumetti", "topolino",
+    "vespa", "poster", "vinile", "lego", "giacca", "penna", "tazze", "design",
+    "funzionante", "spedizione", "ottimo", "stato", "legno", "ottone", "action",
+    "figure", "hi", "fi", "colonna", "sonora", "fiat", "500",
+]
+
+
+# ------------------------------------------------------------
+# Implementazione storica
+# ------------------------------------------------------------
+
+def _normalize_category_linear(raw_category, text_hint=""):
+    c = (raw_category or "").strip().lower()
+    t = (text_hint or "").strip().lower()
+
+    c = c.replace("-", " ").replace("_", " ")
+    c = re.sub(r"[\/\|\(\)\[\]\.\,\:\;]+", " ", c)
+    c = re.sub(r"\s+", " ", c).strip()
+
+    if c in un.ALLOWED_CATEGORIES:
+        return c
+    if c in un.CATEGORY_ALIASES:
+        return un.CATEGORY_ALIASES[c]
+    for k, v in un.CATEGORY_ALIASES.items():
+        if k and k in c:
+            return v
+
+    blob = f"{c} {t}".strip()
+    for cat, keys in un.CATEGORY_KEYWORDS:
+        if any(k in blob for k in keys):
+            return cat
+    return "vario"
+
+
+# ------------------------------------------------------------
+# Corpus sintetico: poche categorie distinte, testi diversi
+# ------------------------------------------------------------
+
+def _categories(n, rnd):
+    aliases = list(un.CATEGORY_ALIASES)
+    junk = ["Altro", "Usato", "Varie", "Hobby", "Oggetti", "Tempo libero", "", "Casa > Altro",
+            "Collezionismo/Altro", "Elettronica - TV e Audio", "Musica & Film", "action"]
+    out = []
+    for _ in range(n):
+        r = rnd.random()
+        if r < 0.4:
+            out.append(rnd.choice(aliases).title())
+        elif r < 0.7:
+            out.append(f"{rnd.choice(junk)} {rnd.choice(aliases)}")
+        else:
+            out.append(rnd.choice(junk) + " " + "".join(rnd.choice("abcdefg") for _ in range(4)))
+    return out
+
+
+def run(n, distinct):
+    rnd = random.Random(5)
+    cats = _categories(distinct, rnd)
+    items = []
+    for _ in range(n):
+        text = " ".join(rnd.choice(TEXT_WORDS) for _ in range(rnd.randint(10, 150)))
+        items.append((rnd.choice(cats), text))
+
+    # tag del testo: in normalizza_senza_dedup arrivano gratis dal classifier
+    hits = [un._matcher.scan(text.lower()) for _, text in items]
+
+    for (cat, text), h in zip(items, hits):
+        expected = _normalize_category_linear(cat, text)
+        assert un.normalize_category(cat, text) == expected, (cat, text)
+        assert un.normalize_category(cat, text, text_hits=h) == expected, (cat, text)
+
+    t0 = time.perf_counter()
+    for cat, text in items:
+        _normalize_category_linear(cat, text)
+    t_lin = (time.perf_counter() - t0) / n * 1e6
+
+    un._resolve_raw_category.cache_clear()
+    t0 = time.perf_counter()
+    for (cat, text), h in zip(items, hits):
+        un.normalize_category(cat, text, text_hits=h)
+    t_idx = (time.perf_counter() - t0) / n * 1e6
+
+    info = un._resolve_raw_category.cache_info()
+    print(f"items={n} categorie distinte={distinct} cache hit={info.hits / max(1, info.hits + info.misses):.1%}")
+    print(f"  linear              : {t_lin:8.1f} µs/annuncio")
+    print(f"  indice + memo       : {t_idx:8.1f} µs/annuncio  ({t_lin / t_idx:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark normalize_category")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--distinct", type=int, default=200)
+    args = parser.parse_args()
+
+    run(args.items, args.distinct)
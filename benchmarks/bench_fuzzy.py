@@ -0,0 +1,81 @@
+# benchmarks/bench_fuzzy.py
+# ============================================================
+# Benchmark fuzzy fallback:
+#   loop fuzzy_match per annuncio (vecchio) vs fuzzy_scores in batch
+#   su una lista di candidati come quella del prelim (max 2000).
+#
+# Uso (dalla root del repo):
+#   python -m benchmarks.bench_fuzzy
+#   python -m benchmarks.bench_fuzzy --items 2000 --repeat 20 --top-k 50
+# ============================================================
+
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("MONGO_WARMUP", "0")
+
+import app  # noqa: E402
+
+WORDS = [
+    "lampada", "anni", "70", "vintage", "radio", "grundig", "valvole", "sedia",
+    "thonet", "giradischi", "lenco", "commodore", "amiga", "polaroid", "vespa",
+    "poltrona", "teak", "danese", "orologio", "seiko", "automatico", "originale",
+    "perfetto", "funzionante", "spedizione", "ritiro", "zona", "milano", "roma",
+]
+
+QUERIES = ["lampda anni 70", "commodre", "giradishi lenco", "polaroid sx70", "poltrona danese"]
+
+
+def _items(n, seed=7):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 8)))
+        desc = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 120)))
+        out.append({"title": title, "description": desc})
+    return out
+
+
+def _loop(q, items):
+    return [i for i, it in enumerate(items)
+            if app.fuzzy_match(q, it["title"] + " " + it["description"])]
+
+
+def _batch(q, items, top_k=None):
+    choices = [(it["title"] + " " + it["description"])[:app.FUZZY_MAX_TEXT].lower() for it in items]
+    return sorted(i for i, _ in app.fuzzy_scores(q, choices, top_k=top_k))
+
+
+def run(n, repeat, top_k):
+    items = _items(n)
+
+    for q in QUERIES:
+        assert _loop(q, items) == _batch(q, items), q
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            _loop(q, items)
+    t_loop = (time.perf_counter() - t0) / (repeat * len(QUERIES)) * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            _batch(q, items, top_k)
+    t_batch = (time.perf_counter() - t0) / (repeat * len(QUERIES)) * 1000
+
+    print(f"items={n} top_k={top_k or 'tutti'}")
+    print(f"  loop fuzzy_match : {t_loop:8.2f} ms/query")
+    print(f"  batch            : {t_batch:8.2f} ms/query  ({t_loop / t_batch:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy fallback")
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=app.FUZZY_TOP_K)
+    args = parser.parse_args()
+
+    run(args.items, args.repeat, args.top_k)
@@ -0,0 +1,113 @@
+# benchmarks/bench_normalize.py
+# ============================================================
+# Benchmark normalizzazione ingest:
+#   normalizza_annuncio in loop (vecchio) vs normalizza_stream
+#   (process pool a chunk). Verifica che documenti accettati e
+#   ordine siano identici e che i termini della learn queue siano
+#   gli stessi (conteggi <= : lo stream non ricampiona i duplicati).
+#   Conta anche le normalizzazioni: ogni hash al massimo una volta.
+#
+# Il guadagno del pool si misura SOLO su una macchina multi-core
+# (workers <= CPU): su 1 CPU il pool è puro overhead.
+#
+# Uso (dalla root del repo):
+#   python -m benchmarks.bench_normalize
+#   python -m benchmarks.bench_normalize --items 20000 --workers 4 --chunk 200
+# ============================================================
+
+import argparse
+import os
+import random
+import time
+
+import utils_normalize as un
+from utils_dedup import DedupFilter
+from utils_pipeline import normalizza_stream
+
+WORDS = [
+    "lampada", "anni 70", "radio", "grundig", "valvole", "sedia", "thonet",
+    "giradischi", "lenco", "commodore", "amiga", "polaroid", "vespa", "poltrona",
+    "teak", "orologio", "seiko", "originale", "funzionante", "spedizione",
+    "milano", "walkman", "graziella", "maggiolino", "iphone", "samsung",
+    "ricambi", "moto", "faro", "bellissimo", "cassetto", "legno", "ottone",
+]
+
+
+def _raw_items(n, seed=3):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 8)))
+        # ~5% duplicati (stesso annuncio ripescato due volte nel run), anche
+        # a distanza di poche posizioni: stesso chunk / chunk in volo
+        if i and rnd.random() < 0.05:
+            j = rnd.randrange(max(0, i - 50), i) if rnd.random() < 0.5 else rnd.randrange(i)
+            out.append(dict(out[j]))
+            continue
+        out.append({
+            "title": title,
+            "description": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(10, 80))),
+            "price": f"{rnd.randint(5, 900)},{rnd.randint(0, 99):02d} €",
+            "url": f"https://example.org/annuncio/{i}",
+            "image": "",
+            "category": rnd.choice(["Elettronica", "Arredamento", "Collezionismo", ""]),
+        })
+    return out
+
+
+def _strip(doc):
+    return {k: v for k, v in doc.items() if k not in ("scraped_at", "updated_at")}
+
+
+def _reset():
+    un._dedup = DedupFilter()  # solo in memoria, non tocca dedup_filter.bin
+    un.known_hashes.clear()
+    un.learn_queue = un.LearnQueue("bench_learn_queue.json")
+
+
+def run(n, workers, chunk):
+    un.save_json = lambda filename, data: None  # niente scritture su disco
+    items = _raw_items(n)
+
+    _reset()
+    t0 = time.perf_counter()
+    seq = [d for d in (un.normalizza_annuncio(raw, "bench") for raw in items) if d]
+    t_seq = time.perf_counter() - t0
+    seq_learn = [(c["term"], c["count"]) for c in un.learn_queue.candidates]
+
+    _reset()
+    t0 = time.perf_counter()
+    par = list(normalizza_stream(items, "bench", workers=workers, chunk_size=chunk))
+    t_par = time.perf_counter() - t0
+    par_learn = [(c["term"], c["count"]) for c in un.learn_queue.candidates]
+
+    assert [_strip(d) for d in seq] == [_strip(d) for d in par]
+    assert [t for t, _ in seq_learn] == [t for t, _ in par_learn]
+    assert all(cp <= cs for (_, cs), (_, cp) in zip(seq_learn, par_learn))
+
+    # normalizzazioni fatte dallo stream (in-process: stesso contatore)
+    _reset()
+    calls = []
+    real = un.normalizza_senza_dedup
+    un.normalizza_senza_dedup = lambda raw, src: calls.append(un.hash_annuncio(raw, src)) or real(raw, src)
+    list(normalizza_stream(items, "bench", workers=1, chunk_size=chunk))
+    un.normalizza_senza_dedup = real
+    assert len(calls) == len(set(calls)), "hash normalizzato più di una volta"
+
+    cpu = os.cpu_count() or 1
+    print(f"items={n} accettati={len(seq)} workers={workers} chunk={chunk} cpu={cpu}")
+    print(f"  normalizzazioni stream   : {len(calls)} (hash distinti, su {n} annunci)")
+    print(f"  loop normalizza_annuncio : {n / t_seq:10.0f} annunci/s")
+    print(f"  normalizza_stream        : {n / t_par:10.0f} annunci/s  ({t_seq / t_par:.1f}x)")
+    if workers > cpu:
+        print(f"  ⚠️ workers > CPU ({cpu}): il risultato non misura il guadagno del pool")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark normalizzazione ingest")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=200)
+    args = parser.parse_args()
+
+    run(args.items, args.workers, args.chunk)
@@ -0,0 +1,152 @@
+# benchmarks/bench_result_shape.py
+# ============================================================
+# Pagina risultati /search (50 card): byte trasferiti e tempo di
+# decodifica per pagina
+#   • prima : documenti interi + campi intermedi della pipeline
+#   • dopo  : $project finale (solo campi della card + snippet)
+#   • dopo + RawBSONDocument (SEARCH_RAW_BSON=1)
+#
+# Con un mongod di TEST (BENCH_MONGO_URI) la pipeline gira davvero
+# sulla collection dell'app (documenti marcati bench_run, rimossi
+# alla fine); con --offline i documenti risultato vengono costruiti
+# in Python (stessi campi) e solo codificati / decodificati.
+#
+# Uso (dalla root del repo):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_result_shape
+#   python -m benchmarks.bench_result_shape --offline --pages 200
+# ============================================================
+
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+os.environ["MONGO_URI"] = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_WARMUP", "0")
+
+import app  # noqa: E402
+
+WORDS = [
+    "lampada", "anni", "70", "ottone", "radio", "valvole", "grundig", "sedia", "thonet",
+    "giradischi", "lenco", "originale", "funzionante", "spedizione", "ottimo", "stato",
+    "legno", "teak", "design", "italiano", "bakelite", "modernariato", "vintage",
+]
+
+
+def _annuncio(i, rnd, run_id):
+    """Documento con la forma di quelli scritti da salva_annunci_mongo."""
+    now = datetime.now(timezone.utc) - timedelta(hours=rnd.randint(0, 500))
+    price = round(rnd.uniform(5, 900), 2)
+    return {
+        "bench_run": run_id,
+        "hash": f"{run_id}-{i}",
+        "title": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 10))),
+        "description": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(150, 400))),
+        "keywords": [rnd.choice(WORDS) + str(k) for k in range(80)],
+        "url": f"https://example.invalid/annuncio/{run_id}/{i}",
+        "image": f"https://example.invalid/img/{run_id}/{i}.jpg",
+        "source": rnd.choice(["ebay", "subito", "vinted"]),
+        "era": rnd.choice(["anni_50", "anni_60", "anni_70"]),
+        "category": "arredamento",
+        "vintage_class": "vintage",
+        "vintage_score": round(rnd.uniform(0, 3), 2),
+        "price_str_raw": f"€ {price}",
+        "price_str": f"{price} EUR",
+        "price_norm": price,
+        "price_value": price,
+        "price_num": price,
+        "price_sort": price,
+        "price_display": f"{price:.2f} EUR",
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+    }
+
+
+def _with_computed(doc):
+    """Campi aggiunti da computed_stages (prima del $project finale)."""
+    dt = datetime.fromisoformat(doc["updated_at"])
+    return {**doc, "updated_dt": dt, "created_dt": dt, "base_dt": dt, "era_weight": 1,
+            "age_days": 3.2, "recency_bonus": 0.2, "score_final": doc["vintage_score"] + 0.2}
+
+
+def _projected(doc, sort_mode="score"):
+    """Equivalente Python di app._result_projection."""
+    keep = ["_id", *app.RESULT_FIELDS, *(f for f, _ in app.SORT_SPECS[sort_mode])]
+    out = {k: doc[k] for k in keep if k in doc}
+    out["snippet"] = doc["description"][:app.SEARCH_SNIPPET_CHARS]
+    return out
+
+
+def _pages_offline(n_pages, per_page, rnd):
+    run_id = "offline"
+    before, after = [], []
+    for p in range(n_pages):
+        docs = [_with_computed({"_id": bson.ObjectId(), **_annuncio(p * per_page + i, rnd, run_id)})
+                for i in range(per_page)]
+        before.append([bson.encode(d) for d in docs])
+        after.append([bson.encode(_projected(d)) for d in docs])
+    return before, after
+
+
+def _pages_mongo(n_pages, per_page, rnd):
+    col = app.get_collection(app.COLLECTION_NAME)
+    run_id = f"bench-shape-{uuid.uuid4().hex[:8]}"
+    col.insert_many([_annuncio(i, rnd, run_id) for i in range(n_pages * per_page)])
+    raw_col = col.with_options(codec_options=app.RAW_BSON_OPTIONS)
+    try:
+        with app.app.test_request_context("/search", query_string={"q": "lampada"}):
+            plan = app._search_plan(app.request.args)
+        project = plan["tail"][-1]
+        assert "$project" in project
+        # match + $sort (senza $skip / $limit / $project)
+        head = [{"$match": {"bench_run": run_id}}] + plan["tail"][:-3]
+
+        before, after = [], []
+        for p in range(n_pages):
+            page = [{"$skip": p * per_page}, {"$limit": per_page}]
+            before.append([d.raw for d in raw_col.aggregate(head + page)])
+            after.append([d.raw for d in raw_col.aggregate(head + page + [project])])
+        return before, after
+    finally:
+        col.delete_many({"bench_run": run_id})
+
+
+def _decode_ms(pages, raw=False):
+    t0 = time.perf_counter()
+    for page in pages:
+        for b in page:
+            if raw:
+                d = RawBSONDocument(b)
+                # la card legge questi campi: forza la decodifica come farebbe il template
+                d.get("title"), d.get("price_num"), d.get("url")
+            else:
+                bson.decode(b)
+    return (time.perf_counter() - t0) * 1000 / len(pages)
+
+
+def run(n_pages, per_page, offline):
+    rnd = random.Random(4)
+    before, after = (_pages_offline if offline else _pages_mongo)(n_pages, per_page, rnd)
+
+    def kb(pages):
+        return sum(len(b) for page in pages for b in page) / len(pages) / 1024
+
+    print(f"pagine={n_pages} x {per_page} risultati ({'offline' if offline else 'mongod'})")
+    print(f"  prima (documento intero)   : {kb(before):8.1f} KB/pagina  decode {_decode_ms(before):6.2f} ms")
+    print(f"  dopo ($project + snippet)  : {kb(after):8.1f} KB/pagina  decode {_decode_ms(after):6.2f} ms")
+    print(f"  dopo + RawBSONDocument     : {kb(after):8.1f} KB/pagina  decode {_decode_ms(after, raw=True):6.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Byte / decodifica per pagina risultati")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--per-page", type=int, default=app.SEARCH_PER_PAGE)
+    parser.add_argument("--offline", action="store_true", help="niente mongod: documenti costruiti in Python")
+    args = parser.parse_args()
+
+    run(args.pages, args.per_page, args.offline)
@@ -0,0 +1,130 @@
+# benchmarks/bench_search_async.py
+# ============================================================
+# /search (sync, query principale poi candidati fuzzy in serie)
+# vs /search_async (AsyncMongoClient, candidati fuzzy speculativi
+# in parallelo per le query a basso recall).
+#   • corpus sintetico inserito nella collection dell'app e
+#     rimosso alla fine (campo bench_run)
+#   • query "ok" (molti risultati) e "zero hit" (typo / rare)
+#   • verifica risultati identici, stampa p50 / p95 per route
+#
+# Serve un mongod di TEST (NON produzione): il DB usato è quello
+# dell'app (database_vintage) sul server BENCH_MONGO_URI.
+#
+# Uso (dalla root del repo):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_search_async
+#   python -m benchmarks.bench_search_async --docs 20000 --rounds 30
+# ============================================================
+
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+os.environ["MONGO_URI"] = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_WARMUP", "0")
+os.environ["SEARCH_CACHE_ENABLED"] = "0"
+
+import app  # noqa: E402
+
+WORDS = [
+    "lampada", "radio", "giradischi", "sedia", "poltrona", "orologio", "macchina",
+    "scrivere", "telefono", "bakelite", "ottone", "teak", "lenco", "grundig",
+    "brionvega", "olivetti", "seiko", "thonet", "artemide", "guzzini", "vespa",
+]
+ERAS = ["anni_50", "anni_60", "anni_70", "anni_80", "vintage_generico"]
+CATEGORIES = ["arredamento", "tecnologia", "musica_cinema", "collezionismo"]
+
+QUERIES_OK = ["lampada", "radio grundig", "sedia thonet", "giradischi lenco", "olivetti"]
+QUERIES_ZERO = ["lampda artemde", "giradishci", "brionvge", "tlefono", "orlogio seko"]
+
+
+def _seed(col, n, run_id, rnd):
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(n):
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 6)))
+        price = round(rnd.uniform(5, 900), 2)
+        ts = (now - timedelta(hours=rnd.randint(0, 2000))).isoformat()
+        docs.append({
+            "bench_run": run_id,
+            "hash": f"{run_id}-{i}",
+            "title": title,
+            "description": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 40))),
+            "url": f"https://example.invalid/{run_id}/{i}",
+            "source": rnd.choice(["ebay", "subito", "vinted"]),
+            "vintage_class": "vintage",
+            "era": rnd.choice(ERAS),
+            "category": rnd.choice(CATEGORIES),
+            "vintage_score": round(rnd.uniform(0, 3), 2),
+            "price_value": f"{price} EUR",
+            "price_num": price,
+            "price_sort": price,
+            "created_at": ts,
+            "updated_at": ts,
+        })
+    for i in range(0, n, 5000):
+        col.insert_many(docs[i:i + 5000])
+
+
+def _capture(route, args):
+    """Esegue la route e ritorna (id risultati, fuzzy_used, ms)."""
+    captured = {}
+    real = app.render_template
+    app.render_template = lambda _tpl, **kw: captured.update(kw) or ""
+    try:
+        with app.app.test_request_context(f"/{route.__name__}", query_string=args):
+            t0 = time.perf_counter()
+            route()
+            ms = (time.perf_counter() - t0) * 1000
+    finally:
+        app.render_template = real
+    return [str(r["_id"]) for r in captured["risultati"]], captured["fuzzy_used"], ms
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(n_docs, rounds):
+    col = app.get_collection(app.COLLECTION_NAME)
+    run_id = f"bench-search-{uuid.uuid4().hex[:8]}"
+    rnd = random.Random(11)
+
+    _seed(col, n_docs, run_id, rnd)
+    try:
+        if app.TRIGRAM_ENABLED:
+            app.trigram_index.build()
+
+        for label, queries in (("ok", QUERIES_OK), ("zero hit", QUERIES_ZERO)):
+            timings = {"search": [], "search_async": []}
+            for q in queries:
+                args = {"q": q}
+                ids_sync, fz_sync, _ = _capture(app.search, args)
+                ids_async, fz_async, _ = _capture(app.search_async, args)
+                assert (ids_sync, fz_sync) == (ids_async, fz_async), f"risultati diversi per {q!r}"
+
+                for _ in range(rounds):
+                    for route in (app.search, app.search_async):
+                        timings[route.__name__].append(_capture(route, args)[2])
+
+            print(f"query {label} ({len(queries)} x {rounds}):")
+            for name, values in timings.items():
+                print(f"  /{name:<13}: p50 {_pct(values, 50):7.1f} ms   p95 {_pct(values, 95):7.1f} ms")
+
+        print(f"speculazione fuzzy: {app.fuzzy_spec_stats}")
+        print("✅ risultati identici tra /search e /search_async")
+    finally:
+        col.delete_many({"bench_run": run_id})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /search vs /search_async")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    run(args.docs, args.rounds)
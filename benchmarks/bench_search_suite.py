@@ -0,0 +1,363 @@
+# benchmarks/bench_search_suite.py
+# ============================================================
+# Suite latenza /search su corpus sintetico (10k / 100k / 1M)
+#   • Corpus "annunci" realistico: titoli vintage italiani, prezzi
+#     in formati misti ("99.999", "120,50", "1.250,00 €", "Trattabile"),
+#     ere, sorgenti, categorie, annunci rimossi / scaduti /
+#     needs_check, campi prezzo e rank_score come in produzione
+#   • Caricato UNA volta nel DB di benchmark (retrofuture_bench) e
+#     riusato finché taglia / seed non cambiano (--reload per rifarlo)
+#   • Indici di utils_indexes.py + indice trigrammi, poi mix di query:
+#       testo+sinonimi, filtri, prezzo, pagine profonde (skip e
+#       cursore), zero hit -> fuzzy
+#   • p50 / p95 / p99 per mix; baseline JSON in benchmarks/baselines/
+#     e confronto con la baseline salvata (regressioni p95)
+#
+# Serve un mongod LOCALE di test (NON produzione): il DB usato è
+# BENCH_DB sul server BENCH_MONGO_URI, mai quello dell'app.
+#
+# Uso (dalla root del repo):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_search_suite --size 10k
+#   python -m benchmarks.bench_search_suite --size 100k --rounds 20 --save-baseline
+#   python -m benchmarks.bench_search_suite --size 1m --max-regression 0.15   # exit 1 se p95 peggiora >15%
+# ============================================================
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ["MONGO_URI"] = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_WARMUP", "0")
+os.environ["SEARCH_CACHE_ENABLED"] = "0"
+
+import utils_mongo  # noqa: E402
+
+BENCH_DB = "retrofuture_bench"
+# tutte le get_collection (app, utils_db, indici) puntano al DB di benchmark
+utils_mongo.DB_NAME = BENCH_DB
+
+import app  # noqa: E402
+from utils_indexes import ensure_indexes  # noqa: E402
+from utils_price import price_fields  # noqa: E402
+from utils_rank import rank_fields  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# cambiare il generatore = alzare la versione (corpus ricaricato)
+CORPUS_VERSION = 1
+
+# ============================================================
+# Corpus sintetico
+# ============================================================
+
+OBJECTS = {
+    "arredamento": ["lampada", "poltrona", "sedia", "tavolino", "credenza", "specchio", "lampadario", "divano"],
+    "tecnologia": ["radio", "giradischi", "televisore", "macchina da scrivere", "telefono", "calcolatrice",
+                   "walkman", "mangianastri"],
+    "moda_accessori": ["borsa", "orologio", "giacca", "occhiali", "foulard"],
+    "musica_cinema": ["vinile", "chitarra", "proiettore", "amplificatore"],
+    "giochi_giocattoli": ["robot", "trenino", "bambola", "console"],
+    "collezionismo": ["cartolina", "francobolli", "insegna", "juke box"],
+}
+BRANDS = ["brionvega", "grundig", "olivetti", "lenco", "thonet", "artemide", "guzzini", "kartell",
+          "cassina", "seiko", "philips", "geloso", "lesa", "telefunken", "atari", "nintendo"]
+ADJECTIVES = ["originale", "funzionante", "restaurato", "da collezione", "rarissimo", "perfetto",
+              "design", "modernariato", "space age", "in teak", "in ottone", "bakelite", "cromato"]
+ERAS = {"anni_50": "anni 50", "anni_60": "anni 60", "anni_70": "anni 70", "anni_80": "anni 80",
+        "anni_90": "anni 90", "vintage_generico": "vintage"}
+SOURCES = ["ebay", "subito", "vinted", "mercatinousato"]
+FILLER = ["spedizione", "possibile", "ritiro", "a mano", "zona", "milano", "torino", "ottime condizioni",
+          "qualche segno del tempo", "come da foto", "prezzo", "trattabile", "no perditempo", "pezzo unico"]
+
+
+def _price_value(rnd):
+    """Formati visti nei dati reali (stringhe scraper) + numeri + mancanti."""
+    n = rnd.choice([rnd.uniform(3, 80), rnd.uniform(80, 600), rnd.uniform(600, 5000)])
+    kind = rnd.random()
+    if kind < 0.25:
+        return f"{n:.2f}".replace(".", ",")                          # 120,50
+    if kind < 0.45:
+        return str(int(n))                                           # 250
+    if kind < 0.55:
+        return f"{int(n):,}".replace(",", ".") if n >= 1000 else f"{n:.2f}"  # 1.200 / 45.90
+    if kind < 0.65:
+        return f"{int(n):,}".replace(",", ".") + ",00 €" if n >= 1000 else f"€ {int(n)}"
+    if kind < 0.72:
+        return f"{int(n)} EUR"
+    if kind < 0.75:
+        return "99.999"                                              # caso storico (99999)
+    if kind < 0.85:
+        return round(n, 2)                                           # già numerico
+    if kind < 0.93:
+        return None
+    return rnd.choice(["Trattabile", "Su richiesta", ""])
+
+
+def annuncio(i, rnd, now):
+    category = rnd.choice(list(OBJECTS))
+    obj = rnd.choice(OBJECTS[category])
+    era = rnd.choice(list(ERAS))
+    source = rnd.choice(SOURCES)
+    parts = [obj, rnd.choice(BRANDS) if rnd.random() < 0.6 else "", ERAS[era],
+             rnd.choice(ADJECTIVES), rnd.choice(ADJECTIVES) if rnd.random() < 0.3 else ""]
+    title = " ".join(p for p in parts if p)
+    description = " ".join([title] + rnd.sample(FILLER, rnd.randint(3, 8)))
+    created = now - timedelta(minutes=rnd.randint(0, 60 * 24 * 90))
+    updated = min(now, created + timedelta(minutes=rnd.randint(0, 60 * 24 * 20)))
+    price_value = _price_value(rnd)
+
+    doc = {
+        "hash": f"bench-{i}",
+        "title": title,
+        "description": description,
+        "keywords": list(dict.fromkeys(title.split())),
+        "url": f"https://example.invalid/{source}/{i}",
+        "image": f"https://example.invalid/img/{i}.jpg",
+        "source": source,
+        "category": category,
+        "era": era,
+        "vintage_class": "non_vintage" if rnd.random() < 0.05 else "vintage",
+        "vintage_score": round(rnd.uniform(0, 3), 2),
+        "price_value": price_value,
+        **price_fields(price_value),
+        "is_removed": rnd.random() < 0.02,
+        "created_at": created.isoformat(),
+        "updated_at": updated.isoformat(),
+    }
+    r = rnd.random()
+    if r < 0.03:
+        doc.update(status="expired", expired_reason="deadlink")
+    elif r < 0.05:
+        doc.update(status="expired", expired_reason="noimage")
+    if source == "mercatinousato" and rnd.random() < 0.25:
+        doc["needs_check"] = True
+    rank = rank_fields(doc, now)
+    if rank["rank_next_at"] is None:
+        del rank["rank_next_at"]
+    doc.update(rank)
+    return doc
+
+
+def load_corpus(size, seed, reload=False, chunk=5000):
+    """Carica il corpus se assente / diverso. Ritorna True se (ri)caricato."""
+    col = app.get_collection(app.COLLECTION_NAME)
+    meta_col = app.get_collection("bench_meta")
+    wanted = {"size": size, "seed": seed, "version": CORPUS_VERSION}
+    meta = meta_col.find_one({"_id": "corpus"}) or {}
+    if not reload and all(meta.get(k) == v for k, v in wanted.items()) \
+            and col.estimated_document_count() == size:
+        print(f"corpus {size} già caricato (seed {seed}), riuso")
+        return False
+
+    col.drop()
+    meta_col.delete_one({"_id": "corpus"})
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    batch = []
+    for i in range(size):
+        batch.append(annuncio(i, rnd, now))
+        if len(batch) >= chunk:
+            col.insert_many(batch, ordered=False)
+            batch = []
+            print(f"  {i + 1}/{size} annunci caricati", end="\r")
+    if batch:
+        col.insert_many(batch, ordered=False)
+    meta_col.update_one({"_id": "corpus"}, {"$set": {**wanted, "loaded_at": now}}, upsert=True)
+    print(f"corpus {size} caricato in {time.perf_counter() - t0:.1f}s")
+    return True
+
+
+# ============================================================
+# Mix di query
+# ============================================================
+
+QUERY_MIXES = {
+    "testo+sinonimi": [
+        {"q": "giradischi"}, {"q": "lampada vintage"}, {"q": "radio vintage"}, {"q": "vinile"},
+        {"q": "macchina da scrivere olivetti"}, {"q": "poltrona anni 70"},
+    ],
+    "filtri": [
+        {"era": "anni_70"}, {"category": "arredamento", "source": "ebay"}, {"q": "lampada", "era": "anni_60"},
+        {"source": "subito", "era": "anni_80"}, {"category": "tecnologia"},
+    ],
+    "prezzo": [
+        {"sort": "price_asc"}, {"sort": "price_desc"}, {"q": "radio", "sort": "price_asc", "price_max": "100"},
+        {"sort": "price_desc", "price_min": "50", "price_max": "500"},
+    ],
+    "pagine profonde (skip)": [
+        {"page": "20"}, {"sort": "date", "page": "40"}, {"scope": "tutti", "page": "50"},
+        {"sort": "price_asc", "page": "30"},
+    ],
+    # "after" riempito da _follow_cursor: pagina CURSOR_DEPTH seguendo i "successiva"
+    "pagine profonde (cursore)": [
+        {"sort": "score"}, {"sort": "date"}, {"scope": "tutti"}, {"sort": "price_desc"},
+    ],
+    "zero hit -> fuzzy": [
+        {"q": "lampda artemde"}, {"q": "giradishci"}, {"q": "brionvge"}, {"q": "tlefono"},
+        {"q": "orlogio seko"}, {"q": "poltroan thnet"},
+    ],
+}
+CURSOR_DEPTH = 20
+
+
+def _capture(args):
+    """Esegue /search (render stubbato). Ritorna (kwargs del template, ms)."""
+    captured = {}
+    real = app.render_template
+    app.render_template = lambda _tpl, **kw: captured.update(kw) or ""
+    try:
+        with app.app.test_request_context("/search", query_string=args):
+            t0 = time.perf_counter()
+            app.search()
+            ms = (time.perf_counter() - t0) * 1000
+    finally:
+        app.render_template = real
+    return captured, ms
+
+
+def _follow_cursor(args, depth):
+    """Token "after" della pagina `depth` (None se i risultati finiscono prima)."""
+    args = dict(args)
+    for _ in range(depth - 1):
+        kw, _ = _capture(args)
+        if not kw.get("next_cursor"):
+            return None
+        args["after"] = kw["next_cursor"]
+    return args
+
+
+def _prepare_mixes():
+    mixes = {}
+    for name, queries in QUERY_MIXES.items():
+        if "cursore" in name:
+            queries = [a for a in (_follow_cursor(q, CURSOR_DEPTH) for q in queries) if a]
+        mixes[name] = queries
+    return mixes
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def _summary(values):
+    return {
+        "n": len(values),
+        "p50": round(_pct(values, 50), 2),
+        "p95": round(_pct(values, 95), 2),
+        "p99": round(_pct(values, 99), 2),
+        "mean": round(statistics.fmean(values), 2),
+    }
+
+
+def run_mixes(rounds):
+    mixes = _prepare_mixes()
+    timings = {name: [] for name in mixes}
+    for name, queries in mixes.items():
+        for args in queries:
+            _capture(args)  # warm-up (piani in cache, pagine in RAM)
+        for _ in range(rounds):
+            for args in queries:
+                timings[name].append(_capture(args)[1])
+
+    results = {name: _summary(values) for name, values in timings.items() if values}
+    results["totale"] = _summary([v for values in timings.values() for v in values])
+    return results
+
+
+# ============================================================
+# Baseline
+# ============================================================
+
+def _baseline_path(size):
+    return os.path.join(BASELINE_DIR, f"search_suite_{size}.json")
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def save_baseline(size, results, rounds):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    data = {"size": size, "rounds": rounds, "git": _git_rev(),
+            "created_at": datetime.now(timezone.utc).isoformat(), "results": results}
+    with open(_baseline_path(size), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"💾 baseline salvata in {_baseline_path(size)}")
+
+
+def compare_baseline(size, results, max_regression):
+    """Stampa i delta rispetto alla baseline. Ritorna i mix con p95 peggiorato oltre soglia."""
+    try:
+        with open(_baseline_path(size), encoding="utf-8") as f:
+            base = json.load(f)
+    except FileNotFoundError:
+        print("(nessuna baseline per questa taglia: --save-baseline per crearla)")
+        return []
+
+    print(f"\nvs baseline {base.get('git') or '?'} del {base.get('created_at', '?')[:10]}:")
+    regressions = []
+    for name, cur in results.items():
+        old = base["results"].get(name)
+        if not old:
+            continue
+        deltas = {p: (cur[p] - old[p]) / old[p] if old[p] else 0.0 for p in ("p50", "p95", "p99")}
+        print(f"  {name:<28} " + "  ".join(f"{p} {deltas[p]:+6.1%}" for p in deltas))
+        if deltas["p95"] > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def _print_results(results):
+    print(f"{'mix':<28} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, r in results.items():
+        print(f"{name:<28} {r['n']:>5} {r['p50']:>7.1f}ms {r['p95']:>7.1f}ms {r['p99']:>7.1f}ms")
+
+
+def run(size_label, rounds, seed, reload, save, max_regression):
+    size = SIZES.get(size_label.lower()) or int(size_label)
+    reloaded = load_corpus(size, seed, reload=reload)
+
+    errors = ensure_indexes([app.COLLECTION_NAME])
+    if errors:
+        print(f"⚠️ indici non creati: {errors}")
+    if app.TRIGRAM_ENABLED and (reloaded or not app.trigram_index.ready()):
+        t0 = time.perf_counter()
+        app.trigram_index.build()
+        print(f"indice trigrammi costruito in {time.perf_counter() - t0:.1f}s")
+
+    print(f"\ncorpus {size} annunci, {rounds} round per mix")
+    results = run_mixes(rounds)
+    _print_results(results)
+
+    regressions = compare_baseline(size_label.lower(), results, max_regression)
+    if save:
+        save_baseline(size_label.lower(), results, rounds)
+    if regressions:
+        print(f"❌ p95 peggiorato oltre {max_regression:.0%}: {regressions}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suite latenza /search su corpus sintetico")
+    parser.add_argument("--size", default="10k", help="10k | 100k | 1m | numero di annunci")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--reload", action="store_true", help="ricarica il corpus anche se già presente")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="soglia p95 vs baseline (0.2 = +20%%)")
+    args = parser.parse_args()
+
+    sys.exit(run(args.size, args.rounds, args.seed, args.reload, args.save_baseline, args.max_regression))
@@ -0,0 +1,106 @@
+# benchmarks/bench_synonyms.py
+# ============================================================
+# Microbenchmark espansione sinonimi:
+#   scansione lineare (vecchia) vs indice n-gram (SINONIMI_INDEX)
+#   al crescere del dizionario.
+#
+# Uso (dalla root del repo):
+#   python -m benchmarks.bench_synonyms
+#   python -m benchmarks.bench_synonyms --sizes 100,1000,10000 --repeat 2000
+# ============================================================
+
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("MONGO_WARMUP", "0")
+
+import app  # noqa: E402
+
+QUERIES = [
+    "lampada anni 70",
+    "mobile vintage teak",
+    "commodore 64 con cassette",
+    "giradischi lenco",
+    "sedie thonet originali",
+    "radio a valvole grundig anni 50",
+]
+
+
+def _espandi_linear(query, bio):
+    """Implementazione storica: scansione di tutto il dizionario."""
+    q_norm = app._norm_text(query)
+    if not q_norm:
+        return []
+    tokens = app._tokenize(q_norm)
+    if not tokens:
+        return []
+
+    ngrams = app._generate_ngrams(tokens, max_len=4)
+    candidates = []
+
+    for key, lst in bio.items():
+        if key in ngrams:
+            candidates.extend(lst)
+        for s in lst:
+            if s in ngrams:
+                candidates.append(key)
+                candidates.extend(lst)
+                break
+
+    seen = set()
+    result = []
+    for s in candidates:
+        s_norm = app._norm_text(s)
+        if s_norm and s_norm not in seen:
+            seen.add(s_norm)
+            result.append(s_norm)
+    return result
+
+
+def _synthetic_dictionary(size, seed=42):
+    """Dizionario reale + chiavi sintetiche fino a `size` voci."""
+    rnd = random.Random(seed)
+    raw = {k: list(v) for k, v in app.load_synonyms().items()}
+
+    words = ["lampada", "mobile", "radio", "sedia", "tavolo", "giradischi",
+             "orologio", "borsa", "giacca", "poster", "vinile", "console"]
+    i = 0
+    while len(raw) < size:
+        base = f"{rnd.choice(words)} {i}"
+        raw[base] = [f"{base} {rnd.choice(['retro', 'vintage', 'anni 70', 'epoca'])}" for _ in range(5)]
+        i += 1
+    return app.build_bidirectional_synonyms(raw)
+
+
+def _time(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            fn(q)
+    return (time.perf_counter() - t0) / (repeat * len(QUERIES)) * 1e6  # µs/query
+
+
+def run(sizes, repeat):
+    print(f"{'voci':>8} {'linear µs/q':>12} {'index µs/q':>12} {'speedup':>8}")
+    for size in sizes:
+        bio = _synthetic_dictionary(size)
+        index = app.build_synonym_index(bio)
+
+        for q in QUERIES:
+            assert _espandi_linear(q, bio) == app._espandi_sinonimi(q, index=index), q
+
+        lin_repeat = max(1, repeat // max(1, len(bio) // 100))
+        t_lin = _time(lambda q: _espandi_linear(q, bio), lin_repeat)
+        t_idx = _time(lambda q: app._espandi_sinonimi(q, index=index), repeat)
+        print(f"{len(bio):>8} {t_lin:>12.1f} {t_idx:>12.1f} {t_lin / t_idx:>7.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark espansione sinonimi")
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    run([int(x) for x in args.sizes.split(",")], args.repeat)
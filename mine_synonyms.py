@@ -0,0 +1,275 @@
+# mine_synonyms.py
+# ============================================================
+# Co-occorrenze query -> titolo dai click (auto_synonyms)
+#   • Incrementale: watermark (created_at, _id) in "job_state",
+#     ogni run legge SOLO i click nuovi (indice created_at + _id)
+#   • Tabelle materializzate compatte (solo $inc, upsert a batch):
+#       click_cooc  : token query x token titolo
+#       click_tokens: totali per token (lato query / lato titolo)
+#   • Decadimento esponenziale (emivita CLICK_HALF_LIFE_DAYS) senza
+#     riscrivere i pesi: "forward decay", ogni click pesa
+#     2^((t - epoch)/emivita) e si divide per lo stesso fattore di
+#     "adesso" in lettura
+#   • Pruning delle coppie il cui peso è decaduto sotto soglia
+#   • Export candidati nel formato di synonyms.json
+#
+# Un batch interrotto prima del salvataggio del watermark viene
+# ricontato al run successivo (at-least-once: errore trascurabile
+# sui pesi, nessun click perso).
+# created_at è il momento del click, ma utils_clicks lo scrive in DB
+# secondi dopo (flush a batch + retry): si leggono solo i click più
+# vecchi di CLICK_SETTLE_SECONDS, così nessuno arriva "dietro" al
+# watermark.
+#
+# Uso:
+#   python mine_synonyms.py                       # aggiorna dai click nuovi
+#   python mine_synonyms.py --export synonyms_candidates.json
+#   python mine_synonyms.py --restart             # ricalcola da zero
+# ============================================================
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from utils_log import log_event
+from utils_mongo import get_collection
+
+CLICKS_COLLECTION = "auto_synonyms"
+COOC_COLLECTION = "click_cooc"
+TOKENS_COLLECTION = "click_tokens"
+JOB_STATE_COLLECTION = "job_state"
+JOB_ID = "mine_synonyms"
+
+CLICK_HALF_LIFE_DAYS = float(os.getenv("CLICK_HALF_LIFE_DAYS", "60"))
+# coppie con peso (decaduto) sotto soglia vengono eliminate
+CLICK_PRUNE_WEIGHT = float(os.getenv("CLICK_PRUNE_WEIGHT", "0.2"))
+# ritardo massimo click -> insert (utils_clicks: CLICK_FLUSH_SECONDS +
+# CLICK_MAX_RETRIES tentativi con timeout Mongo e backoff), con margine
+CLICK_SETTLE_SECONDS = float(os.getenv("CLICK_SETTLE_SECONDS", "300"))
+# token del titolo considerati per click (i titoli lunghi sono rumore)
+CLICK_MAX_TITLE_TOKENS = int(os.getenv("CLICK_MAX_TITLE_TOKENS", "12"))
+
+# epoca fissa del forward decay (cambiarla = --restart)
+DECAY_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+STOPWORDS = {
+    "il", "lo", "la", "i", "gli", "le", "un", "uno", "una", "di", "del", "della", "dei", "degli",
+    "delle", "da", "dal", "dalla", "in", "con", "su", "per", "tra", "fra", "e", "ed", "o", "a",
+    "al", "alla", "ai", "agli", "alle", "the", "and", "of", "for", "with", "vendo", "vendesi",
+}
+
+_TOKEN_RE = re.compile(r"[a-zà-ÿ0-9]+")
+
+
+# ============================================================
+# Token / pesi
+# ============================================================
+
+def tokenize(s):
+    """Token normalizzati (ordine preservato, senza duplicati né stopword)."""
+    s = (s or "").lower().replace("’", "'").replace("‘", "'")
+    out = []
+    for t in _TOKEN_RE.findall(s):
+        if t in STOPWORDS or (len(t) < 3 and not t.isdigit()):
+            continue
+        out.append(t)
+    return list(dict.fromkeys(out))
+
+
+def _as_utc(dt):
+    if dt is None:
+        return datetime.now(timezone.utc)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def decay_factor(dt):
+    """2^((dt - epoca) / emivita): peso "forward" di un click a dt."""
+    days = (_as_utc(dt) - DECAY_EPOCH).total_seconds() / 86400
+    return 2.0 ** (days / CLICK_HALF_LIFE_DAYS)
+
+
+CLICK_INDEXES = [
+    ([("created_at", ASCENDING), ("_id", ASCENDING)], "created_at_id"),
+]
+COOC_INDEXES = [
+    ([("ws", ASCENDING)], "ws"),
+    ([("q", ASCENDING), ("ws", DESCENDING)], "q_ws"),
+]
+
+
+def ensure_indexes():
+    for col_name, indexes in ((CLICKS_COLLECTION, CLICK_INDEXES), (COOC_COLLECTION, COOC_INDEXES)):
+        col = get_collection(col_name)
+        for keys, name in indexes:
+            col.create_index(keys, name=name)
+
+
+# ============================================================
+# Aggiornamento incrementale
+# ============================================================
+
+def _click_pairs(click):
+    q_tokens = tokenize(click.get("query"))
+    t_tokens = [t for t in tokenize(click.get("title"))[:CLICK_MAX_TITLE_TOKENS] if t not in q_tokens]
+    return q_tokens, t_tokens
+
+
+def _flush(pairs, q_tot, t_tot):
+    cooc_ops = [
+        UpdateOne({"_id": f"{q}|{t}"}, {"$inc": {"ws": w, "n": n}, "$setOnInsert": {"q": q, "t": t}}, upsert=True)
+        for (q, t), (w, n) in pairs.items()
+    ]
+    token_ops = [
+        UpdateOne({"_id": f"q|{tok}"}, {"$inc": {"ws": w}}, upsert=True) for tok, w in q_tot.items()
+    ] + [
+        UpdateOne({"_id": f"t|{tok}"}, {"$inc": {"ws": w}}, upsert=True) for tok, w in t_tot.items()
+    ]
+    if cooc_ops:
+        get_collection(COOC_COLLECTION).bulk_write(cooc_ops, ordered=False)
+    if token_ops:
+        get_collection(TOKENS_COLLECTION).bulk_write(token_ops, ordered=False)
+
+
+def update_cooccurrences(batch_size=5000, restart=False):
+    """Aggrega i click arrivati dopo il watermark. Ritorna quanti click ha letto."""
+    clicks = get_collection(CLICKS_COLLECTION)
+    state_col = get_collection(JOB_STATE_COLLECTION)
+
+    if restart:
+        state_col.delete_one({"_id": JOB_ID})
+        get_collection(COOC_COLLECTION).drop()
+        get_collection(TOKENS_COLLECTION).drop()
+        log_event("synonyms", "🧹 Co-occorrenze azzerate, ricalcolo da zero")
+
+    ensure_indexes()
+
+    state = state_col.find_one({"_id": JOB_ID}) or {}
+    last_at, last_id = state.get("last_created_at"), state.get("last_id")
+    total_ws = float(state.get("total_ws") or 0.0)
+    read = 0
+    # click ancora in volo nel buffer non possono avere created_at < cutoff
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CLICK_SETTLE_SECONDS)
+
+    while True:
+        if last_at is None:
+            q = {"created_at": {"$type": "date", "$lt": cutoff}}
+        else:
+            q = {"$and": [
+                {"created_at": {"$lt": cutoff}},
+                {"$or": [
+                    {"created_at": {"$gt": last_at}},
+                    {"created_at": last_at, "_id": {"$gt": last_id}},
+                ]},
+            ]}
+        batch = list(
+            clicks.find(q, {"query": 1, "title": 1, "created_at": 1})
+            .sort([("created_at", ASCENDING), ("_id", ASCENDING)])
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        pairs = {}  # (q, t) -> [ws, n]
+        q_tot, t_tot = Counter(), Counter()
+        for click in batch:
+            q_tokens, t_tokens = _click_pairs(click)
+            if not q_tokens or not t_tokens:
+                continue
+            w = decay_factor(click.get("created_at"))
+            total_ws += w
+            for qt in q_tokens:
+                q_tot[qt] += w
+                for tt in t_tokens:
+                    acc = pairs.setdefault((qt, tt), [0.0, 0])
+                    acc[0] += w
+                    acc[1] += 1
+            for tt in t_tokens:
+                t_tot[tt] += w
+
+        _flush(pairs, q_tot, t_tot)
+
+        read += len(batch)
+        last_at, last_id = batch[-1]["created_at"], batch[-1]["_id"]
+        state_col.update_one(
+            {"_id": JOB_ID},
+            {"$set": {"last_created_at": last_at, "last_id": last_id, "total_ws": total_ws,
+                      "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        log_event("synonyms", f"📦 {read} click aggregati (fino a {last_at})")
+
+        if len(batch) < batch_size:
+            break
+
+    pruned = prune()
+    log_event("synonyms", f"✅ Co-occorrenze aggiornate: {read} click nuovi, {pruned} coppie potate")
+    return read
+
+
+def prune(min_weight=CLICK_PRUNE_WEIGHT):
+    """Elimina le coppie con peso decaduto < min_weight (range su indice ws)."""
+    threshold = min_weight * decay_factor(datetime.now(timezone.utc))
+    return get_collection(COOC_COLLECTION).delete_many({"ws": {"$lt": threshold}}).deleted_count
+
+
+# ============================================================
+# Export candidati (formato synonyms.json)
+# ============================================================
+
+def export_candidates(min_weight=2.0, min_confidence=0.1, min_lift=2.0, top_k=20):
+    """
+    {token query: [token titolo, ...]} ordinati per punteggio.
+      confidence = P(t | q)        lift = P(t | q) / P(t)
+    Pesi già decaduti ad "adesso".
+    """
+    now_f = decay_factor(datetime.now(timezone.utc))
+    state = get_collection(JOB_STATE_COLLECTION).find_one({"_id": JOB_ID}) or {}
+    total = float(state.get("total_ws") or 0.0) / now_f
+    if total <= 0:
+        return {}
+
+    totals = {d["_id"]: d["ws"] / now_f for d in get_collection(TOKENS_COLLECTION).find({}, {"ws": 1})}
+
+    scored = {}
+    for d in get_collection(COOC_COLLECTION).find({"ws": {"$gte": min_weight * now_f}}, {"q": 1, "t": 1, "ws": 1}):
+        w = d["ws"] / now_f
+        w_q = totals.get(f"q|{d['q']}") or 0.0
+        w_t = totals.get(f"t|{d['t']}") or 0.0
+        if not w_q or not w_t:
+            continue
+        confidence = w / w_q
+        lift = confidence / (w_t / total)
+        if confidence < min_confidence or lift < min_lift:
+            continue
+        scored.setdefault(d["q"], []).append((confidence * math.log1p(w), d["t"]))
+
+    return {
+        q: [t for _, t in sorted(cands, reverse=True)[:top_k]]
+        for q, cands in sorted(scored.items())
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Co-occorrenze query/titolo dai click")
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--export", metavar="PATH", help="scrive i candidati (formato synonyms.json)")
+    parser.add_argument("--min-weight", type=float, default=2.0)
+    parser.add_argument("--min-confidence", type=float, default=0.1)
+    parser.add_argument("--min-lift", type=float, default=2.0)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    update_cooccurrences(batch_size=args.batch, restart=args.restart)
+
+    if args.export:
+        out = export_candidates(args.min_weight, args.min_confidence, args.min_lift, args.top)
+        with open(args.export, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+        log_event("synonyms", f"💾 {len(out)} chiavi candidate scritte in {args.export}")
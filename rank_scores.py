@@ -0,0 +1,167 @@
+# rank_scores.py
+# ============================================================
+# Aggiornamento di rank_score / era_weight (sort "score" di /search)
+#   • Refresh: solo gli annunci con rank_next_at <= adesso, cioè
+#     quelli che hanno passato un confine di gradino (1/3/7/14 gg)
+#     — indice parziale su rank_next_at, niente scan della collection
+#   • Backfill: tutti gli annunci a batch ordinati per _id,
+#     riprendibile (watermark in "job_state"), scrive solo se cambia
+#   • Crea gli indici usati dal sort "score"
+#
+# Tra un refresh e l'altro un annuncio può restare sul gradino
+# precedente al massimo RANK_REFRESH_SECONDS.
+#
+# Uso:
+#   python rank_scores.py --backfill         # prima volta / dopo modifiche ai gradini
+#   python rank_scores.py                    # refresh singolo (cron)
+#   python rank_scores.py --loop             # processo "rank" del Procfile: completa il
+#                                            # backfill se mai concluso, poi refresh ogni
+#                                            # RANK_REFRESH_SECONDS
+# ============================================================
+
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from utils_log import log_event
+from utils_mongo import get_collection
+from utils_rank import RANK_FIELDS, rank_fields, rank_update
+
+COLLECTION_NAME = "annunci"
+JOB_STATE_COLLECTION = "job_state"
+JOB_ID = "backfill_rank_score"
+
+RANK_REFRESH_SECONDS = int(os.getenv("RANK_REFRESH_SECONDS", "300"))
+
+_PROJECTION = {"vintage_score": 1, "era": 1, "updated_at": 1, "created_at": 1, **{f: 1 for f in RANK_FIELDS}}
+
+RANK_INDEXES = [
+    # stesso ordine di SORT_SPECS["score"] (utils_search_query)
+    ([("rank_score", DESCENDING), ("era_weight", DESCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+     "rank_score_updated", {}),
+    # solo gli annunci che devono ancora cambiare gradino (< 14 giorni)
+    ([("rank_next_at", ASCENDING)], "rank_next_at",
+     {"partialFilterExpression": {"rank_next_at": {"$exists": True}}}),
+]
+
+
+def ensure_rank_indexes(col=None):
+    col = col if col is not None else get_collection(COLLECTION_NAME)
+    for keys, name, opts in RANK_INDEXES:
+        col.create_index(keys, name=name, **opts)
+
+
+def _changed(doc, fields):
+    return any(doc.get(k) != v for k, v in fields.items())
+
+
+def _same_instant(a, b):
+    if a is None or b is None:
+        return a is b
+    a = a if a.tzinfo else a.replace(tzinfo=timezone.utc)
+    b = b if b.tzinfo else b.replace(tzinfo=timezone.utc)
+    return a == b
+
+
+def _needs_update(doc, now):
+    fields = rank_fields(doc, now)
+    next_at = fields.pop("rank_next_at")
+    # pymongo rilegge le date come naive UTC
+    return _changed(doc, fields) or not _same_instant(doc.get("rank_next_at"), next_at)
+
+
+def refresh_rank_scores(batch_size=1000):
+    """Aggiorna gli annunci scaduti (rank_next_at <= adesso). Ritorna quanti."""
+    col = get_collection(COLLECTION_NAME)
+    now = datetime.now(timezone.utc)
+    updated = 0
+
+    while True:
+        batch = list(
+            col.find({"rank_next_at": {"$lte": now}}, _PROJECTION)
+            .sort("rank_next_at", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        ops = [UpdateOne({"_id": doc["_id"]}, rank_update(doc, now)) for doc in batch]
+        res = col.bulk_write(ops, ordered=False)
+        updated += res.modified_count
+
+        # ogni update sposta rank_next_at nel futuro (o lo toglie): il
+        # batch successivo riparte dai rimanenti
+        if len(batch) < batch_size:
+            break
+
+    log_event("rank", f"✅ rank_score aggiornati: {updated} annunci hanno cambiato gradino")
+    return updated
+
+
+def backfill_rank_scores(batch_size=1000, restart=False):
+    """Calcola i campi di ranking su tutti gli annunci. Ritorna quanti aggiornati."""
+    col = get_collection(COLLECTION_NAME)
+    state_col = get_collection(JOB_STATE_COLLECTION)
+
+    if restart:
+        state_col.delete_one({"_id": JOB_ID})
+
+    state = state_col.find_one({"_id": JOB_ID}) or {}
+    last_id = state.get("last_id")
+    updated = int(state.get("updated") or 0)
+
+    if last_id is not None:
+        log_event("rank", f"▶️ Ripresa backfill rank_score da _id > {last_id}")
+    else:
+        log_event("rank", "🚀 Avvio backfill rank_score")
+
+    now = datetime.now(timezone.utc)
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(col.find(q, _PROJECTION).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            break
+
+        ops = [UpdateOne({"_id": doc["_id"]}, rank_update(doc, now)) for doc in batch if _needs_update(doc, now)]
+        if ops:
+            res = col.bulk_write(ops, ordered=False)
+            updated += res.modified_count
+
+        last_id = batch[-1]["_id"]
+        state_col.update_one(
+            {"_id": JOB_ID},
+            {"$set": {"last_id": last_id, "updated": updated}},
+            upsert=True
+        )
+        log_event("rank", f"📦 batch fino a _id {last_id} — aggiornati finora: {updated}")
+
+    ensure_rank_indexes(col)
+    state_col.update_one({"_id": JOB_ID}, {"$set": {"done": True}}, upsert=True)
+    log_event("rank", f"✅ Backfill rank_score concluso — aggiornati: {updated}")
+
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="rank_score materializzato per il sort 'score'")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--backfill", action="store_true", help="ricalcola tutti gli annunci")
+    parser.add_argument("--restart", action="store_true", help="backfill da zero (ignora il watermark)")
+    parser.add_argument("--loop", action="store_true", help="refresh continuo ogni RANK_REFRESH_SECONDS")
+    args = parser.parse_args()
+
+    backfill_done = (get_collection(JOB_STATE_COLLECTION).find_one({"_id": JOB_ID}) or {}).get("done")
+    if args.backfill or args.restart or (args.loop and not backfill_done):
+        backfill_rank_scores(batch_size=args.batch, restart=args.restart)
+
+    ensure_rank_indexes()
+    refresh_rank_scores(batch_size=args.batch)
+    while args.loop:
+        time.sleep(RANK_REFRESH_SECONDS)
+        try:
+            refresh_rank_scores(batch_size=args.batch)
+        except Exception as e:
+            log_event("rank", f"❌ Errore refresh rank_score: {e}", "ERROR")
@@ -0,0 +1,115 @@
+# tests/test_report_noimage.py
+# ============================================================
+# /report_noimage contro un mongod VERO (update pipeline reale):
+#   • N thread x K segnalazioni concorrenti sullo stesso annuncio
+#     -> noimage_hits == N*K e una sola scadenza (un solo bump)
+#   • annuncio ripristinato a mano con hits già oltre soglia
+#     -> la segnalazione successiva lo riscade e bumpa la versione
+#
+# Serve un mongod usa e getta: ogni run usa un DB test_noimage_<uuid>
+# (mai database_vintage), cancellato alla fine. Senza TEST_MONGO_URI
+# i test vengono saltati.
+#
+# Uso (dalla root del repo):
+#   TEST_MONGO_URI=mongodb://localhost:27017 python -m pytest -q tests/test_report_noimage.py
+# ============================================================
+
+import os
+import threading
+import uuid
+
+import pytest
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_MONGO_URI, reason="TEST_MONGO_URI non impostato (serve un mongod usa e getta)"
+)
+
+
+@pytest.fixture(scope="module")
+def app_mod(tmp_path_factory):
+    os.environ["MONGO_URI"] = TEST_MONGO_URI
+    os.environ["MONGO_WARMUP"] = "0"
+    os.environ["RATELIMIT_DB_PATH"] = str(tmp_path_factory.mktemp("rl") / "ratelimit.db")
+    os.environ["LEARNED_DB_PATH"] = str(tmp_path_factory.mktemp("learned") / "learned_terms.db")
+
+    import utils_mongo
+    import app
+
+    db_name = f"test_noimage_{uuid.uuid4().hex}"
+    utils_mongo.DB_NAME = db_name
+    yield app
+    utils_mongo.get_client().drop_database(db_name)
+
+
+@pytest.fixture
+def bumps(app_mod, monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_bump(reason=""):
+        with lock:
+            calls.append(reason)
+
+    monkeypatch.setattr(app_mod, "bump_data_version", fake_bump)
+    return calls
+
+
+def _insert_listing(app_mod, **fields):
+    item_hash = f"test-noimage-{uuid.uuid4().hex}"
+    app_mod.get_collection(app_mod.COLLECTION_NAME).insert_one(
+        {"hash": item_hash, "source": "mercatinousato", "title": "test noimage", **fields}
+    )
+    return item_hash
+
+
+def _report(client, item_hash, ip):
+    res = client.post(
+        "/report_noimage",
+        json={"hash": item_hash, "source": "mercatinousato"},
+        headers={"X-Forwarded-For": ip},
+    )
+    return res.get_json()
+
+
+def test_concurrent_reports_lose_no_increment_and_expire_once(app_mod, bumps):
+    n_threads, n_requests = 8, 25
+    item_hash = _insert_listing(app_mod)
+
+    statuses = []
+    barrier = threading.Barrier(n_threads)
+
+    def worker(t):
+        client = app_mod.app.test_client()
+        barrier.wait()
+        for i in range(n_requests):
+            # IP diversi: nessuna richiesta fermata dal cooldown
+            statuses.append(_report(client, item_hash, f"10.{t}.{i // 250}.{i % 250}").get("status"))
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    doc = app_mod.get_collection(app_mod.COLLECTION_NAME).find_one({"hash": item_hash})
+    assert statuses.count("ok") == n_threads * n_requests
+    assert doc["noimage_hits"] == n_threads * n_requests
+    assert doc["status"] == "expired" and doc["expired_reason"] == "noimage"
+    assert bumps == ["noimage"]
+
+
+def test_restored_listing_over_threshold_bumps_on_reexpiry(app_mod, bumps):
+    hits = app_mod.NOIMAGE_HITS_REQUIRED + 3
+    item_hash = _insert_listing(app_mod, noimage_hits=hits)
+    client = app_mod.app.test_client()
+
+    first = _report(client, item_hash, "10.200.0.1")
+    second = _report(client, item_hash, "10.200.0.2")
+
+    doc = app_mod.get_collection(app_mod.COLLECTION_NAME).find_one({"hash": item_hash})
+    assert first == {"status": "ok", "hits": hits + 1, "expired": True}
+    assert second["hits"] == hits + 2
+    assert doc["status"] == "expired" and doc["expired_reason"] == "noimage"
+    assert bumps == ["noimage"]
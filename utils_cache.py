@@ -0,0 +1,212 @@
+# utils_cache.py
+# ============================================================
+# Cache risultati /search RetroFuture
+#   • Chiave = parametri normalizzati + data version
+#   • Backend pluggabile (oggi: memoria di processo, LRU + TTL)
+#   • Contatori hit / miss / eviction
+#   • Data version condivisa in Mongo ("meta"): la bumpano
+#     salva_annunci_mongo, remove_item, expiry noimage
+#     -> tutte le chiavi vecchie diventano irraggiungibili
+#     (bump fallito: si svuotano le cache versionate di questo
+#     processo, la versione resta quella letta da Mongo)
+# ============================================================
+
+import os
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+
+from utils_log import log_event
+from utils_mongo import get_collection
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1") != "0"
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "120"))  # secondi
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "500"))
+
+# ogni quanto (s) rileggere la data version da Mongo
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "5"))
+
+META_COLLECTION = "meta"
+DATA_VERSION_ID = "data_version"
+
+
+# ============================================================
+# Backend
+# ============================================================
+
+class CacheBackend(ABC):
+    """Interfaccia minima: un backend condiviso (es. SQLite locale) implementa questi metodi."""
+
+    @abstractmethod
+    def get(self, key):
+        """Valore in cache o None (assente / scaduto)."""
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        """Salva value per ttl secondi."""
+
+    @abstractmethod
+    def clear(self):
+        """Svuota tutto."""
+
+    @abstractmethod
+    def __len__(self):
+        """Numero di entry (anche scadute non ancora rimosse)."""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU in memoria di processo con TTL per entry."""
+
+    def __init__(self, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ============================================================
+# Data version (condivisa tra processi via Mongo)
+# ============================================================
+
+_version_lock = threading.Lock()
+_version_value = 0
+_version_checked_at = 0.0
+
+# cache con chiavi legate alla data version (svuotate se il bump fallisce)
+_versioned_caches = weakref.WeakSet()
+
+
+def get_data_version():
+    """
+    Versione dati corrente. Letta da Mongo al massimo ogni
+    DATA_VERSION_POLL_SECONDS; se Mongo non risponde usa l'ultima nota.
+    """
+    global _version_value, _version_checked_at
+
+    now = time.monotonic()
+    if now - _version_checked_at < DATA_VERSION_POLL_SECONDS:
+        return _version_value
+
+    with _version_lock:
+        if now - _version_checked_at < DATA_VERSION_POLL_SECONDS:
+            return _version_value
+        try:
+            doc = get_collection(META_COLLECTION).find_one({"_id": DATA_VERSION_ID}) or {}
+            _version_value = int(doc.get("v") or 0)
+        except Exception as e:
+            log_event("cache", f"⚠️ Lettura data version fallita: {e}", "WARNING")
+        _version_checked_at = now
+        return _version_value
+
+
+def bump_data_version(reason=""):
+    """Invalida tutte le cache (di tutti i worker) incrementando la versione."""
+    global _version_value, _version_checked_at
+
+    try:
+        doc = get_collection(META_COLLECTION).find_one_and_update(
+            {"_id": DATA_VERSION_ID},
+            {"$inc": {"v": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        ) or {}
+        with _version_lock:
+            _version_value = int(doc.get("v") or 0)
+            _version_checked_at = time.monotonic()
+    except Exception as e:
+        log_event("cache", f"❌ Bump data version fallito ({reason}): {e}", "ERROR")
+        # almeno questo processo non serve dati vecchi. Niente versione
+        # locale inventata: il poll successivo la riporterebbe indietro
+        # e le chiavi vecchie tornerebbero raggiungibili
+        for cache in list(_versioned_caches):
+            cache.backend.clear()
+
+
+# ============================================================
+# Cache risultati
+# ============================================================
+
+class ResultCache:
+    def __init__(self, backend=None, ttl=SEARCH_CACHE_TTL, enabled=SEARCH_CACHE_ENABLED,
+                 version_fn=get_data_version):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.enabled = enabled
+        self.version_fn = version_fn
+        self.hits = 0
+        self.misses = 0
+        if version_fn is get_data_version:
+            _versioned_caches.add(self)
+
+    def key_for(self, params):
+        """
+        Chiave completa (versione, parametri). Va calcolata PRIMA della query:
+        se nel frattempo la versione cambia, il risultato resta sotto la vecchia.
+        """
+        return (self.version_fn(), params)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if not self.enabled:
+            return
+        self.backend.set(key, value, self.ttl if ttl is None else ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": getattr(self.backend, "evictions", 0),
+            "expirations": getattr(self.backend, "expirations", 0),
+            "data_version": _version_value,
+        }
+
+
+search_cache = ResultCache()
@@ -0,0 +1,205 @@
+# utils_clicks.py
+# ============================================================
+# Ingestione click (/track_click) bufferizzata e asincrona
+#   • Coda in-process limitata: l'endpoint accoda e risponde subito
+#   • Flusher in background: insert_many a soglia di dimensione
+#     (CLICK_FLUSH_SIZE) o di tempo (CLICK_FLUSH_SECONDS)
+#   • Coda piena: attesa breve (backpressure, CLICK_ENQUEUE_TIMEOUT_MS)
+#     poi scarto del click nuovo ("newest") o del più vecchio ("oldest")
+#   • Batch falliti ritentati CLICK_MAX_RETRIES volte, poi scartati;
+#     insert_many assegna gli _id sui dict, quindi un retry dopo una
+#     scrittura parziale dà duplicate key (11000) = click già salvati
+#   • Flush allo shutdown (atexit) + contatori per /health
+#   • Fork-safe: il thread parte al primo click di ogni worker
+# ============================================================
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+
+from utils_log import log_event
+
+CLICK_QUEUE_MAX = int(os.getenv("CLICK_QUEUE_MAX", "10000"))
+CLICK_FLUSH_SIZE = int(os.getenv("CLICK_FLUSH_SIZE", "500"))
+CLICK_FLUSH_SECONDS = float(os.getenv("CLICK_FLUSH_SECONDS", "2"))
+CLICK_ENQUEUE_TIMEOUT_MS = int(os.getenv("CLICK_ENQUEUE_TIMEOUT_MS", "0"))
+CLICK_DROP_POLICY = os.getenv("CLICK_DROP_POLICY", "newest")  # newest | oldest
+CLICK_MAX_RETRIES = int(os.getenv("CLICK_MAX_RETRIES", "3"))
+
+# tempo massimo per svuotare la coda allo shutdown
+CLICK_SHUTDOWN_SECONDS = float(os.getenv("CLICK_SHUTDOWN_SECONDS", "5"))
+
+
+class ClickBuffer:
+    def __init__(self, get_collection, maxsize=CLICK_QUEUE_MAX, flush_size=CLICK_FLUSH_SIZE,
+                 flush_seconds=CLICK_FLUSH_SECONDS, drop_policy=CLICK_DROP_POLICY,
+                 enqueue_timeout_ms=CLICK_ENQUEUE_TIMEOUT_MS):
+        """get_collection: callable -> collection di destinazione (risolta a ogni flush)."""
+        self._get_collection = get_collection
+        self.flush_size = max(1, int(flush_size))
+        self.flush_seconds = float(flush_seconds)
+        self.drop_policy = drop_policy if drop_policy in ("newest", "oldest") else "newest"
+        self.enqueue_timeout = max(0, enqueue_timeout_ms) / 1000
+
+        self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_at = None
+        self.last_error = None
+
+        atexit.register(self.close)
+
+    # --------------------------------------------------------
+    # Produttore (endpoint)
+    # --------------------------------------------------------
+    def submit(self, doc):
+        """Accoda un click. False se scartato (coda piena)."""
+        self._ensure_thread()
+        try:
+            if self.enqueue_timeout:
+                self._queue.put(doc, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(doc)
+        except queue.Full:
+            if self.drop_policy != "oldest":
+                self._count("dropped")
+                return False
+            # via il più vecchio, dentro il nuovo
+            try:
+                self._queue.get_nowait()
+                self._count("dropped")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(doc)
+            except queue.Full:
+                self._count("dropped")
+                return False
+
+        self._count("enqueued")
+        return True
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    # --------------------------------------------------------
+    # Flusher
+    # --------------------------------------------------------
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+                return
+            if self._stop.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, name="click-flusher", daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+
+    def _next_batch(self):
+        """Blocca fino a flush_size click o flush_seconds dal primo."""
+        batch = []
+        deadline = None
+        while len(batch) < self.flush_size:
+            if self._stop.is_set() and self._queue.empty():
+                break
+            timeout = 0.5 if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                # poll breve per accorgersi dello stop
+                batch.append(self._queue.get(timeout=min(timeout, 0.5)))
+            except queue.Empty:
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_seconds
+        return batch
+
+    @staticmethod
+    def _only_duplicates(e):
+        """True se il bulk è fallito solo per _id già presenti (click già scritti)."""
+        details = e.details or {}
+        errors = details.get("writeErrors") or []
+        return bool(errors) and not details.get("writeConcernErrors") \
+            and all(err.get("code") == 11000 for err in errors)
+
+    def _write(self, batch):
+        for attempt in range(CLICK_MAX_RETRIES + 1):
+            try:
+                try:
+                    self._get_collection().insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # ordered=False: tutti gli altri documenti sono stati inseriti
+                    if not self._only_duplicates(e):
+                        raise
+                self._count("flushed", len(batch))
+                self._count("batches")
+                self.last_flush_at = time.time()
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                if attempt < CLICK_MAX_RETRIES and not self._stop.is_set():
+                    time.sleep(min(5, 0.5 * 2 ** attempt))
+        self._count("failed", len(batch))
+        log_event("clicks", f"❌ {len(batch)} click persi (insert_many fallito): {self.last_error}", "ERROR")
+        return False
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    # --------------------------------------------------------
+    # Shutdown
+    # --------------------------------------------------------
+    def close(self, timeout=CLICK_SHUTDOWN_SECONDS):
+        """Ferma il flusher e scrive quanto resta in coda."""
+        self._stop.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout)
+
+        # thread non partito in questo processo (o bloccato): svuota qui
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.flush_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    # --------------------------------------------------------
+    # Stats
+    # --------------------------------------------------------
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "drop_policy": self.drop_policy,
+            "last_flush_at": self.last_flush_at,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,102 @@
+# utils_cursor.py
+# ============================================================
+# Paginazione keyset ("search after") per /search
+#   • Token opaco = ultima chiave di sort della pagina (+ sort, pagina,
+#     modalità di retrieval scelta a pagina 1: $text o solo regex)
+#   • La pagina successiva è un range seek, niente $skip
+#   • Gestione null come nel sort Mongo (null < qualsiasi valore)
+# ============================================================
+
+import base64
+from datetime import datetime
+
+from bson import ObjectId, json_util
+
+
+def encode_cursor(mode, values, page, regex_only=False):
+    """
+    mode = nome del sort (score/date/...), values = chiave di sort dell'annuncio confine.
+    regex_only: la query è passata al solo regex a pagina 1 -> anche le successive.
+    """
+    data = {"m": mode, "k": list(values), "p": int(page)}
+    if regex_only:
+        data["r"] = 1
+    payload = json_util.dumps(data)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# valori ammessi nella chiave: mai documenti / operatori ({"$gt": ...}) dal token
+_KEY_TYPES = (str, int, float, ObjectId, datetime)
+
+
+def _valid_key_value(v):
+    return v is None or (isinstance(v, _KEY_TYPES) and not isinstance(v, bool))
+
+
+def decode_cursor(token, mode=None, specs=None):
+    """
+    Ritorna {"m", "k", "p", "r"} oppure None se il token è invalido / di un altro sort.
+    specs = {mode: spec}: il sort deve essere noto e la chiave lunga quanto il suo spec.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json_util.loads(raw.decode("utf-8"))
+    except Exception:
+        # base64 / json / estensioni bson ($oid, $date...) malformati
+        return None
+
+    if not isinstance(data, dict) or not isinstance(data.get("k"), list):
+        return None
+    m, k, p, r = data.get("m"), data["k"], data.get("p"), data.get("r", 0)
+    if not isinstance(m, str) or (mode is not None and m != mode):
+        return None
+    if specs is not None and (m not in specs or len(k) != len(specs[m])):
+        return None
+    if not isinstance(p, int) or isinstance(p, bool) or p < 1:
+        return None
+    if r not in (0, 1) or isinstance(r, bool):
+        return None
+    if not all(_valid_key_value(v) for v in k):
+        return None
+    return {"m": m, "k": k, "p": p, "r": bool(r)}
+
+
+def sort_values(doc, spec):
+    return [doc.get(field) for field, _ in spec]
+
+
+def reverse_spec(spec):
+    return [(field, -direction) for field, direction in spec]
+
+
+def _beyond(field, direction, value):
+    """Condizione "viene dopo value" per un singolo campo (null = minimo)."""
+    if direction == 1:
+        if value is None:
+            return {field: {"$ne": None}}
+        return {field: {"$gt": value}}
+
+    if value is None:
+        return None  # niente viene dopo null in DESC
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def seek_match(spec, values):
+    """
+    Predicato keyset per sort multi-campo:
+      (f1 dopo v1) OR (f1 = v1 AND f2 dopo v2) OR ...
+    """
+    clauses = []
+    equal = []
+
+    for (field, direction), value in zip(spec, values):
+        cond = _beyond(field, direction, value)
+        if cond is not None:
+            clauses.append({"$and": equal + [cond]} if equal else cond)
+        equal = equal + [{field: value}]
+
+    if not clauses:
+        return {"_id": {"$exists": False}}  # nessun documento dopo il cursore
+    return {"$or": clauses} if len(clauses) > 1 else clauses[0]
@@ -0,0 +1,55 @@
+# utils_dates.py
+# ============================================================
+# Date degli annunci (updated_at / created_at / expired_at / ...)
+#   • Formato unico in DB: ISO 8601 UTC a larghezza fissa
+#     ("2026-10-17T22:58:23.123456+00:00") -> ordine lessicografico
+#     = cronologico: i sort / indici di /search lavorano sui campi
+#     grezzi (SORT_SPECS), senza $convert
+#   • parse_dt: legge anche i formati legacy (BSON Date, "Z", senza
+#     fuso, "gg/mm/aaaa", epoch in ms come $convert)
+#
+# Chi scrive una data usa iso_utc(); backfill_dates.py riallinea
+# i documenti già in DB.
+# ============================================================
+
+from datetime import datetime, UTC
+
+_LEGACY_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+
+
+def parse_dt(value):
+    """datetime aware (UTC se senza fuso) oppure None se value non è una data."""
+    if value is None or value == "" or isinstance(value, bool):
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, (int, float)):
+        # come $convert: numero = millisecondi dall'epoch
+        try:
+            dt = datetime.fromtimestamp(value / 1000, UTC)
+        except (OverflowError, OSError, ValueError):
+            return None
+    elif isinstance(value, str):
+        s = value.strip()
+        try:
+            dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+        except ValueError:
+            for fmt in _LEGACY_FORMATS:
+                try:
+                    dt = datetime.strptime(s, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    else:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
+
+
+def iso_utc(value=None):
+    """Data nel formato del DB (adesso se value=None); None se value non è una data."""
+    dt = datetime.now(UTC) if value is None else parse_dt(value)
+    if dt is None:
+        return None
+    return dt.astimezone(UTC).isoformat(timespec="microseconds")
@@ -4,17 +4,20 @@
 # ============================================================
 
 import os
-from datetime import datetime, UTC
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from datetime import datetime, timedelta
 
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import utils_learned_store
 from utils_log import log_event
+from utils_mongo import get_collection
+from utils_cache import bump_data_version
+from utils_dates import iso_utc
+from utils_price import price_fields
+from utils_rank import RECENCY_BUCKETS, rank_fields
 from detect_category import detect_category
 
-load_dotenv()
-
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "database_vintage"
 COLLECTION_NAME = "annunci"
 FALSE_POSITIVE_COLLECTION = "false_positives"
 
@@ -33,83 +36,183 @@ last_db_stats = {
 
 
 # ============================================================
-# SALVATAGGIO ANNUNCI
+# SALVATAGGIO ANNUNCI (bulk upsert)
 # ============================================================
 
-def salva_annunci_mongo(items, source="unknown"):
+# operazioni per bulk_write (1 round trip per chunk invece che per annuncio)
+DB_BULK_SIZE = int(os.getenv("DB_BULK_SIZE", "500"))
+
+
+def _prepara_upsert(doc, now_iso):
+    """UpdateOne upsert per un annuncio (stesso documento del vecchio update_one)."""
+    # ---------------------------------------------------
+    # CATEGORIA (protetta)
+    # ---------------------------------------------------
+    try:
+        doc["category"] = detect_category(doc)
+    except Exception:
+        doc["category"] = doc.get("category", "vario")
+
+    # Documento da inserire
+    insert_doc = doc.copy()
+
+    # updated_at non deve stare nel setOnInsert
+    insert_doc.pop("updated_at", None)
+
+    if "is_removed" not in insert_doc:
+        insert_doc["is_removed"] = False
+
+    # Prezzo numerico canonico (se il chiamante non l'ha già calcolato)
+    if "price_num" not in insert_doc:
+        insert_doc.update(price_fields(insert_doc.get("price_value")))
+
+    # rank_score sul gradino "ultime 24h" (updated_at = adesso); per gli
+    # annunci già in DB vintage_score può differire da quello salvato:
+    # rank_next_at = adesso li fa riallineare al prossimo rank_scores.py
+    rank = rank_fields({**insert_doc, "updated_at": now_iso})
+    rank["rank_next_at"] = datetime.fromisoformat(now_iso)
+
+    return UpdateOne(
+        {"hash": doc["hash"]},
+        {
+            "$setOnInsert": insert_doc,
+            "$set": {"updated_at": now_iso, **rank}
+        },
+        upsert=True
+    )
+
+
+def _scrivi_chunk(col, ops, docs, source, stats):
     """
-    Salva o aggiorna gli annunci nel DB con upsert intelligente.
+    bulk_write(ordered=False) di un chunk.
+    Un errore su un annuncio NON blocca gli altri: i writeErrors
+    vengono contati e loggati uno per uno.
+    """
+    try:
+        res = col.bulk_write(ops, ordered=False)
+        details = {
+            "nUpserted": res.upserted_count,
+            "nMatched": res.matched_count,
+            "nModified": res.modified_count,
+            "writeErrors": [],
+        }
+    except BulkWriteError as bwe:
+        details = bwe.details
+
+    stats["inserted"] += details.get("nUpserted", 0)
+    stats["updated"] += details.get("nModified", 0)
+    # match senza modifiche = già identico
+    stats["skipped"] += max(0, details.get("nMatched", 0) - details.get("nModified", 0))
+
+    for err in details.get("writeErrors", []):
+        stats["errors"] += 1
+        doc = docs[err.get("index", 0)]
+        log_event(source, f"❌ Errore inserimento [{doc.get('hash')}]: {err.get('errmsg')}", "ERROR")
+
+
+def salva_annunci_mongo(items, source="unknown", bulk_size=None):
+    """
+    Salva o aggiorna gli annunci nel DB con upsert intelligente,
+    a chunk di bulk_size operazioni (default DB_BULK_SIZE).
+    items può essere una lista o un iterabile in streaming (utils_pipeline).
     """
     global last_db_stats
 
+    bulk_size = max(1, int(bulk_size or DB_BULK_SIZE))
+
     try:
-        client = MongoClient(MONGO_URI)
-        col = client[DB_NAME][COLLECTION_NAME]
+        col = get_collection(COLLECTION_NAME)
     except Exception as e:
         log_event(source, f"❌ Errore connessione MongoDB: {e}", "ERROR")
         return 0, 0, 0, 1
 
-    tot = len(items)
-    inseriti = aggiornati = skipped = errori = 0
+    tot = len(items) if hasattr(items, "__len__") else None
+    stats = {"inserted": 0, "updated": 0, "skipped": 0, "errors": 0}
 
-    log_event(source, f"🚀 Avvio salvataggio di {tot} annunci su MongoDB")
+    log_event(source, f"🚀 Avvio salvataggio di {tot if tot is not None else 'stream di'} annunci su MongoDB (bulk {bulk_size})")
 
+    now_iso = iso_utc()
+    seen_hashes = set()
+    ops, docs = [], []
+
+    def flush(i):
+        try:
+            _scrivi_chunk(col, ops, docs, source, stats)
+        except Exception as e:
+            # errore di rete / server: tutto il chunk è perso
+            stats["errors"] += len(ops)
+            log_event(source, f"❌ Errore bulk_write ({len(ops)} annunci): {e}", "ERROR")
+        ops.clear()
+        docs.clear()
+        log_event(source, f"📦 {i}/{tot} processati" if tot is not None else f"📦 {i} processati")
+
+    i = 0
     for i, doc in enumerate(items, start=1):
         try:
             # ---------------------------------------------------
             # HASH mancante → skip
             # ---------------------------------------------------
             if not doc.get("hash"):
-                skipped += 1
-                continue
-
-            # ---------------------------------------------------
-            # CATEGORIA (protetta)
-            # ---------------------------------------------------
-            try:
-                doc["category"] = detect_category(doc)
-            except Exception:
-                doc["category"] = doc.get("category", "vario")
-
-            # Documento da inserire
-            insert_doc = doc.copy()
-
-            # updated_at non deve stare nel setOnInsert
-            insert_doc.pop("updated_at", None)
-
-            if "is_removed" not in insert_doc:
-                insert_doc["is_removed"] = False
-
-            now_iso = datetime.now(UTC).isoformat()
-
-            # ---------------------------------------------------
-            # Upsert pulito
-            # ---------------------------------------------------
-            res = col.update_one(
-                {"hash": doc["hash"]},
-                {
-                    "$setOnInsert": insert_doc,
-                    "$set": {"updated_at": now_iso}
-                },
-                upsert=True
-            )
-
-            if res.upserted_id:
-                inseriti += 1
-            elif res.modified_count > 0:
-                aggiornati += 1
+                stats["skipped"] += 1
+            # hash già visto in questo run: in sequenza sarebbe un update
+            elif doc["hash"] in seen_hashes:
+                stats["updated"] += 1
             else:
-                skipped += 1
+                seen_hashes.add(doc["hash"])
+                ops.append(_prepara_upsert(doc, now_iso))
+                docs.append(doc)
 
         except Exception as e:
-            errori += 1
+            stats["errors"] += 1
             log_event(source, f"❌ Errore inserimento: {e}", "ERROR")
 
-        # Log ogni 100
-        if i % 100 == 0 or i == tot:
-            log_event(source, f"📦 {i}/{tot} processati")
+        if len(ops) >= bulk_size:
+            flush(i)
+
+    if ops:
+        flush(i)
+    tot = i
+
+    # annunci saltati dal filtro dedup perché già noti: solo updated_at
+    # (l'unico effetto dell'upsert sugli esistenti) + rank_score riportato
+    # sul primo gradino, dal vintage_score già salvato
+    from utils_normalize import drain_known_hashes, forget_hashes
+
+    first_days, first_bonus = RECENCY_BUCKETS[0]
+    touch = [{"$set": {
+        "updated_at": now_iso,
+        "rank_score": {"$add": [{"$ifNull": ["$vintage_score", 0]}, first_bonus]},
+        "era_weight": {"$cond": [{"$ne": ["$era", "vintage_generico"]}, 1, 0]},
+        "rank_next_at": datetime.fromisoformat(now_iso) + timedelta(days=first_days),
+    }}]
+
+    known = drain_known_hashes()
+    forgotten = 0
+    for j in range(0, len(known), bulk_size):
+        hashes = known[j:j + bulk_size]
+        try:
+            res = col.update_many({"hash": {"$in": hashes}}, touch)
+            stats["updated"] += res.modified_count
+            if res.matched_count >= len(hashes):
+                continue
+
+            # noti al filtro ma assenti in DB (scrittura persa / falso
+            # positivo): il filtro li dimentica, la prossima occorrenza
+            # viene normalizzata e inserita con l'upsert normale
+            present = {d["hash"] for d in col.find({"hash": {"$in": hashes}}, {"_id": 0, "hash": 1})}
+            missing = [h for h in hashes if h not in present]
+            forget_hashes(missing)
+            forgotten += len(missing)
+        except Exception as e:
+            log_event(source, f"❌ Errore aggiornamento annunci noti: {e}", "ERROR")
+    if known:
+        log_event(source, f"♻️ {len(known)} annunci già noti: aggiornato solo updated_at"
+                          + (f", {forgotten} assenti in DB (reinseriti al prossimo passaggio)" if forgotten else ""))
 
-    client.close()
+    inseriti = stats["inserted"]
+    aggiornati = stats["updated"]
+    skipped = stats["skipped"]
+    errori = stats["errors"]
 
     # ======================================================
     # Stats globali aggiornate
@@ -122,6 +225,10 @@ def salva_annunci_mongo(items, source="unknown"):
         "total": tot
     }
 
+    # Nuovi dati -> invalida cache /search di tutti i worker
+    if inseriti or aggiornati:
+        bump_data_version(f"salva_annunci_mongo:{source}")
+
     # Log finale
     log_event(source, "===== RISULTATO SALVATAGGIO =====")
     log_event(source, f"✅ Inseriti: {inseriti}")
@@ -140,14 +247,13 @@ def salva_annunci_mongo(items, source="unknown"):
 
 def mark_as_removed_and_learn(item_hash, raw_title):
     try:
-        client = MongoClient(MONGO_URI)
-        col = client[DB_NAME][COLLECTION_NAME]
-        fp_col = client[DB_NAME][FALSE_POSITIVE_COLLECTION]
+        col = get_collection(COLLECTION_NAME)
+        fp_col = get_collection(FALSE_POSITIVE_COLLECTION)
     except Exception as e:
         log_event("system", f"❌ Errore connessione DB: {e}", "ERROR")
         return
 
-    now_iso = datetime.now(UTC).isoformat()
+    now_iso = iso_utc()
 
     # --------------------------------------------------------
     # Segna come rimosso
@@ -156,6 +262,7 @@ def mark_as_removed_and_learn(item_hash, raw_title):
         {"hash": item_hash},
         {"$set": {"is_removed": True, "removed_at": now_iso}}
     )
+    bump_data_version("mark_as_removed")
 
     # --------------------------------------------------------
     # Salva nei falsi positivi
@@ -175,24 +282,10 @@ def mark_as_removed_and_learn(item_hash, raw_title):
     # --------------------------------------------------------
     # Learning anti-moderno migliorato
     # --------------------------------------------------------
-    from utils_normalize import load_json, save_json
-
-    data = load_json("modern_learned.json")
-    if not isinstance(data, dict):
-        data = {"phrases": []}
-    if "phrases" not in data:
-        data["phrases"] = []
-
     words = [w for w in raw_title.lower().split() if len(w) >= 4]
 
-    for w in words:
-        data["phrases"].append(w)
-
-    # rimuovi duplicati e ordina
-    data["phrases"] = sorted(set(data["phrases"]))
-
-    save_json("modern_learned.json", data)
-
-    client.close()
+    # store transazionale condiviso (dedup + versione per il classifier)
+    utils_learned_store.add_phrases(words, source="mark_as_removed")
+    utils_learned_store.record_removal(raw_title, detected=words, item_hash=item_hash, source="mark_as_removed")
 
     log_event("system", f"🧹 Rimosso manualmente + addestrato su: {raw_title}")
@@ -0,0 +1,269 @@
+# utils_dedup.py
+# ============================================================
+# Dedup annunci tra run (sostituisce il set _hash_cache)
+#   • Scalable Bloom filter: slice di capacità crescente (x2) con
+#     tasso di falsi positivi decrescente (x0.5) -> FP totale
+#     <= DEDUP_ERROR_RATE
+#   • Memoria limitata: oltre DEDUP_MAX_ITEMS si scarta la slice
+#     più vecchia (quegli annunci verranno solo rielaborati)
+#   • Persistito su disco tra i run (scrittura atomica)
+#   • Seed dagli hash già in Mongo ("annunci")
+#   • forget(): hash da far ripassare (noti al filtro ma assenti in
+#     DB) -> seen() False finché add() non li registra di nuovo
+#   • Statistiche lookup / hit / hit rate
+#
+# Uso:
+#   python utils_dedup.py --seed     # ricostruisce dal DB
+#   python utils_dedup.py --stats
+# ============================================================
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+
+from utils_log import log_event
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") != "0"
+DEDUP_FILTER_PATH = os.getenv("DEDUP_FILTER_PATH", os.path.join(BASE_DIR, "dedup_filter.bin"))
+DEDUP_ERROR_RATE = float(os.getenv("DEDUP_ERROR_RATE", "0.001"))
+DEDUP_INITIAL_CAPACITY = int(os.getenv("DEDUP_INITIAL_CAPACITY", "100000"))
+DEDUP_MAX_ITEMS = int(os.getenv("DEDUP_MAX_ITEMS", "5000000"))
+DEDUP_MAX_FORGOTTEN = int(os.getenv("DEDUP_MAX_FORGOTTEN", "100000"))
+
+_GROWTH = 2
+_TIGHTENING = 0.5
+
+
+def _key_hashes(key):
+    """Due hash a 64 bit per il double hashing (h1 + i*h2)."""
+    d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little") | 1
+
+
+class _BloomSlice:
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.m = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.k = max(1, int(round(self.m / capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.m + 7) // 8)
+        self.count = count
+
+    def _positions(self, h1, h2):
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def contains(self, h1, h2):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h1, h2))
+
+    def add(self, h1, h2):
+        bits = self.bits
+        for p in self._positions(h1, h2):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def full(self):
+        return self.count >= self.capacity
+
+
+class DedupFilter:
+    def __init__(self, path=None, error_rate=DEDUP_ERROR_RATE,
+                 initial_capacity=DEDUP_INITIAL_CAPACITY, max_items=DEDUP_MAX_ITEMS):
+        """path=None -> solo in memoria (niente load/save)."""
+        self.path = path
+        self.error_rate = error_rate
+        self.initial_capacity = max(1, int(initial_capacity))
+        self.max_items = max(self.initial_capacity, int(max_items))
+        self.slices = []
+        self.dropped = 0
+        self.loaded = False
+        # hash "dimenticati": un Bloom filter non rimuove, si scavalca
+        self.forgotten = {}
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.lookups = 0
+        self.hits = 0
+        self.added = 0
+
+        if path:
+            self.load()
+
+    # --------------------------------------------------------
+    # Slice
+    # --------------------------------------------------------
+    def _new_slice(self):
+        n = len(self.slices) + self.dropped
+        # dopo le prime rotazioni le slice smettono di crescere (max_items / 2)
+        n_cap = max(0, int(math.log(max(1, self.max_items // 2) / self.initial_capacity, _GROWTH)))
+        n = min(n, n_cap)
+        # FP slice i = p0 * r^i, con p0 = p * (1 - r) -> somma <= p
+        return _BloomSlice(
+            self.initial_capacity * _GROWTH ** n,
+            self.error_rate * (1 - _TIGHTENING) * _TIGHTENING ** n,
+        )
+
+    def _capacity(self):
+        return sum(s.capacity for s in self.slices)
+
+    # --------------------------------------------------------
+    # API
+    # --------------------------------------------------------
+    def seen(self, key):
+        """True se key è (probabilmente) già stato registrato."""
+        h1, h2 = _key_hashes(key)
+        with self._lock:
+            self.lookups += 1
+            if key in self.forgotten:
+                return False
+            if any(s.contains(h1, h2) for s in self.slices):
+                self.hits += 1
+                return True
+            return False
+
+    def add(self, key):
+        """Registra key. Ritorna False se era già presente (duplicato)."""
+        h1, h2 = _key_hashes(key)
+        with self._lock:
+            forgotten = key in self.forgotten
+            if forgotten:
+                del self.forgotten[key]
+            if any(s.contains(h1, h2) for s in self.slices):
+                if not forgotten:
+                    return False
+                # bit già accesi: basta togliere l'eccezione
+                self.added += 1
+                self._dirty = True
+                return True
+            if not self.slices or self.slices[-1].full():
+                self.slices.append(self._new_slice())
+                # limite memoria: via la slice più vecchia
+                while len(self.slices) > 1 and self._capacity() > self.max_items:
+                    self.slices.pop(0)
+                    self.dropped += 1
+            self.slices[-1].add(h1, h2)
+            self.added += 1
+            self._dirty = True
+            return True
+
+    def forget(self, keys):
+        """Fa ripassare keys: seen() False e add() True alla prossima occorrenza."""
+        with self._lock:
+            for key in keys:
+                self.forgotten.pop(key, None)
+                self.forgotten[key] = None
+            # limite memoria: via i più vecchi (torneranno solo dopo la rotazione delle slice)
+            while len(self.forgotten) > DEDUP_MAX_FORGOTTEN:
+                del self.forgotten[next(iter(self.forgotten))]
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.slices = []
+            self.dropped = 0
+            self.forgotten = {}
+            self._dirty = True
+
+    def __len__(self):
+        return sum(s.count for s in self.slices)
+
+    # --------------------------------------------------------
+    # Persistenza: 1 riga JSON di header + bit delle slice
+    # --------------------------------------------------------
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                header = json.loads(f.readline().decode("utf-8"))
+                slices = []
+                for meta in header["slices"]:
+                    s = _BloomSlice(meta["capacity"], meta["error_rate"], count=meta["count"])
+                    s.bits = bytearray(f.read(len(s.bits)))
+                    if len(s.bits) != (s.m + 7) // 8:
+                        raise ValueError("file troncato")
+                    slices.append(s)
+        except Exception as e:
+            log_event("dedup", f"⚠️ Filtro dedup illeggibile, riparto vuoto: {e}", "WARNING")
+            return False
+
+        with self._lock:
+            self.slices = slices
+            self.dropped = header.get("dropped", 0)
+            self.forgotten = dict.fromkeys(header.get("forgotten", ()))
+            self.loaded = True
+        return True
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            header = {
+                "error_rate": self.error_rate,
+                "dropped": self.dropped,
+                "forgotten": list(self.forgotten),
+                "slices": [{"capacity": s.capacity, "error_rate": s.error_rate, "count": s.count}
+                           for s in self.slices],
+            }
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                for s in self.slices:
+                    f.write(s.bits)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    # --------------------------------------------------------
+    # Seed da Mongo
+    # --------------------------------------------------------
+    def seed_from_mongo(self, collection=None, batch_size=10000):
+        if collection is None:
+            from utils_mongo import get_collection
+            collection = get_collection("annunci")
+
+        n = 0
+        cursor = collection.find({"hash": {"$type": "string"}}, {"_id": 0, "hash": 1}).batch_size(batch_size)
+        for doc in cursor:
+            self.add(doc["hash"])
+            n += 1
+        log_event("dedup", f"🌱 Filtro dedup: {n} hash caricati da Mongo")
+        return n
+
+    # --------------------------------------------------------
+    # Stats
+    # --------------------------------------------------------
+    def stats(self):
+        return {
+            "enabled": DEDUP_ENABLED,
+            "items": len(self),
+            "slices": len(self.slices),
+            "dropped_slices": self.dropped,
+            "memory_mb": round(sum(len(s.bits) for s in self.slices) / 1_048_576, 2),
+            "error_rate": self.error_rate,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "added": self.added,
+            "forgotten": len(self.forgotten),
+            "path": self.path,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filtro dedup annunci")
+    parser.add_argument("--seed", action="store_true", help="ricostruisce il filtro dagli hash in Mongo")
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+
+    f = DedupFilter(DEDUP_FILTER_PATH)
+    if args.seed:
+        f.clear()
+        f.seed_from_mongo()
+        f.save()
+    print(json.dumps(f.stats(), indent=2))
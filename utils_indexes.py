@@ -0,0 +1,265 @@
+# utils_indexes.py
+# ============================================================
+# Indici MongoDB dichiarati in un solo posto + verifica dei piani
+#   • INDEXES: tutti gli indici delle collection usate dall'app
+#     (annunci, false_positives, auto_synonyms, click_cooc), inclusi
+#     quelli dei job (backfill_price, rank_scores, mine_synonyms) e
+#     l'indice testo di utils_search_text
+#   • ensure_indexes(): creazione idempotente (deploy / release);
+#     conflitti di opzioni e duplicati su indici unique = errore
+#   • verify_query_plans(): explain() delle query "calde" con la
+#     stessa forma di quelle dell'app (utils_search_query, senza
+#     importare app.py); fallisce se un piano fa COLLSCAN o un sort
+#     in memoria (stage SORT / $sort). Controllo separato dal deploy:
+#     su collection vuote o piccole il planner può legittimamente
+#     preferire un COLLSCAN
+#
+# Uso:
+#   python utils_indexes.py            # crea gli indici (release nel Procfile)
+#   python utils_indexes.py --verify   # solo explain (CI / a mano, su un DB con dati reali)
+# ============================================================
+
+import argparse
+import sys
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from backfill_price import PRICE_INDEXES
+from mine_synonyms import CLICK_INDEXES, COOC_INDEXES
+from rank_scores import RANK_INDEXES
+from utils_cursor import seek_match
+from utils_log import log_event
+from utils_mongo import get_collection, get_db
+from utils_search_query import SEARCH_PER_PAGE, SORT_SPECS, visible_match
+from utils_search_text import (
+    TEXT_INDEX_KEYS, TEXT_INDEX_NAME, TEXT_INDEX_WEIGHTS, build_regex_match, build_text_match,
+)
+
+COLLECTION_NAME = "annunci"
+
+# stesso ordine di SORT_SPECS["score"] (equality sul filtro, poi sort)
+_RANK_SORT = [("rank_score", DESCENDING), ("era_weight", DESCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)]
+
+# collection -> [(chiavi, nome, opzioni)]
+INDEXES = {
+    COLLECTION_NAME: [
+        # upsert / report_noimage / remove_item per hash; partial: gli annunci
+        # senza hash (mai scritti da salva_annunci_mongo) non collidono
+        ([("hash", ASCENDING)], "hash_unique",
+         {"unique": True, "partialFilterExpression": {"hash": {"$exists": True}}}),
+        (TEXT_INDEX_KEYS, TEXT_INDEX_NAME,
+         {"weights": TEXT_INDEX_WEIGHTS, "default_language": "italian", "language_override": "text_language"}),
+        # sort "date" + refresh incrementale dell'indice trigrammi
+        ([("updated_at", DESCENDING), ("_id", DESCENDING)], "updated_at_id", {}),
+        # eviction dall'indice trigrammi (scadenze / rimozioni non toccano updated_at)
+        ([("expired_at", DESCENDING)], "expired_at", {"sparse": True}),
+        ([("removed_at", DESCENDING)], "removed_at", {"sparse": True}),
+        # sort "tutti"
+        ([("created_at", DESCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], "created_updated_id", {}),
+        # sort "score" con filtro era / categoria / sorgente
+        ([("era", ASCENDING), *_RANK_SORT], "era_rank_score", {}),
+        ([("category", ASCENDING), *_RANK_SORT], "category_rank_score", {}),
+        ([("source", ASCENDING), *_RANK_SORT], "source_rank_score", {}),
+        *[(keys, name, {}) for keys, name in PRICE_INDEXES],
+        *RANK_INDEXES,
+    ],
+    "false_positives": [
+        ([("hash", ASCENDING)], "hash_unique", {"unique": True}),
+    ],
+    "auto_synonyms": [(keys, name, {}) for keys, name in CLICK_INDEXES],
+    "click_cooc": [(keys, name, {}) for keys, name in COOC_INDEXES],
+}
+
+# codici Mongo: IndexOptionsConflict / IndexKeySpecsConflict / DuplicateKey
+_CONFLICT_CODES = {85, 86}
+_DUPLICATE_KEY = 11000
+
+
+# ============================================================
+# Creazione
+# ============================================================
+
+def ensure_indexes(collections=None):
+    """Crea gli indici dichiarati. Ritorna la lista degli errori (vuota = ok)."""
+    errors = []
+    for col_name, indexes in INDEXES.items():
+        if collections and col_name not in collections:
+            continue
+        col = get_collection(col_name)
+        for keys, name, opts in indexes:
+            try:
+                col.create_index(keys, name=name, **opts)
+            except OperationFailure as e:
+                if e.code in _CONFLICT_CODES:
+                    msg = f"{col_name}.{name}: esiste già un indice con stesse chiavi/nome ma opzioni diverse ({e})"
+                elif e.code == _DUPLICATE_KEY:
+                    msg = f"{col_name}.{name}: valori duplicati, indice unique non creabile ({e})"
+                else:
+                    msg = f"{col_name}.{name}: {e}"
+                log_event("indexes", f"❌ {msg}", "ERROR")
+                errors.append(msg)
+
+        declared = {name for _, name, _ in indexes} | {"_id_"}
+        extra = sorted(set(col.index_information()) - declared)
+        if extra:
+            # non rimossi in automatico: possono servire a query fuori dall'app
+            log_event("indexes", f"⚠️ {col_name}: indici non dichiarati {extra}", "WARNING")
+
+    if not errors:
+        log_event("indexes", "✅ Indici pronti")
+    return errors
+
+
+# ============================================================
+# Verifica piani (explain)
+# ============================================================
+
+# valori fittizi per le chiavi dei cursori keyset
+_SAMPLE_KEY = {
+    "rank_score": 1.5, "era_weight": 1, "price_sort": 50.0, "price_num": 50.0,
+    "updated_at": "2025-01-01T00:00:00+00:00", "created_at": "2025-01-01T00:00:00+00:00",
+}
+_SAMPLE_HASH = "__explain__"
+
+
+def _plan_stages(node, out, in_pipeline=False):
+    """Stage del piano vincente (classic / SBE / aggregate); rejectedPlans ignorati."""
+    if isinstance(node, dict):
+        stage = node.get("stage")
+        if isinstance(stage, str):
+            out.append(f"{stage}({node['indexName']})" if node.get("indexName") else stage)
+        for k, v in node.items():
+            if k in ("rejectedPlans", "allPlansExecution"):
+                continue
+            if in_pipeline and k.startswith("$") and k != "$cursor":
+                out.append(k)
+            _plan_stages(v, out, in_pipeline=k == "stages" and isinstance(v, list))
+    elif isinstance(node, list):
+        for v in node:
+            _plan_stages(v, out, in_pipeline)
+    return out
+
+
+def _bad_stages(stages, allow=()):
+    bad = []
+    for s in stages:
+        name = s.split("(")[0]
+        if name in ("COLLSCAN", "SORT", "$sort") and name not in allow:
+            bad.append(name)
+    return bad
+
+
+def _search_pipeline(scope="", sort="score", filters=None, after=False, q=""):
+    """Pipeline principale di /search (stessa forma di app._main_pipeline), prima pagina o seek."""
+    sort_mode = "tutti" if scope == "tutti" else sort
+    spec = SORT_SPECS[sort_mode]
+    match = {**visible_match(scope), **(filters or {})}
+
+    stages = [{"$match": match}]
+    if q:
+        # $text nel primo $match, il regex gira solo sui candidati
+        stages = [{"$match": {**match, **build_text_match([q], str.lower)}},
+                  {"$match": build_regex_match([q], str.lower)}]
+    if after:
+        stages.append({"$match": seek_match(spec, [_SAMPLE_KEY.get(f, ObjectId()) for f, _ in spec])})
+    stages += [{"$sort": dict(spec)}, {"$limit": SEARCH_PER_PAGE}]
+    return {"aggregate": COLLECTION_NAME, "pipeline": stages, "cursor": {}}
+
+
+def _search_shapes():
+    """(etichetta, comando explain, stage ammessi) per /search, senza importare l'app."""
+    shapes = []
+    for sort in ("score", "date", "price_asc", "price_desc"):
+        shapes.append((f"search sort={sort}", _search_pipeline(sort=sort), ()))
+        shapes.append((f"search sort={sort} pagina 2 (cursore)", _search_pipeline(sort=sort, after=True), ()))
+    shapes += [
+        ("search scope=tutti", _search_pipeline(scope="tutti"), ()),
+        ("search scope=tutti pagina 2 (cursore)", _search_pipeline(scope="tutti", after=True), ()),
+        ("search era", _search_pipeline(filters={"era": "anni_70"}), ()),
+        ("search categoria", _search_pipeline(filters={"category": "arredamento"}), ()),
+        ("search sorgente", _search_pipeline(filters={"source": "ebay"}), ()),
+        ("search prezzo", _search_pipeline(sort="price_desc", filters={"price_num": {"$gte": 20, "$lte": 200}}), ()),
+        # con $text il sort lavora sui soli candidati dell'indice testo
+        ("search q", _search_pipeline(q="lampada"), ("SORT", "$sort")),
+        ("search q sort=price_asc", _search_pipeline(sort="price_asc", q="lampada"), ("SORT", "$sort")),
+    ]
+
+    # come app._fuzzy_prelim_match con i candidati dell'indice trigrammi
+    fuzzy_match = {**visible_match(), "_id": {"$in": [ObjectId()]}}
+    shapes.append(("fuzzy candidati (trigrammi)",
+                   {"find": COLLECTION_NAME, "filter": fuzzy_match, "limit": 2000}, ()))
+
+    # report_noimage: find_one_and_update per hash
+    shapes.append(("report_noimage", {
+        "findAndModify": COLLECTION_NAME,
+        "query": {"hash": _SAMPLE_HASH, "$nor": [{"status": "expired", "expired_reason": "deadlink"}]},
+        "update": {"$inc": {"noimage_hits": 1}},
+    }, ()))
+    return shapes
+
+
+def _job_shapes():
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    by_hash = {"hash": _SAMPLE_HASH}
+    return [
+        ("salva_annunci upsert", {"update": COLLECTION_NAME, "updates": [
+            {"q": by_hash, "u": {"$set": {"updated_at": now_iso}}, "upsert": True}]}, ()),
+        ("salva_annunci annunci noti", {"update": COLLECTION_NAME, "updates": [
+            {"q": {"hash": {"$in": [_SAMPLE_HASH]}}, "u": {"$set": {"updated_at": now_iso}}, "multi": True}]}, ()),
+        ("remove_item", {"delete": COLLECTION_NAME, "deletes": [{"q": by_hash, "limit": 1}]}, ()),
+        ("mark_as_removed", {"update": COLLECTION_NAME, "updates": [
+            {"q": by_hash, "u": {"$set": {"is_removed": True}}}]}, ()),
+        ("false_positives upsert", {"update": "false_positives", "updates": [
+            {"q": by_hash, "u": {"$set": {"added_at": now_iso}}, "upsert": True}]}, ()),
+        ("trigrammi refresh", {"find": COLLECTION_NAME, "filter": {"updated_at": {"$gt": now_iso}},
+                               "sort": {"updated_at": 1}}, ()),
+        ("trigrammi eviction", {"find": COLLECTION_NAME, "filter": {"$or": [
+            {"expired_at": {"$gt": now_iso}}, {"removed_at": {"$gt": now_iso}}]}}, ()),
+        ("rank_scores refresh", {"find": COLLECTION_NAME, "filter": {"rank_next_at": {"$lte": now}},
+                                 "sort": {"rank_next_at": 1}, "limit": 1000}, ()),
+        ("mine_synonyms click nuovi", {"find": "auto_synonyms", "filter": {"$or": [
+            {"created_at": {"$gt": now}}, {"created_at": now, "_id": {"$gt": ObjectId()}}]},
+            "sort": {"created_at": 1, "_id": 1}, "limit": 5000}, ()),
+        ("mine_synonyms prune", {"delete": "click_cooc", "deletes": [{"q": {"ws": {"$lt": 1.0}}, "limit": 0}]}, ()),
+    ]
+
+
+def verify_query_plans():
+    """explain() di ogni forma calda. Ritorna la lista dei fallimenti (vuota = ok)."""
+    db = get_db()
+    failures = []
+    for label, cmd, allow in _search_shapes() + _job_shapes():
+        try:
+            explain = db.command("explain", cmd, verbosity="queryPlanner")
+        except OperationFailure as e:
+            log_event("indexes", f"❌ {label}: explain fallito ({e})", "ERROR")
+            failures.append(f"{label}: {e}")
+            continue
+
+        stages = _plan_stages(explain, [])
+        bad = _bad_stages(stages, allow)
+        if bad:
+            log_event("indexes", f"❌ {label}: {' / '.join(sorted(set(bad)))} — piano {stages}", "ERROR")
+            failures.append(f"{label}: {sorted(set(bad))}")
+        else:
+            log_event("indexes", f"✅ {label}: {stages}")
+
+    if failures:
+        log_event("indexes", f"❌ {len(failures)} query senza indice adeguato", "ERROR")
+    else:
+        log_event("indexes", "✅ Tutte le query calde usano un indice (niente COLLSCAN / sort in memoria)")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indici MongoDB (+ verifica piani delle query calde)")
+    parser.add_argument("--verify", action="store_true",
+                        help="solo explain delle query calde, nessun indice creato (non nel deploy)")
+    args = parser.parse_args()
+
+    problems = verify_query_plans() if args.verify else ensure_indexes()
+    sys.exit(1 if problems else 0)
@@ -3,12 +3,14 @@
 #
 #  ✓ Integra modern_keywords_extended.json
 #  ✓ Evita duplicati tra extended e learned
+#  ✓ Frasi apprese + storico su utils_learned_store (SQLite WAL)
 #  ✓ Rilevamento potenziato modelli moderni
 #  ✓ Rafforzati i filtri smartphone / console / auto moderne
 # ============================================================
 
 import re, json, os
-from datetime import datetime, UTC
+
+import utils_learned_store
 
 
 # ------------------------------------------------------------
@@ -53,11 +55,6 @@ for group in modern_extended.values():
         EXTENDED_TERMS.add(item.lower())
 
 
-# dati di apprendimento automatico
-modern_data = load_json("modern_learned.json", {"phrases": [], "entries": []})
-LEARNED_TERMS = set(modern_data.get("phrases", []))
-
-
 
 # ------------------------------------------------------------
 #  LISTE STORICHE (safe)
@@ -122,7 +119,7 @@ MODERN_PATTERNS = [
 #  FUNZIONE PRINCIPALE
 # ------------------------------------------------------------
 
-def extract_modern_terms(title):
+def extract_modern_terms(title, item_hash=None):
     text = title.lower()
     hits = []
 
@@ -182,32 +179,18 @@ def extract_modern_terms(title):
     # --------------------------------------------------------
     if not hits:
         full = text.strip()
-
-        if full and full not in EXTENDED_TERMS and full not in LEARNED_TERMS:
-            modern_data["phrases"].append(full)
-
+        learned = [full] if full and full not in EXTENDED_TERMS else []
         hits = ["fallback_full_title"]
 
     else:
-        # salva ogni termine moderno trovato
-        for h in hits:
-            if h not in EXTENDED_TERMS and h not in LEARNED_TERMS:
-                modern_data["phrases"].append(h)
-
-
-    # --------------------------------------------------------
-    # 5) Registra entry completa (debug + storico)
-    # --------------------------------------------------------
-    modern_data["entries"].append({
-        "title": title,
-        "detected": hits,
-        "when": datetime.now(UTC).isoformat()
-    })
+        # salva ogni termine moderno trovato (i già appresi li scarta lo store)
+        learned = [h for h in hits if h not in EXTENDED_TERMS]
 
 
     # --------------------------------------------------------
-    # 6) SALVA
+    # 5) SALVA frasi + entry completa (debug + storico)
     # --------------------------------------------------------
-    save_json("modern_learned.json", modern_data)
+    utils_learned_store.add_phrases(learned, source="remove_item")
+    utils_learned_store.record_removal(title, detected=hits, item_hash=item_hash, source="remove_item")
 
     return hits
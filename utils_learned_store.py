@@ -0,0 +1,201 @@
+# utils_learned_store.py
+# ============================================================
+# Store termini moderni appresi + storico rimozioni (SQLite WAL)
+#   • Sostituisce le riscritture complete di modern_learned.json
+#     (utils_learn_modern + mark_as_removed_and_learn)
+#   • Transazioni: più worker gunicorn / ingest in parallelo
+#   • Frasi deduplicate (PRIMARY KEY), storico rimozioni limitato
+#   • Versione: incrementata quando entrano frasi nuove ->
+#     utils_normalize ricarica l'automa solo se cambia
+#   • Primo avvio: importa modern_learned.json esistente
+# ============================================================
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, UTC
+
+from utils_log import log_event
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEARNED_DB_PATH = os.getenv("LEARNED_DB_PATH", os.path.join(BASE_DIR, "learned_terms.db"))
+
+# righe di storico rimozioni conservate (le più vecchie vengono compattate)
+LEARNED_HISTORY_MAX = int(os.getenv("LEARNED_HISTORY_MAX", "20000"))
+
+LEGACY_JSON = os.path.join(BASE_DIR, "modern_learned.json")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS phrases (
+    phrase    TEXT PRIMARY KEY,
+    source    TEXT,
+    added_at  TEXT
+);
+CREATE TABLE IF NOT EXISTS removals (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_hash  TEXT,
+    title      TEXT,
+    detected   TEXT,
+    source     TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+
+
+# ============================================================
+# Connessione (una per processo, come utils_mongo)
+# ============================================================
+
+def _connect():
+    global _conn, _conn_pid
+
+    if _conn is not None and _conn_pid == os.getpid():
+        return _conn
+
+    conn = sqlite3.connect(LEARNED_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+
+    _conn, _conn_pid = conn, os.getpid()
+    _migrate_legacy_json(conn)
+    return conn
+
+
+def _now():
+    return datetime.now(UTC).isoformat()
+
+
+def _bump_version(conn):
+    conn.execute(
+        "INSERT INTO meta(key, value) VALUES('version', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+
+def _migrate_legacy_json(conn):
+    """Import una tantum di modern_learned.json (entrambi i formati storici)."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+        return
+
+    data = {}
+    if os.path.exists(LEGACY_JSON):
+        try:
+            with open(LEGACY_JSON, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            log_event("learn", f"⚠️ modern_learned.json illeggibile, non importato: {e}", "WARNING")
+
+    phrases = data if isinstance(data, list) else data.get("phrases", [])
+    entries = [] if isinstance(data, list) else data.get("entries", [])
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            conn.execute("COMMIT")
+            return
+        now = _now()
+        conn.executemany(
+            "INSERT OR IGNORE INTO phrases(phrase, source, added_at) VALUES(?, 'legacy_json', ?)",
+            [(str(p), now) for p in phrases if p],
+        )
+        conn.executemany(
+            "INSERT INTO removals(title, detected, source, created_at) VALUES(?, ?, 'legacy_json', ?)",
+            [(e.get("title"), json.dumps(e.get("detected") or []), e.get("when") or now)
+             for e in entries[-LEARNED_HISTORY_MAX:] if isinstance(e, dict)],
+        )
+        conn.execute("INSERT INTO meta(key, value) VALUES('migrated', 1)")
+        _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    if phrases or entries:
+        log_event("learn", f"📥 Importate {len(phrases)} frasi e {len(entries)} rimozioni da modern_learned.json")
+
+
+# ============================================================
+# API
+# ============================================================
+
+def add_phrases(phrases, source="unknown"):
+    """Aggiunge frasi apprese (dedup). Ritorna quante sono nuove."""
+    phrases = [p for p in dict.fromkeys(str(p).strip() for p in phrases) if p]
+    if not phrases:
+        return 0
+
+    now = _now()
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            new = conn.executemany(
+                "INSERT OR IGNORE INTO phrases(phrase, source, added_at) VALUES(?, ?, ?)",
+                [(p, source, now) for p in phrases],
+            ).rowcount
+            if new:
+                _bump_version(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return new
+
+
+def record_removal(title, detected=None, item_hash=None, source="unknown"):
+    """Storico rimozioni (limitato a LEARNED_HISTORY_MAX righe)."""
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO removals(item_hash, title, detected, source, created_at) VALUES(?, ?, ?, ?, ?)",
+                (item_hash, title, json.dumps(detected or []), source, _now()),
+            )
+            # compattazione: una ogni 1000 inserimenti basta
+            if cur.lastrowid % 1000 == 0:
+                conn.execute("DELETE FROM removals WHERE id <= ?", (cur.lastrowid - LEARNED_HISTORY_MAX,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def get_version():
+    with _lock:
+        row = _connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    return row[0] if row else 0
+
+
+def load_phrases():
+    """(versione, set di frasi) letti nella stessa transazione."""
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            phrases = {r[0] for r in conn.execute("SELECT phrase FROM phrases")}
+        finally:
+            conn.execute("COMMIT")
+    return (row[0] if row else 0), phrases
+
+
+def stats():
+    with _lock:
+        conn = _connect()
+        return {
+            "version": (conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone() or [0])[0],
+            "phrases": conn.execute("SELECT COUNT(*) FROM phrases").fetchone()[0],
+            "removals": conn.execute("SELECT COUNT(*) FROM removals").fetchone()[0],
+            "path": LEARNED_DB_PATH,
+        }
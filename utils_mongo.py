@@ -0,0 +1,209 @@
+# utils_mongo.py
+# ============================================================
+# Connessione MongoDB condivisa RetroFuture (2025)
+#   • UN solo MongoClient per processo (pool interno pymongo)
+#   • Fork-safe: dopo fork (gunicorn) il figlio ricrea il client
+#   • Pool / timeout configurabili da ENV
+#   • Warm-up al boot + probe di salute
+#   • Client async (AsyncMongoClient) su un event loop dedicato
+#     per processo, per le route che lanciano query in parallelo
+# ============================================================
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+from pymongo import AsyncMongoClient, MongoClient
+from dotenv import load_dotenv
+
+from utils_log import log_event
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = "database_vintage"
+
+# Pool / timeout (ms)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+
+
+# ============================================================
+# Stato per-processo
+# ============================================================
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _client_options():
+    return dict(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        appname="retrofuture-search",
+    )
+
+
+def _build_client():
+    return MongoClient(MONGO_URI, **_client_options())
+
+
+def get_client():
+    """
+    Ritorna il MongoClient del processo corrente (creato al primo uso).
+    Se il PID è cambiato (fork senza hook) il client viene ricreato.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = _build_client()
+            _client_pid = pid
+        return _client
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+def get_collection(name):
+    return get_client()[DB_NAME][name]
+
+
+def close_client():
+    """Chiude il client del processo (shutdown / test)."""
+    global _client, _client_pid
+
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            try:
+                _client.close()
+            except Exception:
+                pass
+        _client = None
+        _client_pid = None
+
+
+def _reset_after_fork():
+    # Nel figlio: NON chiudere il client del padre (socket condivisi),
+    # basta dimenticarlo; verrà ricreato al primo get_client().
+    # Idem per loop async + client async (il thread del loop non esiste nel figlio).
+    global _client, _client_pid, _lock, _aloop, _aloop_pid, _aclient
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+    _aloop = _aloop_pid = _aclient = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ============================================================
+# Client async
+#   AsyncMongoClient è legato all'event loop su cui viene usato:
+#   un loop per processo in un thread daemon, le route sync gli
+#   passano coroutine con run_async() e aspettano il risultato.
+# ============================================================
+
+_aloop = None
+_aloop_pid = None
+_aclient = None
+
+
+def get_async_loop():
+    global _aloop, _aloop_pid, _aclient
+
+    pid = os.getpid()
+    if _aloop is not None and _aloop_pid == pid:
+        return _aloop
+
+    with _lock:
+        if _aloop is None or _aloop_pid != pid:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="mongo-async", daemon=True).start()
+            _aloop, _aloop_pid, _aclient = loop, pid, None
+        return _aloop
+
+
+def get_async_collection(name):
+    """Solo da coroutine in esecuzione sul loop di get_async_loop()."""
+    global _aclient
+
+    if _aclient is None:
+        _aclient = AsyncMongoClient(MONGO_URI, **_client_options())
+    return _aclient[DB_NAME][name]
+
+
+def run_async(coro, timeout=None):
+    """Esegue coro sul loop Mongo del processo e ne ritorna il risultato (bloccante)."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_async_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # la coroutine resterebbe a girare sul loop (query Mongo comprese)
+        future.cancel()
+        raise
+
+
+# ============================================================
+# Warm-up + health
+# ============================================================
+
+def warmup():
+    """
+    Apre il pool e risolve DNS/SRV + handshake al boot,
+    così la prima richiesta non paga il costo di connessione.
+    Non solleva mai: in caso di errore logga e ritorna False.
+    """
+    if not MONGO_URI:
+        log_event("mongo", "⚠️ MONGO_URI non impostato: warm-up saltato", "WARNING")
+        return False
+
+    try:
+        get_client().admin.command("ping")
+        log_event("mongo", f"✅ Warm-up MongoDB ok (pid {os.getpid()})")
+        return True
+    except Exception as e:
+        log_event("mongo", f"❌ Warm-up MongoDB fallito: {e}", "ERROR")
+        return False
+
+
+def health():
+    """
+    Probe di salute: ping al server + latenza.
+    Ritorna dict serializzabile JSON.
+    """
+    t0 = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        ok = True
+        err = None
+    except Exception as e:
+        ok = False
+        err = str(e)
+
+    out = {
+        "ok": ok,
+        "pid": os.getpid(),
+        "latency_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+    }
+    if err:
+        out["error"] = err
+    return out
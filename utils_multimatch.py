@@ -0,0 +1,134 @@
+# utils_multimatch.py
+# ============================================================
+# Matcher multi-pattern per le liste di termini
+#   • Liste etichettate -> {etichetta: {termini trovati}}
+#   • Stessa semantica di `term in text` (sottostringa, nessun \b)
+#   • Liste grandi (>= MULTIMATCH_MIN_TERMS, es. modern_learned):
+#     un solo automa Aho-Corasick in C (pyahocorasick), una scansione
+#     del testo per tutte -> costo ~ lunghezza testo, non n. termini
+#   • Liste piccole (le fisse): `in` come il vecchio codice, solo
+#     quando il chiamante chiede quell'etichetta, fermandosi al primo
+#     termine trovato. Sotto la soglia l'automa costa di più (ogni
+#     match risale nell'interprete): bench_classifier con 0 appresi
+# ============================================================
+
+import os
+from collections.abc import Mapping
+
+import ahocorasick
+
+# sotto questa dimensione una lista resta su `term in text` (misurato
+# con benchmarks/bench_classifier: l'automa conviene da ~100 termini)
+MULTIMATCH_MIN_TERMS = int(os.getenv("MULTIMATCH_MIN_TERMS", "100"))
+
+
+class MultiMatcher:
+    def __init__(self, groups=None, min_terms=None):
+        """
+        groups: {etichetta: iterabile di termini} (già normalizzati dal chiamante).
+        Immutabile dopo la costruzione: se le liste cambiano se ne crea uno nuovo.
+        """
+        min_terms = MULTIMATCH_MIN_TERMS if min_terms is None else min_terms
+
+        self.small = {}         # etichetta -> tuple di termini (ordine della lista)
+        self._always = set()    # etichette dell'automa con termine "" (`"" in t` è sempre True)
+        tags_by_term = {}       # termine -> etichette (un termine può stare in più liste)
+        self.terms = 0
+
+        for tag, terms in (groups or {}).items():
+            terms = tuple(dict.fromkeys(terms))
+            self.terms += len(terms)
+            if len(terms) < min_terms:
+                self.small[tag] = terms
+                continue
+            for term in terms:
+                if not term:
+                    self._always.add(tag)
+                    continue
+                tags_by_term.setdefault(term, []).append(tag)
+
+        self.large_tags = frozenset(
+            tag for tags in tags_by_term.values() for tag in tags
+        ) | self._always
+        self._automaton = None
+        if tags_by_term:
+            automaton = ahocorasick.Automaton()
+            for term, tags in tags_by_term.items():
+                automaton.add_word(term, (term, tuple(tags)))
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    def _scan_large(self, text):
+        hits = {tag: {""} for tag in self._always}
+        if self._automaton is None or not text:
+            return hits
+        for _, (term, tags) in self._automaton.iter(text):
+            for tag in tags:
+                found = hits.get(tag)
+                if found is None:
+                    hits[tag] = {term}
+                else:
+                    found.add(term)
+        return hits
+
+    def scan(self, text):
+        """{etichetta: set(termini trovati)} — solo etichette con almeno un match (calcolo pigro)."""
+        return Hits(self, text or "")
+
+
+class Hits(Mapping):
+    """
+    Risultato di MultiMatcher.scan: mapping etichetta -> termini trovati.
+    `tag in hits` su una lista piccola si ferma al primo termine trovato;
+    hits[tag] / iterazione calcolano (e ricordano) i set completi.
+    """
+
+    __slots__ = ("_matcher", "_text", "_large", "_sets", "_any")
+
+    def __init__(self, matcher, text):
+        self._matcher = matcher
+        self._text = text
+        self._large = None  # scansione dell'automa, alla prima etichetta grande
+        self._sets = {}     # etichetta piccola -> set trovati (solo se c'è un match)
+        self._any = {}      # etichetta -> bool (membership)
+
+    def _large_hits(self):
+        if self._large is None:
+            self._large = self._matcher._scan_large(self._text)
+        return self._large
+
+    def __contains__(self, tag):
+        hit = self._any.get(tag)
+        if hit is None:
+            terms = self._matcher.small.get(tag)
+            if terms is None:
+                hit = tag in self._matcher.large_tags and tag in self._large_hits()
+            else:
+                hit = False
+                text = self._text
+                for t in terms:
+                    if t in text:
+                        hit = True
+                        break
+            self._any[tag] = hit
+        return hit
+
+    def __getitem__(self, tag):
+        if tag not in self:
+            raise KeyError(tag)
+        if tag not in self._matcher.small:
+            return self._large_hits()[tag]
+        found = self._sets.get(tag)
+        if found is None:
+            text = self._text
+            found = self._sets[tag] = {t for t in self._matcher.small[tag] if t in text}
+        return found
+
+    def __iter__(self):
+        for tag in self._matcher.small:
+            if tag in self:
+                yield tag
+        yield from self._large_hits() if self._matcher.large_tags else ()
+
+    def __len__(self):
+        return sum(1 for _ in self)
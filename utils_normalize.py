@@ -17,13 +17,23 @@
 #############################################################
 
 import re
+import atexit
+import functools
 import hashlib
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from hashlib import sha1
 from datetime import datetime, UTC
 
+import utils_learned_store
+from utils_dates import iso_utc
+from utils_dedup import DEDUP_ENABLED, DEDUP_FILTER_PATH, DedupFilter
 from utils_log import log_event
+from utils_multimatch import MultiMatcher
+from utils_price import price_fields
 from utils_synonyms import expand_with_synonyms
 
 
@@ -40,8 +50,10 @@ def load_json(filename):
 
 def save_json(filename, data):
     path = os.path.join(os.path.dirname(__file__), filename)
-    with open(path, "w", encoding="utf-8") as f:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp, path)  # niente file troncati se il processo muore a metà
 
 
 #############################################################
@@ -54,24 +66,96 @@ vintage_memory = load_json("vintage_memory.json") or {
     "history": []
 }
 
-raw_ml = load_json("modern_learned.json")
-modern_learned = set(raw_ml if isinstance(raw_ml, list) else raw_ml.get("phrases", []))
+# Frasi moderne apprese: store SQLite condiviso (utils_learned_store).
+# Ricaricate (e automa ricompilato) solo quando cambia la versione.
+LEARNED_RELOAD_SECONDS = float(os.getenv("LEARNED_RELOAD_SECONDS", "10"))
 
-learn_queue = load_json("learn_queue.json") or {"candidates": []}
+try:
+    _learned_version, modern_learned = utils_learned_store.load_phrases()
+except Exception as e:
+    log_event("learn", f"❌ Store termini appresi non disponibile: {e}", "ERROR")
+    _learned_version, modern_learned = None, set()
+_learned_checked_at = time.monotonic()
+
+#############################################################
+# Learn queue (candidati da rivedere)
+#   • indice term -> candidato (membership O(1))
+#   • conteggio occorrenze + last_seen per termine
+#   • scrittura bufferizzata: ogni LEARN_QUEUE_FLUSH_EVERY
+#     modifiche / LEARN_QUEUE_FLUSH_SECONDS, a fine run, all'uscita
+#############################################################
+
+LEARN_QUEUE_FILE = "learn_queue.json"
+LEARN_QUEUE_FLUSH_EVERY = int(os.getenv("LEARN_QUEUE_FLUSH_EVERY", "5000"))
+LEARN_QUEUE_FLUSH_SECONDS = float(os.getenv("LEARN_QUEUE_FLUSH_SECONDS", "30"))
+
+
+class LearnQueue:
+    def __init__(self, filename=LEARN_QUEUE_FILE):
+        self.filename = filename
+        data = load_json(filename) or {}
+        self.candidates = data.get("candidates", [])   # ordine di prima apparizione
+        self._index = {c["term"]: c for c in self.candidates}
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self._flushed_at = time.monotonic()
+
+    def __contains__(self, term):
+        return term in self._index
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def add(self, term, context):
+        term = term.strip().lower()
+        if len(term) < 3:
+            return
+
+        now_iso = datetime.now(UTC).isoformat()
+        with self._lock:
+            c = self._index.get(term)
+            if c is None:
+                c = {
+                    "term": term,
+                    "context": context[:120],
+                    "added_at": now_iso,
+                    "count": 0,
+                }
+                self.candidates.append(c)
+                self._index[term] = c
+            c["count"] = c.get("count", 1) + 1
+            c["last_seen"] = now_iso
+            self._dirty += 1
+
+            due = (self._dirty >= LEARN_QUEUE_FLUSH_EVERY
+                   or time.monotonic() - self._flushed_at >= LEARN_QUEUE_FLUSH_SECONDS)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                save_json(self.filename, {"candidates": self.candidates})
+                self._dirty = 0
+            except Exception as e:
+                log_event("learn", f"❌ Salvataggio {self.filename} fallito: {e}", "ERROR")
+            self._flushed_at = time.monotonic()
+
+
+learn_queue = LearnQueue()
+atexit.register(learn_queue.flush)
+
+# Nei worker della pipeline parallela (utils_pipeline) i candidati NON
+# vengono scritti qui: finiscono in questa lista e li applica il padre.
+_learn_sink = None
 
 def add_to_learn_queue(term, context):
-    term = term.strip().lower()
-    if len(term) < 3:
+    if _learn_sink is not None:
+        _learn_sink.append((term, context))
         return
-    for c in learn_queue["candidates"]:
-        if c["term"] == term:
-            return
-    learn_queue["candidates"].append({
-        "term": term,
-        "context": context[:120],
-        "added_at": datetime.now(UTC).isoformat()
-    })
-    save_json("learn_queue.json", learn_queue)
+    learn_queue.add(term, context)
 
 blacklist = set(load_json("vintage_blacklist.json").get("words_block", []))
 
@@ -134,38 +218,77 @@ def detect_era(text):
 # VINTAGE CLASSIFIER
 #############################################################
 
-def classify_vintage_status(raw_text, expanded_text=None):
+# ❌ Bici moderne
+MODERN_BIKE_TERMS = [
+    "e-bike", "ebike", "bici elettrica",
+    "mountain bike", "mtb",
+    "shimano deore", "shimano xt", "shimano xtr",
+    "carbonio", "telaio carbonio",
+    "rockrider", "btwin",
+    "29\"", "29 pollici", "27.5"
+]
+
+# ❌ Modern auto/moto (modelli recenti specifici)
+MODERN_AUTO_TERMS = [
+    "golf 7", "golf mk7", "golf 8",
+    "audi a3", "audi a4", "bmw serie",
+    "mercedes classe", "tmax", "smart fortwo"
+]
+
+# ⭐ BOOST vintage core
+VINTAGE_CORE_TERMS = {
+    "polaroid", "polaroid sx-70", "polaroid 600",
+    "land camera", "atari", "amiga", "commodore",
+    "c64", "amiga 500", "game boy", "gameboy",
+    "nintendo nes", "super nintendo", "snes",
+    "sega megadrive", "mega drive", "sega saturn",
+    "walkman", "sony walkman", "vhs", "videoregistratore vhs"
+}
+
+# BOOST auto/bici vintage (oggetti vintage legati al mondo, non ricambi)
+VINTAGE_VEHICLE_TERMS = [
+    "fiat 500 f", "fiat 500 r", "maggiolino",
+    "vespa", "lambretta", "mini cooper classica"
+]
+
+VINTAGE_BIKE_TERMS = [
+    "graziella", "bianchi epoca", "bianchi vintage",
+    "atala vintage", "columbus", "tubazioni acciaio",
+    "anni 60", "anni 70", "anni 80", "anni 90",
+    "corsa vintage", "freni a bacchetta"
+]
+
+
+def classify_vintage_status(raw_text, expanded_text=None, raw_hits=None, text_hits=None):
+    """
+    raw_hits / text_hits: _matcher.scan() di raw_text / expanded_text già
+    calcolati dal chiamante (normalizza_annuncio), per non riscandire il testo.
+    """
     raw_text = raw_text or ""
     raw_low = raw_text.lower()
     text_low = (expanded_text or raw_text).lower()
 
+    if raw_hits is None:
+        refresh_learned()
+        raw_hits = _matcher.scan(raw_low)
+
     score = 0
     vclass = "vintage_generico"
 
     # ❌ Modern EXTENDED
-    for term in modern_ext_terms:
-        if term and term in raw_low:
-            return "non_vintage", -30
+    if "modern_ext" in raw_hits:
+        return "non_vintage", -30
 
     # ❌ Modern learned
-    for term in modern_learned:
-        if term and term in raw_low:
-            return "non_vintage", -20
+    if "modern_learned" in raw_hits:
+        return "non_vintage", -20
 
     # ❌ Recent years (2005–2025)
     if re.search(r"\b20(0[5-9]|1[0-9]|2[0-5])\b", raw_low):
         return "non_vintage", -15
 
     # ❌ Bici moderne
-    modern_bike_patterns = [
-        "e-bike", "ebike", "bici elettrica",
-        "mountain bike", "mtb",
-        "shimano deore", "shimano xt", "shimano xtr",
-        "carbonio", "telaio carbonio",
-        "rockrider", "btwin",
-        "29\"", "29 pollici", "27.5"
-    ]
-    if any(p in raw_low for p in modern_bike_patterns):
+    if "modern_bike" in raw_hits:
         return "non_vintage", -10
 
     # ❌ Modern tech/hard
@@ -180,51 +303,33 @@ def classify_vintage_status(raw_text, expanded_text=None):
             return "non_vintage", -10
 
     # ❌ Modern auto/moto (modelli recenti specifici)
-    modern_auto = [
-        "golf 7", "golf mk7", "golf 8",
-        "audi a3", "audi a4", "bmw serie",
-        "mercedes classe", "tmax", "smart fortwo"
-    ]
-    if any(m in raw_low for m in modern_auto):
+    if "modern_auto" in raw_hits:
         return "non_vintage", -10
 
+    if text_hits is None:
+        text_hits = raw_hits if text_low == raw_low else _matcher.scan(text_low)
+
     # ⭐ BOOST vintage core
-    vintage_core_terms = {
-        "polaroid", "polaroid sx-70", "polaroid 600",
-        "land camera", "atari", "amiga", "commodore",
-        "c64", "amiga 500", "game boy", "gameboy",
-        "nintendo nes", "super nintendo", "snes",
-        "sega megadrive", "mega drive", "sega saturn",
-        "walkman", "sony walkman", "vhs", "videoregistratore vhs"
-    }
-    if any(t in text_low for t in vintage_core_terms):
+    if "vintage_core" in text_hits:
         score += 3
         vclass = "vintage_originale"
 
     # ✔ Keywords vintage
-    if any(k in text_low for k in vintage_terms):
+    if "vintage" in text_hits:
         score += 3
         vclass = "vintage_originale"
 
     # Retro moderno (se ti servirà in futuro)
-    if any(k in text_low for k in retro_terms):
+    if "retro" in text_hits:
         score += 1
         vclass = "retro_moderno"
 
     # BOOST auto/bici vintage (oggetti vintage legati al mondo, non ricambi)
-    if any(v in text_low for v in [
-        "fiat 500 f", "fiat 500 r", "maggiolino",
-        "vespa", "lambretta", "mini cooper classica"
-    ]):
+    if "vintage_vehicle" in text_hits:
         score += 4
         vclass = "vintage_originale"
 
-    if any(b in text_low for b in [
-        "graziella", "bianchi epoca", "bianchi vintage",
-        "atala vintage", "columbus", "tubazioni acciaio",
-        "anni 60", "anni 70", "anni 80", "anni 90",
-        "corsa vintage", "freni a bacchetta"
-    ]):
+    if "vintage_bike" in text_hits:
         score += 4
         vclass = "vintage_originale"
 
@@ -244,14 +349,15 @@ def classify_vintage_status(raw_text, expanded_text=None):
 # Filtri aste
 #############################################################
 
+AUCTION_TERMS = [
+    "offerta corrente", "offerta attuale", "offerte",
+    "auction", "bid", "rilancio", "puntata"
+]
+
 def is_auction(text):
     if not text:
         return False
-    t = text.lower()
-    return any(k in t for k in [
-        "offerta corrente", "offerta attuale", "offerte",
-        "auction", "bid", "rilancio", "puntata"
-    ])
+    return "auction" in _matcher.scan(text.lower())
 
 
 #############################################################
@@ -276,29 +382,135 @@ VEHICLE_WORDS = [
     "motocicletta", "motorino"
 ]
 
-def is_ricambio_veicoli(text):
-    t = (text or "").lower()
+VEHICLE_SPARES_TERMS = ["ricambi auto", "ricambi moto", "ricambi scooter"]
 
-    has_vehicle = any(w in t for w in VEHICLE_WORDS)
-    has_part = any(p in t for p in VEHICLE_PART_TERMS)
+def is_ricambio_veicoli(text, hits=None):
+    """hits: _matcher.scan() del testo già calcolato (opzionale)."""
+    t = (text or "").lower()
+    if hits is None:
+        hits = _matcher.scan(t)
 
-    if has_part and has_vehicle:
+    if "vehicle_part" in hits and "vehicle" in hits:
+        # primo termine nell'ordine della lista (come il vecchio loop)
         for p in VEHICLE_PART_TERMS:
             if p in t:
                 return p
         return "ricambi_veicoli"
 
-    if "ricambi auto" in t or "ricambi moto" in t or "ricambi scooter" in t:
+    if "vehicle_spares" in hits:
         return "ricambi"
 
     return None
 
 
+#############################################################
+# Matcher multi-pattern (tutte le liste, una scansione)
+#############################################################
+
+_matcher = None
+
+def rebuild_matcher():
+    """Ricompila l'automa: da chiamare se cambiano le liste (es. modern_learned)."""
+    global _matcher
+    _matcher = MultiMatcher({
+        # testo grezzo
+        "modern_ext": {t for t in modern_ext_terms if t},
+        "modern_learned": {t for t in modern_learned if t},
+        "modern_bike": MODERN_BIKE_TERMS,
+        "modern_auto": MODERN_AUTO_TERMS,
+        "blacklist": {bad.lower() for bad in blacklist},
+        "auction": AUCTION_TERMS,
+        "vehicle": VEHICLE_WORDS,
+        "vehicle_part": VEHICLE_PART_TERMS,
+        "vehicle_spares": VEHICLE_SPARES_TERMS,
+        # testo espanso (sinonimi)
+        "vintage_core": VINTAGE_CORE_TERMS,
+        "vintage": vintage_terms,
+        "retro": retro_terms,
+        "vintage_vehicle": VINTAGE_VEHICLE_TERMS,
+        "vintage_bike": VINTAGE_BIKE_TERMS,
+        # categoria (normalize_category, fallback sul testo)
+        **{f"cat:{cat}": keys for cat, keys in CATEGORY_KEYWORDS},
+    })
+    return _matcher
+
+
+def refresh_learned(force=False):
+    """
+    Se lo store ha una versione nuova (rimozioni da /remove_item, altri worker)
+    ricarica modern_learned e ricompila l'automa. Controllo al massimo ogni
+    LEARNED_RELOAD_SECONDS: costa una SELECT su una riga.
+    """
+    global modern_learned, _learned_version, _learned_checked_at
+
+    now = time.monotonic()
+    if not force and now - _learned_checked_at < LEARNED_RELOAD_SECONDS:
+        return False
+    _learned_checked_at = now
+
+    try:
+        if utils_learned_store.get_version() == _learned_version:
+            return False
+        _learned_version, modern_learned = utils_learned_store.load_phrases()
+    except Exception as e:
+        log_event("learn", f"⚠️ Reload termini appresi fallito: {e}", "WARNING")
+        return False
+
+    rebuild_matcher()
+    log_event("learn", f"♻️ Termini appresi ricaricati: {len(modern_learned)} (v{_learned_version})")
+    return True
+
+
 #############################################################
 # Duplicati
 #############################################################
 
-_hash_cache = set()
+# Filtro dedup persistente tra i run (utils_dedup), caricato al primo uso.
+# DEDUP_ENABLED=0 -> solo in memoria, come il vecchio set per processo.
+_dedup = None
+
+# hash degli annunci saltati perché già noti al filtro (solo l'hash, niente
+# raw). salva_annunci_mongo aggiorna updated_at degli esistenti e fa
+# "dimenticare" al filtro quelli che in DB non ci sono (scrittura fallita in
+# un run precedente o falso positivo): ripassano alla prossima occorrenza.
+# Limitato a KNOWN_HASHES_MAX: chi normalizza senza mai salvare non cresce
+# all'infinito (oltre si scartano i più vecchi: niente touch di updated_at)
+KNOWN_HASHES_MAX = int(os.getenv("KNOWN_HASHES_MAX", "200000"))
+known_hashes = OrderedDict()
+
+def get_dedup():
+    global _dedup
+    if _dedup is None:
+        _dedup = DedupFilter(DEDUP_FILTER_PATH if DEDUP_ENABLED else None)
+        atexit.register(_dedup.save)
+    return _dedup
+
+def register_hash(hash_value):
+    """True se l'hash è nuovo (e lo registra), False se già visto."""
+    return get_dedup().add(hash_value)
+
+def is_known(raw, source_name):
+    """
+    Controllo dedup PRIMA della classificazione (costa un md5).
+    True -> annuncio già visto (in questo run o in DB): da saltare.
+    """
+    hash_value = hash_annuncio(raw, source_name)
+    if hash_value is None or not get_dedup().seen(hash_value):
+        return False
+    known_hashes[hash_value] = None
+    if len(known_hashes) > KNOWN_HASHES_MAX:
+        known_hashes.popitem(last=False)
+    return True
+
+def drain_known_hashes():
+    """Hash saltati dal filtro (uno per annuncio) dall'ultimo drain."""
+    known = list(known_hashes)
+    known_hashes.clear()
+    return known
+
+def forget_hashes(hashes):
+    """Hash noti al filtro ma assenti in DB: ripassano alla prossima occorrenza."""
+    get_dedup().forget(hashes)
 
 
 #############################################################
@@ -623,13 +835,39 @@ CATEGORY_ALIASES = {
     "miscellanea": "vario",
 }
 
-def normalize_category(raw_category: str, text_hint: str = "") -> str:
+# Fallback sul testo: prima categoria (in quest'ordine) con una parola chiave nel blob
+CATEGORY_KEYWORDS = [
+    ("tecnologia", ["tecn", "computer", "console", "audio", "hifi", "hi fi", "videog", "amiga", "commodore", "walkman", "vhs"]),
+    ("arredamento", ["arred", "mobili", "casa", "arredo", "lamp", "decor", "design", "tavolo", "sedia"]),
+    ("moda_accessori", ["abbigli", "scarpe", "bors", "access", "gioiell", "orolog", "jeans", "giacca", "cappotto", "camicia"]),
+    ("giochi_giocattoli", ["giocatt", "giochi", "lego", "playmobil", "modellin", "action figure", "barbie"]),
+    ("musica_cinema", ["vinile", "vinili", "cd", "dvd", "vhs", "cassetta", "cassett", "tape", "film", "colonna sonora", "soundtrack"]),
+    ("auto_moto", ["vespa", "lambretta", "auto", "moto", "scooter", "fiat 500", "maggiolino", "automobilia"]),
+    ("libri_fumetti", ["fumett", "libri", "rivist", "giornal", "manga", "topolino", "tex"]),
+    ("cucina", ["cucin", "servizio", "piatti", "posate", "pentola", "caffettiera", "moka", "bicchier", "tazze"]),
+    ("cartoleria", ["cartoler", "penna", "matita", "quaderno", "agenda", "diario", "grafica", "stampa"]),
+    ("collezionismo", ["collez", "figur", "poster", "cartolin", "francoboll", "monet", "banconot", "medagli", "militaria", "locandina", "manifesto"]),
+]
+
+# parole chiave che possono stare a cavallo di categoria + " " + testo
+_CATEGORY_KEY_MAXLEN = max(len(k) for _, keys in CATEGORY_KEYWORDS for k in keys)
+
+# "contiene" sugli alias: vince il PRIMO alias (ordine del dict) contenuto
+_ALIAS_RANK = {k: i for i, k in enumerate(CATEGORY_ALIASES) if k}
+_alias_matcher = MultiMatcher({"alias": _ALIAS_RANK})
+
+# categorie grezze distinte ricordate (i marketplace ripetono le stesse stringhe)
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", "4096"))
+
+rebuild_matcher()
+
+@functools.lru_cache(maxsize=CATEGORY_CACHE_SIZE)
+def _resolve_raw_category(raw_category):
     """
-    NON scarta annunci.
-    Se non riconosce la categoria -> 'vario'
+    Parte di normalize_category che dipende SOLO dalla categoria grezza:
+    (categoria pulita, risultato da alias o None, tag parole chiave in c).
     """
     c = (raw_category or "").strip().lower()
-    t = (text_hint or "").strip().lower()
 
     # normalizza separatori e spazi
     c = c.replace("-", " ").replace("_", " ")
@@ -637,38 +875,44 @@ def normalize_category(raw_category: str, text_hint: str = "") -> str:
     c = re.sub(r"\s+", " ", c).strip()
 
     if c in ALLOWED_CATEGORIES:
-        return c
+        return c, c, frozenset()
 
     if c in CATEGORY_ALIASES:
-        return CATEGORY_ALIASES[c]
+        return c, CATEGORY_ALIASES[c], frozenset()
 
     # match "contiene" per categorie composte (es. "tv e audio")
-    for k, v in CATEGORY_ALIASES.items():
-        if k and k in c:
-            return v
-
-    blob = f"{c} {t}".strip()
-
-    if any(k in blob for k in ["tecn", "computer", "console", "audio", "hifi", "hi fi", "videog", "amiga", "commodore", "walkman", "vhs"]):
-        return "tecnologia"
-    if any(k in blob for k in ["arred", "mobili", "casa", "arredo", "lamp", "decor", "design", "tavolo", "sedia"]):
-        return "arredamento"
-    if any(k in blob for k in ["abbigli", "scarpe", "bors", "access", "gioiell", "orolog", "jeans", "giacca", "cappotto", "camicia"]):
-        return "moda_accessori"
-    if any(k in blob for k in ["giocatt", "giochi", "lego", "playmobil", "modellin", "action figure", "barbie"]):
-        return "giochi_giocattoli"
-    if any(k in blob for k in ["vinile", "vinili", "cd", "dvd", "vhs", "cassetta", "cassett", "tape", "film", "colonna sonora", "soundtrack"]):
-        return "musica_cinema"
-    if any(k in blob for k in ["vespa", "lambretta", "auto", "moto", "scooter", "fiat 500", "maggiolino", "automobilia"]):
-        return "auto_moto"
-    if any(k in blob for k in ["fumett", "libri", "rivist", "giornal", "manga", "topolino", "tex"]):
-        return "libri_fumetti"
-    if any(k in blob for k in ["cucin", "servizio", "piatti", "posate", "pentola", "caffettiera", "moka", "bicchier", "tazze"]):
-        return "cucina"
-    if any(k in blob for k in ["cartoler", "penna", "matita", "quaderno", "agenda", "diario", "grafica", "stampa"]):
-        return "cartoleria"
-    if any(k in blob for k in ["collez", "figur", "poster", "cartolin", "francoboll", "monet", "banconot", "medagli", "militaria", "locandina", "manifesto"]):
-        return "collezionismo"
+    found = _alias_matcher.scan(c).get("alias")
+    if found:
+        return c, CATEGORY_ALIASES[min(found, key=_ALIAS_RANK.__getitem__)], frozenset()
+
+    return c, None, frozenset(_matcher.scan(c))
+
+
+def normalize_category(raw_category: str, text_hint: str = "", text_hits=None) -> str:
+    """
+    NON scarta annunci.
+    Se non riconosce la categoria -> 'vario'
+    text_hits: _matcher.scan(text_hint.lower()) già calcolato (opzionale).
+    """
+    c, resolved, c_tags = _resolve_raw_category(raw_category or "")
+    if resolved is not None:
+        return resolved
+
+    t = (text_hint or "").strip().lower()
+
+    # tag del blob "c t" = tag(c) ∪ tag(t) ∪ parole a cavallo della giunzione
+    # (scan pigri: ogni categoria si ferma alla prima parola trovata)
+    if text_hits is None:
+        text_hits = _matcher.scan(t)
+    junction = None
+    if c and t:
+        n = _CATEGORY_KEY_MAXLEN - 1
+        junction = _matcher.scan(f"{c[-n:]} {t[:n]}")
+
+    for cat, _ in CATEGORY_KEYWORDS:
+        tag = f"cat:{cat}"
+        if tag in c_tags or tag in text_hits or (junction is not None and tag in junction):
+            return cat
 
     return "vario"
 
@@ -677,7 +921,57 @@ def normalize_category(raw_category: str, text_hint: str = "") -> str:
 # NORMALIZZAZIONE
 #############################################################
 
+def _prezzo_legacy(prezzo_raw):
+    """Parse legacy del prezzo: resta SOLO per l'hash (non cambiare hash già in DB)."""
+    clean = re.sub(r"[^\d,\.]", "", prezzo_raw)
+
+    if "," in clean and "." in clean:
+        clean = clean.replace(".", "").replace(",", ".")
+    elif "," in clean:
+        clean = clean.replace(",", ".")
+
+    prezzo_val = None
+    try:
+        if clean:
+            prezzo_val = float(clean)
+            if prezzo_val < 0:
+                prezzo_val = None
+    except Exception:
+        prezzo_val = None
+    return prezzo_val
+
+
+def hash_annuncio(raw, source_name):
+    """
+    Hash dell'annuncio (identico a quello di normalizza_senza_dedup) senza
+    normalizzarlo. None se l'annuncio verrebbe scartato comunque (titolo / url).
+    """
+    title = (raw.get("title") or raw.get("titolo") or "").strip()
+    if not title or title.lower() in ("titolo non disponibile", "n/a", "none"):
+        return None
+    url = raw.get("url") or raw.get("link") or ""
+    if not url:
+        return None
+
+    prezzo_val = _prezzo_legacy(str(raw.get("price") or raw.get("prezzo") or "").strip())
+    pv_for_hash = "" if prezzo_val is None else f"{prezzo_val:.2f}"
+    return hashlib.md5(f"{source_name}-{title}-{pv_for_hash}-{url}".encode("utf-8")).hexdigest()
+
+
 def normalizza_annuncio(raw, source_name):
+    if is_known(raw, source_name):
+        return None
+    doc = normalizza_senza_dedup(raw, source_name)
+    if doc is None or not register_hash(doc["hash"]):
+        return None
+    return doc
+
+
+def normalizza_senza_dedup(raw, source_name):
+    """
+    Tutta la normalizzazione tranne il controllo duplicati (filtro dedup).
+    Lavoro solo CPU: è la parte che utils_pipeline esegue nei worker.
+    """
     title = (raw.get("title") or raw.get("titolo") or "").strip()
     description = raw.get("description") or raw.get("descrizione") or title
 
@@ -692,8 +986,12 @@ def normalizza_annuncio(raw, source_name):
     if not url:
         return None
 
+    # Una scansione del testo per blacklist / ricambi / moderni
+    refresh_learned()
+    raw_hits = _matcher.scan(full_text_raw)
+
     # BLACKLIST
-    if any(bad.lower() in full_text_raw for bad in blacklist):
+    if "blacklist" in raw_hits:
         return None
 
     # Aste
@@ -701,7 +999,7 @@ def normalizza_annuncio(raw, source_name):
         return None
 
     # ❌ Ricambi veicoli
-    term = is_ricambio_veicoli(full_text_raw)
+    term = is_ricambio_veicoli(full_text_raw, raw_hits)
     if term:
         log_event(source_name, f"❌ Ricambio VEICOLI scartato: \"{title}\" — trovato: \"{term}\"")
         return None
@@ -713,7 +1011,12 @@ def normalizza_annuncio(raw, source_name):
         full_text_expanded = full_text_raw
 
     # Vintage + era
-    vintage_class, score = classify_vintage_status(full_text_raw, full_text_expanded)
+    # testo espanso: una scansione per boost vintage + fallback categoria
+    if full_text_expanded == full_text_raw:
+        text_hits = raw_hits
+    else:
+        text_hits = _matcher.scan(full_text_expanded.lower())
+    vintage_class, score = classify_vintage_status(full_text_raw, full_text_expanded, raw_hits, text_hits)
     if vintage_class == "non_vintage" or score < 2:
         return None
 
@@ -721,28 +1024,19 @@ def normalizza_annuncio(raw, source_name):
 
     # Prezzo (se non valido -> None, così non inquina filtri/sort)
     prezzo_raw = str(raw.get("price") or raw.get("prezzo") or "").strip()
-    clean = re.sub(r"[^\d,\.]", "", prezzo_raw)
 
-    if "," in clean and "." in clean:
-        clean = clean.replace(".", "").replace(",", ".")
-    elif "," in clean:
-        clean = clean.replace(",", ".")
+    # ✅ price_num / price_sort canonici (parse robusto 99.999 / 120,50)
+    prices = price_fields(prezzo_raw)
 
-    prezzo_val = None
-    try:
-        if clean:
-            prezzo_val = float(clean)
-            if prezzo_val < 0:
-                prezzo_val = None
-    except Exception:
-        prezzo_val = None
+    # parse legacy: resta SOLO per l'hash (non cambiare hash già in DB)
+    prezzo_val = _prezzo_legacy(prezzo_raw)
 
     image = raw.get("image") or raw.get("img") or raw.get("immagine") or ""
     location = raw.get("location") or ""
 
     # ✅ Categoria normalizzata (MAI scarto per categoria) + hint testo
     category_raw = raw.get("category") or raw.get("categoria") or ""
-    category = normalize_category(category_raw, text_hint=full_text_expanded)
+    category = normalize_category(category_raw, text_hint=full_text_expanded, text_hits=text_hits)
 
     condition = raw.get("condition") or raw.get("condizione")
 
@@ -756,17 +1050,13 @@ def normalizza_annuncio(raw, source_name):
     pv_for_hash = "" if prezzo_val is None else f"{prezzo_val:.2f}"
     hash_value = hashlib.md5(f"{source_name}-{title}-{pv_for_hash}-{url}".encode("utf-8")).hexdigest()
 
-    if hash_value in _hash_cache:
-        return None
-    _hash_cache.add(hash_value)
-
-    now_iso = datetime.now(UTC).isoformat()
+    now_iso = iso_utc()
 
-    if prezzo_val is None:
+    if prices["price_num"] is None:
         price_value = None
         price_display = ""
     else:
-        price_value = f"{prezzo_val:.2f}"
+        price_value = f"{prices['price_num']:.2f}"
         price_display = f"{price_value} EUR"
 
     return {
@@ -775,6 +1065,8 @@ def normalizza_annuncio(raw, source_name):
         "title": title,
         "description": description,
         "price_value": price_value,
+        "price_num": prices["price_num"],
+        "price_sort": prices["price_sort"],
         "price_display": price_display,
         "price_currency": "EUR",
         "url": url,
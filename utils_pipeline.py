@@ -0,0 +1,149 @@
+# utils_pipeline.py
+# ============================================================
+# Pipeline ingest in streaming (scraper -> normalizza -> Mongo)
+#   • Input: qualsiasi iterabile di annunci grezzi (anche generatori)
+#   • normalizza_senza_dedup su un process pool, a chunk
+#   • Massimo NORMALIZE_MAX_INFLIGHT chunk in volo (memoria limitata)
+#   • Output in ordine di input, direttamente nel bulk writer
+#   • Annunci già noti (filtro dedup persistente) E duplicati dello
+#     stesso run (stesso hash già mandato ai worker, anche se ancora in
+#     volo) scartati nel padre PRIMA dei worker: ogni hash è normalizzato
+#     una volta sola. Vince la prima occorrenza anche se viene scartata
+#     dalla normalizzazione (stesso hash = stesso annuncio)
+#   • Default in-process (NORMALIZE_WORKERS=1): il pool è opt-in, da
+#     attivare solo dopo aver misurato il guadagno sulla macchina di
+#     ingest con benchmarks/bench_normalize (su 1 CPU è più lento)
+#   • Effetti collaterali SOLO nel processo padre:
+#       - filtro dedup (register_hash) -> vince la prima occorrenza
+#       - learn queue: i worker raccolgono i candidati, il padre
+#         li applica nell'ordine degli annunci (flush a fine run)
+# ============================================================
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import utils_normalize
+from utils_dedup import DEDUP_ENABLED
+from utils_log import log_event
+
+NORMALIZE_WORKERS = int(os.getenv("NORMALIZE_WORKERS", "1"))
+NORMALIZE_CHUNK = int(os.getenv("NORMALIZE_CHUNK", "200"))
+# chunk in volo (sottomessi ma non ancora consumati); 0 = 2 per worker
+NORMALIZE_MAX_INFLIGHT = int(os.getenv("NORMALIZE_MAX_INFLIGHT", "0"))
+
+
+# ============================================================
+# Lato worker
+# ============================================================
+
+def _normalizza_chunk(chunk, source_name):
+    """
+    Normalizza un chunk senza toccare il filtro dedup né learn_queue.json.
+    Ritorna (documenti o None, candidati learn queue).
+    """
+    utils_normalize._learn_sink = learned = []
+    docs = []
+    try:
+        for raw in chunk:
+            try:
+                docs.append(utils_normalize.normalizza_senza_dedup(raw, source_name))
+            except Exception as e:
+                log_event(source_name, f"❌ Errore normalizzazione: {e}", "ERROR")
+                docs.append(None)
+    finally:
+        utils_normalize._learn_sink = None
+    return docs, learned
+
+
+# ============================================================
+# Lato padre
+# ============================================================
+
+def _chunks(raw_items, size):
+    it = iter(raw_items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _fresh(raw_items, source_name):
+    """Annunci da normalizzare: né già noti al filtro né già mandati in questo run."""
+    dispatched = set()
+    for raw in raw_items:
+        hash_value = utils_normalize.hash_annuncio(raw, source_name)
+        if hash_value is not None:
+            # il duplicato in volo non è ancora nel filtro (register_hash
+            # arriva solo col risultato del chunk): lo ferma questo set
+            if hash_value in dispatched or utils_normalize.is_known(raw, source_name):
+                continue
+            dispatched.add(hash_value)
+        yield raw
+
+
+def _applica(result):
+    """Dedup + learn queue nel padre; genera i documenti accettati."""
+    docs, learned = result
+    for term, context in learned:
+        utils_normalize.add_to_learn_queue(term, context)
+    for doc in docs:
+        if doc is not None and utils_normalize.register_hash(doc["hash"]):
+            yield doc
+
+
+def normalizza_stream(raw_items, source_name, workers=None, chunk_size=None, max_inflight=None):
+    """
+    Generatore di annunci normalizzati (stesso risultato, nello stesso ordine,
+    di chiamare normalizza_annuncio su ogni elemento; i duplicati del run non
+    rientrano nella learn queue).
+    workers <= 1 -> tutto nel processo corrente (nessun pool).
+    """
+    workers = NORMALIZE_WORKERS if workers is None else workers
+    chunk_size = max(1, chunk_size or NORMALIZE_CHUNK)
+    max_inflight = max(1, max_inflight or NORMALIZE_MAX_INFLIGHT or 2 * max(1, workers))
+
+    fresh = _fresh(raw_items, source_name)
+
+    try:
+        if workers <= 1:
+            for chunk in _chunks(fresh, chunk_size):
+                yield from _applica(_normalizza_chunk(chunk, source_name))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            inflight = deque()
+            for chunk in _chunks(fresh, chunk_size):
+                inflight.append(pool.submit(_normalizza_chunk, chunk, source_name))
+                if len(inflight) >= max_inflight:
+                    yield from _applica(inflight.popleft().result())
+
+            while inflight:
+                yield from _applica(inflight.popleft().result())
+    finally:
+        # fine run: scrive i candidati ancora nel buffer + filtro dedup
+        utils_normalize.learn_queue.flush()
+        utils_normalize.get_dedup().save()
+
+
+def normalizza_e_salva(raw_items, source_name, workers=None, chunk_size=None, bulk_size=None):
+    """Scraper -> normalizzazione parallela -> bulk upsert, in streaming."""
+    # import locale: i worker (spawn) importano questo modulo, non serve Mongo lì
+    from utils_db import salva_annunci_mongo
+
+    dedup = utils_normalize.get_dedup()
+    if DEDUP_ENABLED and not dedup.loaded and not len(dedup):
+        # primo run su questa macchina: parte dagli hash già in DB
+        try:
+            dedup.seed_from_mongo()
+        except Exception as e:
+            log_event(source_name, f"⚠️ Seed filtro dedup fallito: {e}", "WARNING")
+
+    docs = normalizza_stream(raw_items, source_name, workers=workers, chunk_size=chunk_size)
+    result = salva_annunci_mongo(docs, source_name, bulk_size=bulk_size)
+
+    st = dedup.stats()
+    log_event(source_name, f"🧮 Dedup: {st['hits']}/{st['lookups']} già noti (hit rate {st['hit_rate']:.1%}), {st['items']} hash nel filtro")
+    return result
@@ -0,0 +1,80 @@
+# utils_price.py
+# ============================================================
+# Prezzi RetroFuture — parse unico (ingest + search + backfill)
+#   • price_num  : float canonico (None se mancante/invalido)
+#   • price_sort : price_num oppure PRICE_SORT_MISSING
+#                  (sort ASC indicizzato con "senza prezzo" in fondo)
+# ============================================================
+
+import re
+
+# sentinel per annunci senza prezzo (in fondo nel sort ASC)
+PRICE_SORT_MISSING = 999999999
+
+_THOUSANDS_DOT_RE = re.compile(r"^\d{1,3}(\.\d{3})+(\,\d+)?$")
+_THOUSANDS_COMMA_RE = re.compile(r"^\d{1,3}(,\d{3})+(\.\d+)?$")
+
+
+def parse_price(x):
+    """
+    Converte stringhe/num in float.
+    Supporta:
+      - 99.999      -> 99999
+      - 99.999,00   -> 99999.00
+      - 120,50      -> 120.50
+      - 120.50      -> 120.50
+      - 250         -> 250.0
+    """
+    if x is None:
+        return None
+
+    # già numero
+    if isinstance(x, (int, float)) and not isinstance(x, bool):
+        try:
+            return float(x)
+        except Exception:
+            return None
+
+    s = str(x).strip()
+    if not s:
+        return None
+
+    # tieni solo cifre e separatori
+    s = re.sub(r"[^\d\.,]", "", s)
+    if not s:
+        return None
+
+    # caso EU con punti migliaia (Subito): 99.999 o 99.999,00
+    if _THOUSANDS_DOT_RE.match(s):
+        s = s.replace(".", "")
+        s = s.replace(",", ".")
+    # caso US raro: 1,234.56
+    elif _THOUSANDS_COMMA_RE.match(s):
+        s = s.replace(",", "")
+    else:
+        # caso semplice: 120,50 -> 120.50
+        if "," in s and "." not in s:
+            s = s.replace(",", ".")
+        # se ci sono entrambi, assume "." migliaia e "," decimali
+        elif "," in s and "." in s:
+            s = s.replace(".", "").replace(",", ".")
+
+    try:
+        return float(s)
+    except Exception:
+        return None
+
+
+def price_fields(x):
+    """
+    Campi prezzo da persistere nel documento annuncio.
+    Negativi / invalidi -> None (non inquinano filtri e sort).
+    """
+    pn = parse_price(x)
+    if pn is not None and pn < 0:
+        pn = None
+
+    return {
+        "price_num": pn,
+        "price_sort": pn if pn is not None else PRICE_SORT_MISSING,
+    }
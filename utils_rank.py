@@ -0,0 +1,56 @@
+# utils_rank.py
+# ============================================================
+# Punteggio di ranking materializzato (sort "score" di /search)
+#   • rank_score   = vintage_score + bonus recency a gradini
+#   • era_weight   = 1 se l'era è nota, 0 per "vintage_generico"
+#   • rank_next_at = prossimo cambio di gradino (1/3/7/14 giorni da
+#     updated_at, o created_at); assente quando il bonus è già 0
+#
+# Il bonus cambia SOLO ai confini dei gradini: rank_scores.py
+# aggiorna i documenti con rank_next_at <= adesso, tutti gli altri
+# hanno già il valore giusto.
+# ============================================================
+
+from datetime import datetime, timedelta, timezone
+
+from utils_dates import parse_dt
+
+# (età massima in giorni, bonus) — stessi gradini del fuzzy fallback
+RECENCY_BUCKETS = [(1, 0.7), (3, 0.4), (7, 0.2), (14, 0.1)]
+RANK_FIELDS = ("rank_score", "era_weight", "rank_next_at")
+
+
+def recency_bucket(base_dt, now=None):
+    """(bonus, prossimo confine) per un annuncio con data base_dt."""
+    if base_dt is None:
+        return 0.0, None
+    now = now or datetime.now(timezone.utc)
+    for days, bonus in RECENCY_BUCKETS:
+        boundary = base_dt + timedelta(days=days)
+        if now < boundary:
+            return bonus, boundary
+    return 0.0, None
+
+
+def rank_fields(doc, now=None):
+    """Campi di ranking da salvare sul documento (vedi RANK_FIELDS)."""
+    base_dt = parse_dt(doc.get("updated_at")) or parse_dt(doc.get("created_at"))
+    bonus, next_at = recency_bucket(base_dt, now)
+    try:
+        vintage_score = float(doc.get("vintage_score") or 0)
+    except (TypeError, ValueError):
+        vintage_score = 0.0
+    return {
+        "rank_score": round(vintage_score + bonus, 6),
+        "era_weight": 1 if doc.get("era") != "vintage_generico" else 0,
+        "rank_next_at": next_at,
+    }
+
+
+def rank_update(doc, now=None):
+    """Update Mongo ($set / $unset) che porta doc ai campi di ranking attuali."""
+    fields = rank_fields(doc, now)
+    update = {"$set": {k: v for k, v in fields.items() if v is not None}}
+    if fields["rank_next_at"] is None:
+        update["$unset"] = {"rank_next_at": ""}
+    return update
@@ -0,0 +1,210 @@
+# utils_ratelimit.py
+# ============================================================
+# Rate limiter (cooldown per chiave) condiviso tra i worker
+#   • Backend SQLite WAL su file locale: tutti i worker gunicorn
+#     dello stesso host vedono gli stessi cooldown
+#   • Check + registrazione in UNO statement (atomico)
+#   • Eviction TTL (chiavi oltre il cooldown) + tetto massimo
+#     di entry per scope (via le più vecchie)
+#   • Fallback in memoria (OrderedDict) se SQLite non è usabile
+#   • stats() con entry e memoria / spazio su disco
+#
+# Uso:
+#   limiter = RateLimiter("noimage", cooldown_seconds=3600)
+#   if not limiter.allow(f"{ip}|{item_hash}"): -> throttled
+# ============================================================
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils_log import log_event
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RATELIMIT_DB_PATH = os.getenv("RATELIMIT_DB_PATH", os.path.join(BASE_DIR, "ratelimit.db"))
+RATELIMIT_MAX_ENTRIES = int(os.getenv("RATELIMIT_MAX_ENTRIES", "100000"))
+
+# pulizia (TTL + tetto) ogni N chiamate ad allow()
+RATELIMIT_SWEEP_EVERY = int(os.getenv("RATELIMIT_SWEEP_EVERY", "500"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratelimit (
+    scope   TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    last_at REAL NOT NULL,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ratelimit_scope_last ON ratelimit(scope, last_at);
+"""
+
+
+# ============================================================
+# Backend
+# ============================================================
+
+class SQLiteRateBackend:
+    def __init__(self, path=RATELIMIT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._connect()  # errori subito, così RateLimiter può ripiegare in memoria
+
+    def _connect(self):
+        # una connessione per processo (dopo il fork di gunicorn se ne apre una nuova)
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn, self._conn_pid = conn, os.getpid()
+        return conn
+
+    def hit(self, scope, key, now, cooldown):
+        """Registra key se il cooldown è scaduto. True = consentito."""
+        with self._lock:
+            cur = self._connect().execute(
+                "INSERT INTO ratelimit(scope, key, last_at) VALUES(?, ?, ?) "
+                "ON CONFLICT(scope, key) DO UPDATE SET last_at = excluded.last_at "
+                "WHERE ratelimit.last_at <= ?",
+                (scope, key, now, now - cooldown),
+            )
+            return cur.rowcount == 1
+
+    def sweep(self, scope, now, cooldown, max_entries):
+        with self._lock:
+            conn = self._connect()
+            expired = conn.execute(
+                "DELETE FROM ratelimit WHERE scope = ? AND last_at <= ?", (scope, now - cooldown)
+            ).rowcount
+            extra = conn.execute("SELECT COUNT(*) FROM ratelimit WHERE scope = ?", (scope,)).fetchone()[0] - max_entries
+            if extra > 0:
+                conn.execute(
+                    "DELETE FROM ratelimit WHERE scope = ? AND key IN ("
+                    "SELECT key FROM ratelimit WHERE scope = ? ORDER BY last_at LIMIT ?)",
+                    (scope, scope, extra),
+                )
+            return expired, max(0, extra)
+
+    def count(self, scope):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM ratelimit WHERE scope = ?", (scope,)).fetchone()[0]
+
+    def memory_bytes(self):
+        """Spazio occupato su disco (db + WAL), condiviso da tutti gli scope."""
+        total = 0
+        for p in (self.path, f"{self.path}-wal"):
+            if os.path.exists(p):
+                total += os.path.getsize(p)
+        return total
+
+
+class MemoryRateBackend:
+    """Solo per processo (fallback): stesso comportamento, non condiviso."""
+
+    def __init__(self):
+        self._data = {}  # scope -> OrderedDict(key -> last_at), in ordine di last_at
+        self._lock = threading.Lock()
+
+    def hit(self, scope, key, now, cooldown):
+        with self._lock:
+            entries = self._data.setdefault(scope, OrderedDict())
+            last = entries.get(key)
+            if last is not None and last > now - cooldown:
+                return False
+            entries[key] = now
+            entries.move_to_end(key)
+            return True
+
+    def sweep(self, scope, now, cooldown, max_entries):
+        with self._lock:
+            entries = self._data.get(scope, OrderedDict())
+            expired = 0
+            while entries and next(iter(entries.values())) <= now - cooldown:
+                entries.popitem(last=False)
+                expired += 1
+            extra = max(0, len(entries) - max_entries)
+            for _ in range(extra):
+                entries.popitem(last=False)
+            return expired, extra
+
+    def count(self, scope):
+        return len(self._data.get(scope, ()))
+
+    def memory_bytes(self):
+        # stima: chiave + float + overhead dict/OrderedDict per entry
+        return sum(sum(len(k) + 120 for k in entries) for entries in self._data.values())
+
+
+# ============================================================
+# Rate limiter
+# ============================================================
+
+class RateLimiter:
+    def __init__(self, scope, cooldown_seconds, max_entries=RATELIMIT_MAX_ENTRIES, backend=None):
+        self.scope = scope
+        self.cooldown = float(cooldown_seconds)
+        self.max_entries = max(1, int(max_entries))
+
+        if backend is None:
+            try:
+                backend = SQLiteRateBackend()
+            except Exception as e:
+                log_event("ratelimit", f"⚠️ SQLite non disponibile ({e}): rate limit solo per processo", "WARNING")
+                backend = MemoryRateBackend()
+        self.backend = backend
+
+        self._calls = 0
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+        self.errors = 0
+
+    def allow(self, key):
+        """True se la richiesta può passare (e avvia il cooldown per key)."""
+        now = time.time()
+        try:
+            ok = self.backend.hit(self.scope, key, now, self.cooldown)
+        except Exception as e:
+            # il rate limit non deve mai rompere l'endpoint
+            self.errors += 1
+            log_event("ratelimit", f"❌ Rate limit {self.scope} non disponibile: {e}", "ERROR")
+            return True
+
+        self._calls += 1
+        if ok:
+            self.allowed += 1
+        else:
+            self.throttled += 1
+
+        if self._calls % RATELIMIT_SWEEP_EVERY == 0:
+            self.sweep(now)
+        return ok
+
+    def sweep(self, now=None):
+        try:
+            expired, capped = self.backend.sweep(self.scope, now or time.time(), self.cooldown, self.max_entries)
+            self.evicted += expired + capped
+        except Exception as e:
+            log_event("ratelimit", f"⚠️ Pulizia rate limit {self.scope} fallita: {e}", "WARNING")
+
+    def stats(self):
+        try:
+            entries = self.backend.count(self.scope)
+            memory = self.backend.memory_bytes()
+        except Exception:
+            entries = memory = None
+        return {
+            "backend": type(self.backend).__name__,
+            "cooldown_seconds": self.cooldown,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "memory_kb": round(memory / 1024, 1) if memory is not None else None,
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "evicted": self.evicted,
+            "errors": self.errors,
+        }
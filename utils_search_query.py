@@ -0,0 +1,65 @@
+# utils_search_query.py
+# ============================================================
+# Forma delle query /search (niente Flask, niente Mongo)
+#   • SORT_SPECS / FUZZY_SPEC: sort keyset (devono coincidere
+#     con gli indici di utils_indexes.py)
+#   • Filtri di visibilità: annunci morti, soft-hide, non vintage
+#
+# Condiviso da app.py e da utils_indexes.py: la verifica dei piani
+# costruisce le stesse query senza importare l'app.
+# ============================================================
+
+# ============================================================
+# PAGINAZIONE KEYSET (devono coincidere con i $sort della pipeline)
+# ============================================================
+SEARCH_PER_PAGE = 50
+
+SORT_SPECS = {
+    # date come stringhe ISO UTC a larghezza fissa (utils_dates.iso_utc, legacy
+    # riallineati da backfill_dates.py): ordine lessicografico = cronologico
+    "tutti": [("created_at", -1), ("updated_at", -1), ("_id", -1)],
+    "date": [("updated_at", -1), ("_id", -1)],
+    "price_asc": [("price_sort", 1), ("updated_at", -1), ("_id", -1)],
+    "price_desc": [("price_num", -1), ("updated_at", -1), ("_id", -1)],
+    # rank_score / era_weight materializzati da rank_scores.py (utils_rank)
+    "score": [("rank_score", -1), ("era_weight", -1), ("updated_at", -1), ("_id", -1)],
+}
+FUZZY_SPEC = [("fuzzy_rank", -1), ("_id", -1)]
+
+# ============================================================
+# VISIBILITÀ
+# - Mercatinousato: se needs_check=True -> NASCONDI (soft-hide)
+# - Expired: NASCONDI solo se expired_reason=deadlink / noimage (prove)
+# ============================================================
+SOFT_HIDE_SOURCES = {"mercatinousato"}  # chiave normalizzata nel DB
+
+
+def live_match():
+    """
+    Annunci visibili: non rimossi, non morti (deadlink / noimage), non in
+    soft-hide. I due $nor stanno in un $and (in un dict unico il secondo
+    sovrascriverebbe il primo). Dict nuovo a ogni chiamata.
+    """
+    return {
+        "is_removed": {"$ne": True},
+        "$and": [
+            {"$nor": [
+                {"status": "expired", "expired_reason": "deadlink"},
+                {"status": "expired", "expired_reason": "noimage"},
+            ]},
+            {"$nor": [
+                {"source": {"$in": list(SOFT_HIDE_SOURCES)}, "needs_check": True},
+            ]},
+        ],
+    }
+
+
+def visible_match(scope=""):
+    """
+    Match base di /search, del fuzzy e dell'indice trigrammi (dict nuovo a
+    ogni chiamata: il chiamante ci aggiunge i filtri).
+    """
+    match = live_match()
+    if scope != "tutti":
+        match["vintage_class"] = {"$ne": "non_vintage"}
+    return match
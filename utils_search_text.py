@@ -0,0 +1,137 @@
+# utils_search_text.py
+# ============================================================
+# Retrieval testuale /search RetroFuture
+#   • TEXT (default): indice testo Mongo su title/description/keywords
+#     -> candidati dall'indice invertito (costo ~ postings, non collezione)
+#     -> il regex originale gira SOLO sui candidati (stessa precisione)
+#   • REGEX: vecchio $regex su tutta la collezione (fallback esplicito)
+#   • $text lavora a parole intere (stemming): "commodore" non trova
+#     "commodore64". Se TEXT rende meno di una pagina, /search rilancia
+#     la stessa pagina col REGEX (SEARCH_TEXT_REGEX_FALLBACK): le query
+#     comuni restano sull'indice, quelle rare non perdono i match interni
+#
+# Creazione indice (deploy):
+#   python utils_search_text.py
+# ============================================================
+
+import os
+import re
+
+from pymongo import TEXT
+from pymongo.errors import OperationFailure
+
+from utils_log import log_event
+
+SEARCH_TEXT_MODE = os.getenv("SEARCH_TEXT_MODE", "text").strip().lower()  # text | regex
+
+TEXT_INDEX_NAME = "annunci_text"
+TEXT_INDEX_KEYS = [("title", TEXT), ("description", TEXT), ("keywords", TEXT)]
+TEXT_INDEX_WEIGHTS = {"title": 10, "keywords": 5, "description": 2}
+
+# codici Mongo: IndexNotFound / "text index required for $text query"
+_TEXT_INDEX_MISSING_CODES = {27, 17007}
+
+SEARCH_TEXT_REGEX_FALLBACK = os.getenv("SEARCH_TEXT_REGEX_FALLBACK", "1") != "0"
+
+_text_available = SEARCH_TEXT_MODE == "text"
+
+
+def ensure_text_index(col):
+    col.create_index(
+        TEXT_INDEX_KEYS,
+        name=TEXT_INDEX_NAME,
+        weights=TEXT_INDEX_WEIGHTS,
+        default_language="italian",
+        language_override="text_language",  # evita conflitti col campo "language"
+    )
+
+
+def text_search_enabled():
+    return _text_available
+
+
+def is_text_index_missing(exc):
+    if not isinstance(exc, OperationFailure):
+        return False
+    if exc.code in _TEXT_INDEX_MISSING_CODES:
+        return True
+    return "text index required" in str(exc).lower()
+
+
+def disable_text_search(reason=""):
+    """Passa al fallback regex per il resto della vita del processo."""
+    global _text_available
+    if _text_available:
+        log_event("search", f"⚠️ Indice testo non disponibile, fallback regex: {reason}", "WARNING")
+    _text_available = False
+
+
+# ============================================================
+# Query builder
+# ============================================================
+
+def _clean_terms(query_terms, norm):
+    out = []
+    for t in query_terms:
+        nt = norm(t)
+        if not nt:
+            continue
+        if len(nt) < 2 and " " not in nt:
+            continue
+        out.append(nt)
+    return out
+
+
+def build_regex_match(query_terms, norm):
+    """
+    $or regex su title/description + $in su keywords (comportamento storico).
+    """
+    norm_terms = _clean_terms(query_terms, norm)
+    if not norm_terms:
+        return {}
+
+    regex = "|".join(re.escape(nt).replace(r"\ ", r"\s+") for nt in norm_terms)
+
+    return {
+        "$or": [
+            {"title": {"$regex": regex, "$options": "i"}},
+            {"description": {"$regex": regex, "$options": "i"}},
+            {"keywords": {"$in": norm_terms}},
+        ]
+    }
+
+
+def build_text_match(query_terms, norm):
+    """
+    $text in OR sulle parole:
+      - termini singoli -> la parola
+      - frasi (sinonimi multi-parola) -> SOLO la parola più lunga
+        (un doc che contiene la frase contiene anche quella parola,
+         e si evitano parole generiche tipo "anni" che allargano i postings)
+    """
+    words = []
+    seen = set()
+
+    for nt in _clean_terms(query_terms, norm):
+        parts = [p.strip("\"'-") for p in nt.split()]
+        parts = [p for p in parts if len(p) >= 2]
+        if not parts:
+            continue
+
+        picked = parts if len(parts) == 1 else [max(parts, key=len)]
+        for w in picked:
+            if w not in seen:
+                seen.add(w)
+                words.append(w)
+
+    if not words:
+        return {}
+
+    return {"$text": {"$search": " ".join(words), "$caseSensitive": False}}
+
+
+if __name__ == "__main__":
+    from utils_mongo import get_collection
+
+    ensure_text_index(get_collection("annunci"))
+    log_event("search", f"✅ Indice testo '{TEXT_INDEX_NAME}' pronto")
@@ -0,0 +1,332 @@
+# utils_trigram.py
+# ============================================================
+# Indice trigrammi (in memoria, per worker) per il fuzzy fallback
+#   • Titolo + prefisso description (TRIGRAM_DESC_CHARS) degli
+#     annunci LIVE -> trigrammi di caratteri
+#   • Candidati = top-N per overlap di trigrammi (tollera typo
+#     anche nei primi caratteri, niente $regex / collection scan)
+#   • Refresh incrementale da updated_at (thread in background)
+#   • Eviction da expired_at / removed_at: scadenze (deadlink,
+#     noimage) e rimozioni non toccano updated_at
+#   • Rebuild completo periodico (compatta slot morti / cancellati)
+#   • stats() con stima memoria
+# ============================================================
+
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+
+from utils_dates import iso_utc
+from utils_log import log_event
+
+TRIGRAM_ENABLED = os.getenv("TRIGRAM_ENABLED", "1") != "0"
+TRIGRAM_CANDIDATES = int(os.getenv("TRIGRAM_CANDIDATES", "500"))
+TRIGRAM_REFRESH_SECONDS = int(os.getenv("TRIGRAM_REFRESH_SECONDS", "60"))
+TRIGRAM_FULL_REBUILD_SECONDS = int(os.getenv("TRIGRAM_FULL_REBUILD_SECONDS", "21600"))
+TRIGRAM_BATCH = 5000
+
+# trigrammi presenti in più di questa frazione di titoli = rumore (" la", "ta ")
+TRIGRAM_MAX_DF = float(os.getenv("TRIGRAM_MAX_DF", "0.2"))
+
+# il vecchio fallback ($regex) cercava anche nella description e il fuzzy la
+# punteggia: se ne indicizza solo l'inizio (~1 trigramma per carattere; con 100
+# e titoli da ~50 caratteri la memoria è ~1.7x del solo titolo). Un match oltre
+# il prefisso non diventa candidato. 0 = solo titolo
+TRIGRAM_DESC_CHARS = int(os.getenv("TRIGRAM_DESC_CHARS", "100"))
+
+# margine sul timbro di inizio build: scadenze scritte mentre il build legge
+TRIGRAM_STATUS_SLACK = timedelta(seconds=60)
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-zàèéìòù]+")
+
+_PROJECTION = {"title": 1, "era": 1, "category": 1, "source": 1, "updated_at": 1}
+
+
+def trigrams(text):
+    t = _NON_ALNUM_RE.sub(" ", (text or "").lower()).strip()
+    if not t:
+        return set()
+    t = f"  {t} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self, collection_fn, live_filter, desc_projection=None):
+        """
+        collection_fn:   callable -> collection annunci (pool condiviso)
+        live_filter:     match Mongo degli annunci visibili nel fuzzy
+        desc_projection: proiezione del prefisso description (None = solo titolo)
+        """
+        self.collection_fn = collection_fn
+        self.live_filter = live_filter
+        self.desc_projection = desc_projection
+        self._projection = dict(_PROJECTION)
+        if desc_projection is not None:
+            self._projection["description"] = desc_projection
+
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._reset()
+
+        self.built_at = 0.0
+        self.refreshed_at = 0.0
+        self.watermark = None  # max updated_at visto
+        self.status_watermark = None  # max expired_at / removed_at visto
+
+    def _reset(self):
+        self._postings = {}      # trigramma -> array('I') di slot
+        self._slot_of = {}       # _id -> slot
+        self._ids = []           # slot -> _id (None = morto)
+        self._meta = []          # slot -> (era, category, source)
+        self._live = 0
+
+    # --------------------------------------------------------
+    # Mutazioni (sotto lock)
+    # --------------------------------------------------------
+    def _remove(self, _id):
+        slot = self._slot_of.pop(_id, None)
+        if slot is not None:
+            self._ids[slot] = None
+            self._meta[slot] = None
+            self._live -= 1
+
+    def _add(self, doc):
+        # titolo cambiato / aggiornato -> nuovo slot, il vecchio diventa morto
+        self._remove(doc["_id"])
+
+        slot = len(self._ids)
+        self._ids.append(doc["_id"])
+        self._meta.append((doc.get("era"), doc.get("category"), doc.get("source")))
+        self._slot_of[doc["_id"]] = slot
+        self._live += 1
+
+        text = doc.get("title") or ""
+        desc = doc.get("description")
+        if self.desc_projection is not None and isinstance(desc, str):
+            text = f"{text} {desc[:TRIGRAM_DESC_CHARS]}"
+        for tg in trigrams(text):
+            arr = self._postings.get(tg)
+            if arr is None:
+                arr = self._postings[tg] = array("I")
+            arr.append(slot)
+
+    def _track_watermark(self, doc):
+        ua = doc.get("updated_at")
+        if isinstance(ua, str) and (self.watermark is None or ua > self.watermark):
+            self.watermark = ua
+
+    def _track_status_watermark(self, doc):
+        for field in ("expired_at", "removed_at"):
+            ts = doc.get(field)
+            if isinstance(ts, str) and ts > self.status_watermark:
+                self.status_watermark = ts
+
+    # --------------------------------------------------------
+    # Build / refresh
+    # --------------------------------------------------------
+    def build(self):
+        """Rebuild completo (nuove strutture, swap atomico)."""
+        t0 = time.perf_counter()
+        status_since = iso_utc(datetime.now(UTC) - TRIGRAM_STATUS_SLACK)
+        fresh = TrigramIndex(self.collection_fn, self.live_filter, self.desc_projection)
+
+        for doc in self.collection_fn().find(self.live_filter, self._projection):
+            fresh._add(doc)
+            fresh._track_watermark(doc)
+
+        with self._lock:
+            self._postings = fresh._postings
+            self._slot_of = fresh._slot_of
+            self._ids = fresh._ids
+            self._meta = fresh._meta
+            self._live = fresh._live
+            self.watermark = fresh.watermark
+            self.status_watermark = status_since
+            self.built_at = self.refreshed_at = time.time()
+
+        log_event("trigram", f"✅ Indice trigrammi: {self._live} annunci in {time.perf_counter() - t0:.1f}s")
+
+    def refresh(self):
+        """Applica solo gli annunci con updated_at > watermark, poi le scadenze / rimozioni."""
+        if self.watermark is None or self.status_watermark is None:
+            return self.build()
+
+        col = self.collection_fn()
+        changed = 0
+        while True:
+            batch = list(
+                col.find({"updated_at": {"$gt": self.watermark}}, self._projection)
+                .sort("updated_at", 1)
+                .limit(TRIGRAM_BATCH)
+            )
+            if not batch:
+                break
+
+            # ancora visibile? (rimossi / scaduti / non_vintage -> fuori dall'indice)
+            live_ids = {d["_id"] for d in col.find(
+                {"_id": {"$in": [d["_id"] for d in batch]}, **self.live_filter}, {"_id": 1}
+            )}
+
+            with self._lock:
+                for doc in batch:
+                    if doc["_id"] in live_ids:
+                        self._add(doc)
+                    else:
+                        self._remove(doc["_id"])
+                    self._track_watermark(doc)
+            changed += len(batch)
+
+            if len(batch) < TRIGRAM_BATCH:
+                break
+
+        evicted = self._evict_dead(col)
+
+        self.refreshed_at = time.time()
+        if changed or evicted:
+            log_event("trigram", f"♻️ Indice trigrammi: {changed} annunci aggiornati, {evicted} usciti")
+
+    def _evict_dead(self, col):
+        """
+        Annunci scaduti / rimossi dopo status_watermark. Chi scade o rimuove
+        (report_noimage, mark_as_removed, controllo deadlink) timbra
+        expired_at / removed_at: sono l'unico segnale, updated_at non cambia.
+        """
+        since = self.status_watermark
+        changed = list(col.find(
+            {"$or": [{"expired_at": {"$gt": since}}, {"removed_at": {"$gt": since}}]},
+            {"_id": 1, "expired_at": 1, "removed_at": 1},
+        ))
+        if not changed:
+            return 0
+
+        # un annuncio scaduto ma non nascosto (es. expired_reason diverso) resta
+        live_ids = {d["_id"] for d in col.find(
+            {"_id": {"$in": [d["_id"] for d in changed]}, **self.live_filter}, {"_id": 1}
+        )}
+
+        evicted = 0
+        with self._lock:
+            for doc in changed:
+                if doc["_id"] not in live_ids and doc["_id"] in self._slot_of:
+                    self._remove(doc["_id"])
+                    evicted += 1
+                self._track_status_watermark(doc)
+        return evicted
+
+    def _background(self, full):
+        try:
+            self.build() if full else self.refresh()
+        except Exception as e:
+            log_event("trigram", f"❌ Refresh indice trigrammi fallito: {e}", "ERROR")
+            self.refreshed_at = time.time()  # riprova al prossimo giro, non a ogni richiesta
+        finally:
+            self._refreshing = False
+
+    def ensure_fresh(self):
+        """Avvia (senza bloccare) build / refresh se serve."""
+        now = time.time()
+        if self._refreshing:
+            return
+        if self.built_at:
+            full = now - self.built_at > TRIGRAM_FULL_REBUILD_SECONDS
+            if not full and now - self.refreshed_at < TRIGRAM_REFRESH_SECONDS:
+                return
+        else:
+            full = True
+            # primo build fallito di recente -> non ritentare a ogni richiesta
+            if self.refreshed_at and now - self.refreshed_at < TRIGRAM_REFRESH_SECONDS:
+                return
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background, args=(full,), daemon=True).start()
+
+    def ready(self):
+        return bool(self.built_at)
+
+    # --------------------------------------------------------
+    # Query
+    # --------------------------------------------------------
+    def candidates(self, query, era=None, category=None, source=None, limit=TRIGRAM_CANDIDATES):
+        """
+        Top `limit` _id per overlap di trigrammi con titolo + prefisso description.
+        None se l'indice non è ancora pronto (il chiamante usa il fallback).
+        """
+        self.ensure_fresh()
+        if not self.ready():
+            return None
+
+        q_tris = trigrams(query)
+        if not q_tris:
+            return []
+
+        with self._lock:
+            max_df = max(1, int(self._live * TRIGRAM_MAX_DF))
+            lists = [self._postings[tg] for tg in q_tris if tg in self._postings]
+            selective = [arr for arr in lists if len(arr) <= max_df]
+
+            counts = Counter()
+            for arr in (selective or lists):
+                counts.update(arr)
+
+            out = []
+            for slot, _ in counts.most_common():
+                meta = self._meta[slot]
+                if meta is None:
+                    continue
+                if era and meta[0] != era:
+                    continue
+                if category and meta[1] != category:
+                    continue
+                if source and meta[2] != source:
+                    continue
+                out.append(self._ids[slot])
+                if len(out) >= limit:
+                    break
+            return out
+
+    def token_df(self, token):
+        """
+        Limite superiore degli annunci che contengono token (minimo delle
+        posting list dei suoi trigrammi interni). 0 = trigramma mai visto
+        (typo / parola rara). None se token < 3 caratteri o indice non pronto.
+        """
+        t = _NON_ALNUM_RE.sub("", (token or "").lower())
+        if len(t) < 3 or not self.ready():
+            return None
+        with self._lock:
+            return min(len(self._postings.get(t[i:i + 3], ())) for i in range(len(t) - 2))
+
+    # --------------------------------------------------------
+    # Stats
+    # --------------------------------------------------------
+    def memory_bytes(self):
+        with self._lock:
+            total = sys.getsizeof(self._postings) + sys.getsizeof(self._slot_of)
+            total += sys.getsizeof(self._ids) + sys.getsizeof(self._meta)
+            for tg, arr in self._postings.items():
+                total += sys.getsizeof(tg) + sys.getsizeof(arr)
+            for _id in self._slot_of:
+                total += sys.getsizeof(_id) + 28  # + int slot
+            total += sum(sys.getsizeof(m) for m in self._meta if m is not None)
+            return total
+
+    def stats(self):
+        return {
+            "ready": self.ready(),
+            "live_titles": self._live,
+            "slots": len(self._ids),
+            "trigrams": len(self._postings),
+            "memory_mb": round(self.memory_bytes() / 1_048_576, 2),
+            "watermark": self.watermark,
+            "status_watermark": self.status_watermark,
+            "built_at": self.built_at,
+            "refreshed_at": self.refreshed_at,
+        }